@@ -1,45 +1,70 @@
 """Обертка LangChain агента для A2A протокола."""
-import asyncio
 import logging
-from typing import Dict, Any, AsyncGenerator
+import os
+import time
+from typing import Dict, Any, AsyncGenerator, Optional
 from langchain.agents import AgentExecutor
 
+from history import HistoryManager
+from review import ReviewPipeline, ReviewRequest
+from session_store import InMemorySessionStore, SessionStore
+from tool_results import session_scope
+
 logger = logging.getLogger(__name__)
 
 
 class LangChainA2AWrapper:
     """Обертка для преобразования LangChain агента в A2A-совместимый интерфейс."""
     
-    def __init__(self, agent_executor: AgentExecutor):
+    def __init__(
+        self,
+        agent_executor: AgentExecutor,
+        session_store: Optional[SessionStore] = None,
+        history_manager: Optional[HistoryManager] = None,
+        stream_flush_chars: Optional[int] = None,
+        stream_flush_interval: Optional[float] = None,
+        review_pipeline: Optional[ReviewPipeline] = None,
+    ):
         self.agent_executor = agent_executor
-        self.sessions: Dict[str, list] = {}  # Хранение истории сессий
-    
-    def _get_session_history(self, session_id: str) -> list:
-        """Получает историю сессии."""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        return self.sessions[session_id]
+        # Хранение истории сессий (по умолчанию в памяти, с LRU/TTL вытеснением)
+        self.sessions: SessionStore = session_store or InMemorySessionStore.from_env()
+        # Окно истории по бюджету токенов (+ фоновое сжатие, если задан summarizer)
+        self.history = history_manager or HistoryManager.from_env(self.sessions)
+        # Склейка токенов при стриминге: не отправляем событие на каждый токен
+        self.stream_flush_chars = stream_flush_chars or int(os.getenv("STREAM_FLUSH_CHARS", 200))
+        self.stream_flush_interval = (
+            stream_flush_interval
+            if stream_flush_interval is not None
+            else float(os.getenv("STREAM_FLUSH_INTERVAL", 0.3))
+        )
+        # Ревью MR идёт отдельным map-reduce пайплайном, а не одним ходом агента
+        self.review = review_pipeline
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика обертки для мониторинга."""
+        return {
+            "sessions": self.sessions.stats(),
+            "history": self.history.stats(),
+            "review": self.review.stats() if self.review else None,
+        }
     
     async def invoke(self, query: str, session_id: str) -> Dict[str, Any]:
         """Выполняет запрос к агенту и возвращает результат."""
         try:
             # Получаем историю сессии
-            chat_history = self._get_session_history(session_id)
+            chat_history = await self.history.build(session_id)
             print(f'CHAT_HISTORY: {chat_history}')
             
-            # Выполняем агента в отдельном потоке, чтобы не блокировать event loop
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: self.agent_executor.invoke({
+            # Выполняем агента асинхронно: инструменты MCP работают в текущем event loop
+            with session_scope(session_id):
+                result = await self.agent_executor.ainvoke({
                     "input": query,
                     "chat_history": chat_history
                 })
-            )
             
             # Обновляем историю
-            chat_history.append(("human", query))
-            chat_history.append(("assistant", result.get("output", "")))
+            await self.sessions.append_turn(session_id, query, result.get("output", ""))
+            self.history.schedule_compaction(session_id)
             
             return {
                 "is_task_complete": True,
@@ -58,87 +83,129 @@ class LangChainA2AWrapper:
                 "is_event": False
             }
     
+    @staticmethod
+    def _item(content: str, *, complete: bool = False, error: bool = False, event: bool = False) -> Dict[str, Any]:
+        return {
+            "is_task_complete": complete,
+            "require_user_input": False,
+            "content": content,
+            "is_error": error,
+            "is_event": event,
+        }
+
     async def stream(self, query: str, session_id: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """Потоковое выполнение запроса к агенту."""
+        """
+        Потоковое выполнение запроса к агенту.
+
+        Токены LLM приходят через astream_events и отдаются частями (is_task_complete=False):
+        дельты копятся в буфере и отправляются, когда набралось stream_flush_chars символов
+        или прошло stream_flush_interval секунд. Вызовы инструментов отдаются событиями
+        (is_event=True). Финальный элемент содержит полный ответ агента.
+        Запросы на ревью MR обрабатывает review_pipeline, если он задан.
+        """
+        request = self.review.match(query) if self.review else None
+        if request is not None:
+            try:
+                details = await self.review.fetch_changes(request, session_id)
+            except Exception as e:
+                # Diff получить не удалось — пусть разбирается агент со своими инструментами
+                logger.warning(f"Review pipeline unavailable for {request}, falling back to agent: {e}")
+            else:
+                async for item in self._stream_review(query, session_id, request, details):
+                    yield item
+                return
+
         try:
             # Получаем историю сессии
-            chat_history = self._get_session_history(session_id)
-            print(f'CHAT_HISTORY111(STREAM): {chat_history}')
-            
-            # Для streaming используем astream
-            loop = asyncio.get_event_loop()
-            
-            # Собираем части ответа
+            chat_history = await self.history.build(session_id)
+            logger.debug(f"Chat history for {session_id}: {len(chat_history)} messages")
+
             full_response = ""
-            sent_any_content = False  # Отслеживаем, отправляли ли мы контент
-
-            # LangChain AgentExecutor поддерживает astream
-            async for chunk in self.agent_executor.astream({
-                "input": query,
-                "chat_history": chat_history
-            }):
-                logger.debug(f"Received chunk: {chunk.keys() if isinstance(chunk, dict) else type(chunk)}")
-
-                # Извлекаем текст из чанков
-                if "output" in chunk:
-                    output = chunk["output"]
-                    if output and output != full_response:
-                        new_part = output[len(full_response):]
-                        full_response = output
-
-                        logger.info(f"Yielding content chunk: length={len(new_part)}")
-                        yield {
-                            "is_task_complete": False,
-                            "require_user_input": False,
-                            "content": new_part,
-                            "is_error": False,
-                            "is_event": False
-                        }
-                        sent_any_content = True
-
-                # Можем отправлять промежуточные события о вызове инструментов
-                if "intermediate_steps" in chunk:
-                    for step in chunk["intermediate_steps"]:
-                        if step:
-                            tool_name = step[0].tool if hasattr(step[0], 'tool') else "tool"
-                            yield {
-                                "is_task_complete": False,
-                                "require_user_input": False,
-                                "content": f"Использую инструмент: {tool_name}\n",
-                                "is_error": False,
-                                "is_event": True
-                            }
+            buffer = ""
+            last_flush = time.monotonic()
+
+            with session_scope(session_id):
+                async for event in self.agent_executor.astream_events(
+                    {"input": query, "chat_history": chat_history},
+                    version="v2",
+                ):
+                    kind = event["event"]
+
+                    if kind == "on_chat_model_stream":
+                        chunk = event["data"].get("chunk")
+                        delta = chunk.content if chunk is not None else ""
+                        if not isinstance(delta, str) or not delta:
+                            continue
+                        buffer += delta
+                        now = time.monotonic()
+                        if len(buffer) >= self.stream_flush_chars or now - last_flush >= self.stream_flush_interval:
+                            yield self._item(buffer)
+                            buffer = ""
+                            last_flush = now
+
+                    elif kind in ("on_tool_start", "on_tool_end"):
+                        # Перед событием инструмента отдаём накопленный текст, чтобы сохранить порядок
+                        if buffer:
+                            yield self._item(buffer)
+                            buffer = ""
+                            last_flush = time.monotonic()
+                        tool_name = event.get("name", "tool")
+                        if kind == "on_tool_start":
+                            yield self._item(f"Использую инструмент: {tool_name}\n", event=True)
+                        else:
+                            yield self._item(f"Инструмент {tool_name} выполнен\n", event=True)
+
+                    elif kind == "on_chain_end" and not event.get("parent_ids"):
+                        # Завершение корневого AgentExecutor: авторитетный полный ответ
+                        output = event["data"].get("output") or {}
+                        if isinstance(output, dict):
+                            full_response = output.get("output", "") or ""
+
+            if buffer:
+                yield self._item(buffer)
 
             # Обновляем историю
-            chat_history.append(("human", query))
-            chat_history.append(("assistant", full_response))
-
-            # Финальный чанк
-            # Если ничего не отправили, отправляем полный ответ; иначе пустую строку
-            final_content = "" if sent_any_content else full_response
-            logger.info(
-                f"Sending final chunk: sent_any_content={sent_any_content}, "
-                f"final_content_length={len(final_content)}, "
-                f"full_response_length={len(full_response)}"
-            )
-            yield {
-                "is_task_complete": True,
-                "require_user_input": False,
-                "content": final_content,
-                "is_error": False,
-                "is_event": False
-            }
-            
+            await self.sessions.append_turn(session_id, query, full_response)
+            self.history.schedule_compaction(session_id)
+
+            logger.info(f"Sending final chunk: full_response_length={len(full_response)}")
+            yield self._item(full_response, complete=True)
+
         except Exception as e:
             logger.error(f"Error in stream: {e}", exc_info=True)
-            yield {
-                "is_task_complete": True,
-                "require_user_input": False,
-                "content": f"Ошибка: {str(e)}",
-                "is_error": True,
-                "is_event": False
-            }
-    
+            yield self._item(f"Ошибка: {str(e)}", complete=True, error=True)
+
+    async def _stream_review(
+        self, query: str, session_id: str, request: ReviewRequest, details: dict
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Отдаёт прогресс ревью событиями, отчёт — частями и финальным элементом."""
+        try:
+            buffer = ""
+            last_flush = time.monotonic()
+            report = ""
+            async for update in self.review.review(request, details):
+                if update.kind == "progress":
+                    yield self._item(update.text, event=True)
+                elif update.kind == "delta":
+                    buffer += update.text
+                    now = time.monotonic()
+                    if len(buffer) >= self.stream_flush_chars or now - last_flush >= self.stream_flush_interval:
+                        yield self._item(buffer)
+                        buffer = ""
+                        last_flush = now
+                else:
+                    report = update.text
+            if buffer:
+                yield self._item(buffer)
+
+            await self.sessions.append_turn(session_id, query, report)
+            self.history.schedule_compaction(session_id)
+            yield self._item(report, complete=True)
+
+        except Exception as e:
+            logger.error(f"Error in review stream: {e}", exc_info=True)
+            yield self._item(f"Ошибка: {str(e)}", complete=True, error=True)
+
     # Для совместимости с A2A
     SUPPORTED_CONTENT_TYPES = ["text", "text/plain"]
 
@@ -1,26 +1,89 @@
 import asyncio
 import logging
 import os
-from typing import List, Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from weakref import WeakKeyDictionary
 
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.tools import StructuredTool, Tool
+from langchain_core.tools import BaseTool, StructuredTool, Tool
 from langchain_openai import ChatOpenAI
-from pydantic import Field, create_model
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun
+from pydantic import Field, PrivateAttr, create_model
 
 from mcp_client import MCPClient
+from tool_cache import ToolSchemaCache
+from tool_results import ToolResultPager
 
 logger = logging.getLogger(__name__)
 
 
-def create_langchain_tool_from_mcp(mcp_client: MCPClient, mcp_tool: dict) -> Tool:
-    """Создает LangChain Tool из описания MCP инструмента."""
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor, который выполняет tool calls одного шага LLM параллельно.
+
+    Асинхронный путь AgentExecutor запускает все действия шага через asyncio.gather
+    и сохраняет порядок наблюдений в порядке tool calls модели. Здесь добавляется
+    ограничение на число одновременных вызовов инструментов в рамках одного запроса.
+    """
+
+    max_concurrent_tool_calls: int = 4
+    # Семафор на каждый запуск агента; запись исчезает вместе с run_manager
+    _run_semaphores: WeakKeyDictionary = PrivateAttr(default_factory=WeakKeyDictionary)
+
+    def _get_run_semaphore(self, run_manager: AsyncCallbackManagerForChainRun) -> asyncio.Semaphore:
+        semaphore = self._run_semaphores.get(run_manager)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, self.max_concurrent_tool_calls))
+            self._run_semaphores[run_manager] = semaphore
+        return semaphore
+
+    async def _aperform_agent_action(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        agent_action: AgentAction,
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> AgentStep:
+        if run_manager is None:
+            return await super()._aperform_agent_action(
+                name_to_tool_map, color_mapping, agent_action, run_manager
+            )
+        async with self._get_run_semaphore(run_manager):
+            return await super()._aperform_agent_action(
+                name_to_tool_map, color_mapping, agent_action, run_manager
+            )
+
+
+def create_langchain_tool_from_mcp(
+    mcp_client: MCPClient, mcp_tool: dict, pager: Optional[ToolResultPager] = None
+) -> Tool:
+    """
+    Создает LangChain Tool из описания MCP инструмента.
+    С pager большие результаты отдаются агенту постранично.
+    """
     tool_name = mcp_tool["name"]
     tool_description = mcp_tool.get("description", f"MCP tool: {tool_name}")
     input_schema = mcp_tool.get("inputSchema", {})
 
-    # Создаем функцию-обёртку для вызова MCP tool
+    def fit(result) -> str:
+        text = str(result)
+        return pager.fit(tool_name, text) if pager is not None else text
+
+    # Основной путь: корутина, которая выполняется прямо в event loop сервера
+    # (AgentExecutor.astream/ainvoke) и переиспользует пул соединений MCPClient
+    async def tool_coroutine(**kwargs) -> str:
+        """Асинхронно вызывает MCP инструмент."""
+        try:
+            return fit(await mcp_client.call_tool(tool_name, kwargs))
+        except Exception as e:
+            logger.error(f"Error calling MCP tool {tool_name}: {e}")
+            return f"Error: {str(e)}"
+
+    # Синхронный фоллбек для AgentExecutor.invoke и вызовов вне event loop
     def tool_func(**kwargs) -> str:
         """Вызывает MCP инструмент."""
         try:
@@ -37,10 +100,10 @@ def create_langchain_tool_from_mcp(mcp_client: MCPClient, mcp_tool: dict) -> Too
                 import concurrent.futures
                 with concurrent.futures.ThreadPoolExecutor() as executor:
                     future = executor.submit(asyncio.run, coro)
-                    return str(future.result())
+                    return fit(future.result())
             else:
                 # Нет активного loop — создаём новый через asyncio.run
-                return str(asyncio.run(coro))
+                return fit(asyncio.run(coro))
         except Exception as e:
             logger.error(f"Error calling MCP tool {tool_name}: {e}")
             return f"Error: {str(e)}"
@@ -66,6 +129,7 @@ def create_langchain_tool_from_mcp(mcp_client: MCPClient, mcp_tool: dict) -> Too
 
         return StructuredTool.from_function(
             func=tool_func,
+            coroutine=tool_coroutine,
             name=tool_name,
             description=tool_description,
             args_schema=ArgsModel,
@@ -73,70 +137,220 @@ def create_langchain_tool_from_mcp(mcp_client: MCPClient, mcp_tool: dict) -> Too
     else:
         print('created SIMPLE TOOL')
         # Простой tool без аргументов или со строковым input
+        async def simple_coroutine(x: str = "") -> str:
+            return await tool_coroutine(input=x) if x else await tool_coroutine()
+
         return Tool(
             name=tool_name,
             description=tool_description,
-            func=lambda x="": tool_func(input=x) if x else tool_func()
+            func=lambda x="": tool_func(input=x) if x else tool_func(),
+            coroutine=simple_coroutine,
         )
 
 
-async def get_mcp_tools_async(mcp_urls: Optional[str]) -> List[Tool]:
-    print(f'get_mcp_tools_async MCP_URLS: {mcp_urls}')
-    """Асинхронно получает инструменты из MCP серверов."""
+@dataclass
+class MCPServerDiscovery:
+    """Результат опроса одного MCP сервера (по сети или из кэша)."""
+
+    url: str
+    client: Optional[MCPClient]
+    tools: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    from_cache: bool = False
+    listing_hash: Optional[str] = None
+
+    def __post_init__(self):
+        # Хэш фиксируется в момент опроса: клиент общий и его server_info может обновиться
+        if self.ok and self.listing_hash is None:
+            server_info = getattr(self.client, "server_info", None)
+            self.listing_hash = ToolSchemaCache.listing_hash(self.tools, server_info)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_mcp_urls(mcp_urls: Optional[str]) -> List[str]:
+    if not mcp_urls:
+        return []
+    return [url.strip() for url in mcp_urls.split(',') if url.strip()]
+
+
+async def discover_mcp_server(
+    mcp_url: str,
+    timeout: float,
+    cache: Optional[ToolSchemaCache] = None,
+    client: Optional[MCPClient] = None,
+) -> MCPServerDiscovery:
+    """
+    Выполняет initialize + tools/list для одного сервера с ограничением по времени.
+    Если передан client, он переиспользуется и не закрывается при ошибке.
+    """
+    logger.info(f"Connecting to MCP server: {mcp_url}")
+    started = time.perf_counter()
+    mcp_client = client or MCPClient(mcp_url)
+    try:
+        mcp_tools = await asyncio.wait_for(mcp_client.list_tools(), timeout)
+    except Exception as e:
+        error = f"timeout after {timeout:.1f}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+        logger.error(f"Failed to connect to MCP server {mcp_url}: {error}")
+        if client is None:
+            await mcp_client.aclose()
+        return MCPServerDiscovery(mcp_url, None, error=error, elapsed=time.perf_counter() - started)
+
+    logger.info(f"Found {len(mcp_tools)} tools from {mcp_url}")
+    if cache is not None:
+        cache.store(mcp_url, mcp_client.protocol_version, mcp_tools, mcp_client.server_info)
+    return MCPServerDiscovery(mcp_url, mcp_client, mcp_tools, elapsed=time.perf_counter() - started)
+
+
+def load_cached_mcp_servers(urls: List[str], cache: ToolSchemaCache) -> Optional[List[MCPServerDiscovery]]:
+    """
+    Собирает описание серверов из дискового кэша без сетевых запросов.
+    Возвращает None, если хотя бы для одного URL записи нет.
+    """
+    discoveries = []
+    for url in urls:
+        client = MCPClient(url)
+        entry = cache.load(url, client.protocol_version)
+        if entry is None:
+            return None
+        client.server_info = entry.get("server_info", {})
+        discoveries.append(MCPServerDiscovery(url, client, entry["tools"], from_cache=True))
+    return discoveries
+
+
+async def load_mcp_servers_async(
+    mcp_urls: Optional[str],
+    timeout: Optional[float] = None,
+    cache: Optional[ToolSchemaCache] = None,
+) -> List[MCPServerDiscovery]:
+    """
+    Получает описание MCP серверов: из кэша, если он полный, иначе по сети.
+
+    Серверы опрашиваются параллельно, каждый со своим таймаутом (MCP_DISCOVERY_TIMEOUT);
+    недоступные серверы помечаются ошибкой, порядок соответствует MCP_URL.
+    """
+    urls = parse_mcp_urls(mcp_urls)
+    if not urls:
+        return []
+
+    if cache is not None:
+        cached = load_cached_mcp_servers(urls, cache)
+        if cached is not None:
+            logger.info(f"Loaded MCP tool listings for {len(cached)} servers from cache {cache.path}")
+            return cached
+
+    if timeout is None:
+        timeout = float(os.getenv("MCP_DISCOVERY_TIMEOUT", 15))
+
+    started = time.perf_counter()
+    discoveries = await asyncio.gather(*(discover_mcp_server(url, timeout, cache) for url in urls))
+    log_discovery_summary(discoveries, time.perf_counter() - started)
+    return list(discoveries)
+
+
+def tools_from_discoveries(
+    discoveries: List[MCPServerDiscovery], pager: Optional[ToolResultPager] = None
+) -> List[BaseTool]:
+    """
+    Создаёт LangChain tools для всех успешно опрошенных серверов.
+    С pager добавляется инструмент чтения страниц больших результатов.
+    """
     tools = []
-    print(f'MCP URLS {mcp_urls}')
+    for discovery in discoveries:
+        if not discovery.ok:
+            continue
+        for mcp_tool in discovery.tools:
+            tools.append(create_langchain_tool_from_mcp(discovery.client, mcp_tool, pager))
+            logger.info(f"  - Added tool: {mcp_tool['name']}")
+    if pager is not None and tools:
+        tools.append(pager.as_tool())
+    return tools
 
+
+async def get_mcp_tools_async(mcp_urls: Optional[str], timeout: Optional[float] = None) -> List[Tool]:
+    """Асинхронно получает инструменты из MCP серверов (с кэшем из MCP_TOOL_CACHE_PATH)."""
     if not mcp_urls:
         logger.info("No MCP_URL configured, running without MCP tools")
-        return tools
+        return []
 
-    for mcp_url in mcp_urls.split(','):
-        mcp_url = mcp_url.strip()
-        if not mcp_url:
-            continue
+    discoveries = await load_mcp_servers_async(mcp_urls, timeout, ToolSchemaCache.from_env())
+    return tools_from_discoveries(discoveries)
 
-        logger.info(f"Connecting to MCP server: {mcp_url}")
-        mcp_client = MCPClient(mcp_url)
 
-        try:
-            mcp_tools = await mcp_client.list_tools()
-            logger.info(f"Found {len(mcp_tools)} tools from {mcp_url}")
+def log_discovery_summary(discoveries: List[MCPServerDiscovery], elapsed: float) -> None:
+    """Логирует итог опроса MCP серверов: задержку и результат по каждому."""
+    succeeded = sum(1 for d in discoveries if d.ok)
+    details = "; ".join(
+        f"{d.url}: {d.elapsed:.2f}s, {len(d.tools)} tools" if d.ok
+        else f"{d.url}: {d.elapsed:.2f}s, failed ({d.error})"
+        for d in discoveries
+    )
+    log = logger.info if succeeded == len(discoveries) else logger.warning
+    log(f"MCP discovery: {succeeded}/{len(discoveries)} servers ok in {elapsed:.2f}s ({details})")
 
-            for mcp_tool in mcp_tools:
-                tool = create_langchain_tool_from_mcp(mcp_client, mcp_tool)
-                print(f'ADDED TOOL: {tool}')
-                tools.append(tool)
-                logger.info(f"  - Added tool: {mcp_tool['name']}")
 
-        except Exception as e:
-            logger.error(f"Failed to connect to MCP server {mcp_url}: {e}")
+def run_sync(coro):
+    """Выполняет корутину из синхронного кода, даже если event loop уже запущен."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop and loop.is_running():
+        # Создаём новый event loop в отдельном потоке
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            future = executor.submit(asyncio.run, coro)
+            return future.result()
+    return asyncio.run(coro)
 
-    return tools
+
+async def release_connections(discoveries: List[MCPServerDiscovery]) -> List[MCPServerDiscovery]:
+    """
+    Закрывает пулы соединений клиентов перед выходом из временного event loop (run_sync).
+    Клиенты остаются рабочими и откроют новые соединения уже в loop сервера.
+    """
+    for discovery in discoveries:
+        if discovery.client is not None:
+            await discovery.client.aclose()
+    return discoveries
 
 
 def get_mcp_tools(mcp_urls: Optional[str]) -> List[Tool]:
     """Синхронная обёртка для получения MCP tools."""
+
+    async def discover() -> List[Tool]:
+        if not mcp_urls:
+            logger.info("No MCP_URL configured, running without MCP tools")
+            return []
+        discoveries = await load_mcp_servers_async(mcp_urls, cache=ToolSchemaCache.from_env())
+        return tools_from_discoveries(await release_connections(discoveries))
+
     try:
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-
-        if loop and loop.is_running():
-            # Создаём новый event loop в отдельном потоке
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, get_mcp_tools_async(mcp_urls))
-                return future.result()
-        else:
-            return asyncio.run(get_mcp_tools_async(mcp_urls))
+        return run_sync(discover())
     except Exception as e:
         logger.error(f"Error getting MCP tools: {e}")
         return []
 
 
-def create_langchain_agent(mcp_urls: Optional[str] = None):
-    """Создает LangChain агента с инструментами."""
+def load_mcp_servers(mcp_urls: Optional[str], cache: Optional[ToolSchemaCache] = None) -> List[MCPServerDiscovery]:
+    """Синхронная обёртка над load_mcp_servers_async для старта сервера."""
+
+    async def discover() -> List[MCPServerDiscovery]:
+        return await release_connections(await load_mcp_servers_async(mcp_urls, cache=cache))
+
+    try:
+        return run_sync(discover())
+    except Exception as e:
+        logger.error(f"Error loading MCP servers: {e}")
+        return []
+
+
+def create_llm(temperature: float = 0.7) -> ChatOpenAI:
+    """Создает LLM по переменным окружения LLM_MODEL / LLM_API_BASE / LLM_API_KEY."""
     raw_model = os.getenv("LLM_MODEL")
     # Cloud.ru отдает модель вида hosted_vllm/openai/gpt-oss-120b, а endpoint ждет openai/gpt-oss-120b
     model = raw_model.removeprefix("hosted_vllm/") if raw_model else None
@@ -145,18 +359,28 @@ def create_langchain_agent(mcp_urls: Optional[str] = None):
     else:
         logger.info(f'create_langchain_agent LLM_MODEL: {model}')
     logger.info(f'create_langchain_agent LLM_API_BASE: {os.getenv("LLM_API_BASE")}')
-    logger.info(f'create_langchain_agent LLM_API_KEY: {os.getenv("LLM_API_KEY")}')
+    # Сам ключ в лог не пишем: create_llm вызывается и при каждой смене набора инструментов
+    logger.info(f'create_langchain_agent LLM_API_KEY set: {bool(os.getenv("LLM_API_KEY"))}')
 
     # Создаем LLM через LiteLLM для унификации
-    llm = ChatOpenAI(
+    return ChatOpenAI(
         model=model,
         base_url=os.getenv("LLM_API_BASE"),
         api_key=os.getenv("LLM_API_KEY"),
-        temperature=0.7,
+        temperature=temperature,
     )
+
+
+def create_langchain_agent(mcp_urls: Optional[str] = None, tools: Optional[List[BaseTool]] = None):
+    """
+    Создает LangChain агента с инструментами.
+    Если tools не переданы, они запрашиваются у MCP серверов из mcp_urls.
+    """
+    llm = create_llm()
     
     # Получаем инструменты из MCP
-    tools = get_mcp_tools(mcp_urls)
+    if tools is None:
+        tools = get_mcp_tools(mcp_urls)
     
     # Системный промпт
     system_prompt = os.getenv(
@@ -175,13 +399,14 @@ def create_langchain_agent(mcp_urls: Optional[str] = None):
     # Создаем агента
     agent = create_openai_tools_agent(llm, tools, prompt)
     
-    # Создаем executor
-    agent_executor = AgentExecutor(
+    # Создаем executor; несколько tool calls одного шага выполняются параллельно
+    agent_executor = ConcurrentAgentExecutor(
         agent=agent,
         tools=tools,
         verbose=True,
         handle_parsing_errors=True,
         max_iterations=15,
+        max_concurrent_tool_calls=int(os.getenv("AGENT_MAX_PARALLEL_TOOL_CALLS", 4)),
     )
     
     return agent_executor
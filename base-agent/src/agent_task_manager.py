@@ -1,28 +1,82 @@
 """AgentExecutor для интеграции LangChain агента с A2A."""
+import asyncio
+import hashlib
 import logging
+import re
+from typing import Dict, Optional, Set, Tuple
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
+    Part,
     Task,
     TaskState,
-    UnsupportedOperationError,
+    TextPart,
 )
 from a2a.utils import (
     new_agent_text_message,
     new_task,
 )
-from a2a.utils.errors import ServerError
 from a2a_wrapper import LangChainA2AWrapper
+from idempotency import IdempotencyCache
+from scheduler import ContextScheduler, SchedulerRejected
 
 logger = logging.getLogger(__name__)
 
+# Метаданные промежуточных сообщений: часть ответа или событие (вызов инструмента)
+STREAM_METADATA_KEY = "stream"
+STREAM_DELTA = "delta"
+STREAM_EVENT = "event"
+
+# Ключ идемпотентности в metadata запроса: повтор с тем же ключом не запускает агента заново
+IDEMPOTENCY_METADATA_KEY = "idempotency_key"
+
+# Бот добавляет к сообщению строку "[Информация о пользователе: ..., Telegram ID: N]"
+TELEGRAM_ID_RE = re.compile(r"Telegram ID:\s*(\d+)")
+
+
+def extract_user_id(context: RequestContext) -> Optional[str]:
+    """Определяет пользователя запроса: metadata.user_id, Telegram ID из текста или None."""
+    metadata = context.metadata or {}
+    user_id = metadata.get("user_id")
+    if user_id:
+        return str(user_id)
+    match = TELEGRAM_ID_RE.search(context.get_user_input() or "")
+    return match.group(1) if match else None
+
+
+def extract_idempotency_key(context: RequestContext) -> Optional[str]:
+    """Ключ идемпотентности из metadata запроса или сообщения."""
+    for metadata in (context.metadata, context.message.metadata if context.message else None):
+        key = (metadata or {}).get(IDEMPOTENCY_METADATA_KEY)
+        if key:
+            return str(key)
+    return None
+
+
+def idempotency_scope(context_id: str, key: str, query: str) -> Tuple[str, str, str]:
+    """
+    Ключ в кэше идемпотентности: ключ клиента действует только в своём контексте
+    и только для того же текста запроса — чужой context_id не получит сохранённый ответ.
+    """
+    return context_id, key, hashlib.sha256(query.encode("utf-8")).hexdigest()
+
 
 class LangChainAgentExecutor(AgentExecutor):
     """AgentExecutor для LangChain агента."""
 
-    def __init__(self, agent_wrapper: LangChainA2AWrapper):
+    def __init__(
+        self,
+        agent_wrapper: LangChainA2AWrapper,
+        scheduler: Optional[ContextScheduler] = None,
+        idempotency: Optional[IdempotencyCache] = None,
+    ):
         self.agent = agent_wrapper
+        self.scheduler = scheduler or ContextScheduler.from_env()
+        self.idempotency = idempotency or IdempotencyCache.from_env()
+        # Выполняющиеся задачи агента по task_id — их можно отменить через cancel
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: Set[str] = set()
 
     async def execute(
         self,
@@ -46,8 +100,76 @@ class LangChainAgentExecutor(AgentExecutor):
             await event_queue.enqueue_event(task)
         
         updater = TaskUpdater(event_queue, task.id, task.context_id)
-        
-        # Вызываем агента с streaming
+
+        # Повтор уже выполненного или выполняющегося запроса получает тот же ответ
+        client_key = extract_idempotency_key(context)
+        key = idempotency_scope(task.context_id, client_key, query) if client_key else None
+        if key and await self._replay(key, task, updater):
+            return
+        owner = bool(key) and not self.idempotency.in_flight(key)
+        if owner:
+            self.idempotency.begin(key)
+        outcome = None
+
+        # Запуск идёт отдельной задачей, чтобы cancel мог прервать его вместе с вызовами MCP
+        runner = asyncio.create_task(self._scheduled_run(context, query, task, updater))
+        self._running[task.id] = runner
+        try:
+            outcome = await runner
+        except asyncio.CancelledError:
+            if task.id not in self._cancel_requested:
+                raise
+            # Отменено через cancel(): статус canceled уже отправлен
+            logger.info(f"Task {task.id} cancelled")
+        finally:
+            self._running.pop(task.id, None)
+            self._cancel_requested.discard(task.id)
+            if owner:
+                # Кэшируется только успешный ответ — неудачный запрос можно повторить
+                if outcome is not None and outcome[0] == TaskState.completed:
+                    self.idempotency.complete(key, outcome)
+                else:
+                    self.idempotency.fail(key, RuntimeError(f"Task {task.id} did not complete"))
+
+    async def _replay(self, key: Tuple[str, str, str], task: Task, updater: TaskUpdater) -> bool:
+        """Отвечает на повтор запроса результатом исходного запуска. False — запускать агента."""
+        outcome = self.idempotency.get(key)
+        if outcome is None and self.idempotency.in_flight(key):
+            logger.info(f"Duplicate request {key[1]} joined running task, task_id={task.id}")
+            try:
+                outcome = await self.idempotency.wait(key)
+            except Exception:
+                # Исходный запуск не завершился успешно — выполняем повтор сами
+                return False
+        if outcome is None:
+            return False
+        _, text = outcome
+        logger.info(f"Replaying result for idempotency key {key[1]}, task_id={task.id}")
+        await updater.add_artifact([Part(root=TextPart(text=text))], name="response")
+        await updater.update_status(
+            TaskState.completed,
+            new_agent_text_message(text, task.context_id, task.id),
+        )
+        return True
+
+    async def _scheduled_run(
+        self, context: RequestContext, query: str, task: Task, updater: TaskUpdater
+    ) -> Optional[Tuple[TaskState, str]]:
+        # Запросы одного контекста выполняются по очереди, разные — параллельно в пределах лимитов
+        user_id = extract_user_id(context)
+        try:
+            async with self.scheduler.slot(task.context_id, user_id):
+                return await self._run(query, task, updater)
+        except SchedulerRejected as e:
+            logger.warning(f"Request rejected: context_id={task.context_id}, user_id={user_id}: {e}")
+            await updater.update_status(
+                TaskState.rejected,
+                new_agent_text_message(str(e), task.context_id, task.id),
+            )
+            return TaskState.rejected, str(e)
+
+    async def _run(self, query: str, task: Task, updater: TaskUpdater) -> Optional[Tuple[TaskState, str]]:
+        """Выполняет агента; возвращает финальное состояние задачи и текст ответа."""
         async for item in self.agent.stream(query, task.context_id):
             is_task_complete = item['is_task_complete']
             require_user_input = item['require_user_input']
@@ -61,22 +183,25 @@ class LangChainAgentExecutor(AgentExecutor):
                         item['content'], task.context_id, task.id
                     ),
                 )
-                break
+                return TaskState.failed, item['content']
             
             if is_event:
                 await updater.update_status(
                     TaskState.working,
-                    new_agent_text_message(
-                        item['content'], task.context_id, task.id
+                    updater.new_agent_message(
+                        [Part(root=TextPart(text=item['content']))],
+                        metadata={STREAM_METADATA_KEY: STREAM_EVENT},
                     ),
                 )
                 continue
             
             if not is_task_complete and not require_user_input:
+                # Очередная часть ответа (склеенные токены LLM)
                 await updater.update_status(
                     TaskState.working,
-                    new_agent_text_message(
-                        item['content'], task.context_id, task.id
+                    updater.new_agent_message(
+                        [Part(root=TextPart(text=item['content']))],
+                        metadata={STREAM_METADATA_KEY: STREAM_DELTA},
                     ),
                 )
                 continue
@@ -88,20 +213,43 @@ class LangChainAgentExecutor(AgentExecutor):
                         item['content'], task.context_id, task.id
                     ),
                 )
-                break
+                return TaskState.input_required, item['content']
             
             if is_task_complete and not require_user_input:
+                # Полный ответ — артефактом и в финальном статусе
+                await updater.add_artifact(
+                    [Part(root=TextPart(text=item['content']))], name="response"
+                )
                 await updater.update_status(
                     TaskState.completed,
                     new_agent_text_message(
                         item['content'], task.context_id, task.id
                     ),
                 )
-                break
+                return TaskState.completed, item['content']
+        return None
 
     async def cancel(
         self, request: RequestContext, event_queue: EventQueue
     ) -> Task | None:
-        raise ServerError(error=UnsupportedOperationError())
+        """
+        Отменяет задачу: прерывает выполнение агента (и ожидание в очереди),
+        незавершённые вызовы MCP и отправляет статус canceled.
+        """
+        task_id = request.task_id
+        runner = self._running.get(task_id)
+        if runner is not None and not runner.done():
+            self._cancel_requested.add(task_id)
+            runner.cancel()
+            # Дожидаемся, пока отмена дойдёт до потока агента и инструментов
+            await asyncio.wait([runner])
+            logger.info(f"Cancelled running task {task_id}")
+
+        updater = TaskUpdater(event_queue, task_id, request.context_id)
+        await updater.update_status(
+            TaskState.canceled,
+            new_agent_text_message("Задача отменена", request.context_id, task_id),
+        )
+        return None
 
 
@@ -0,0 +1,127 @@
+"""Окно истории диалога по бюджету токенов и фоновое сжатие старых реплик."""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from session_store import HistoryMessage, SessionStore, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога:\n"
+
+SUMMARY_PROMPT = (
+    "Ты сжимаешь историю диалога пользователя с AI-ассистентом по GitLab. "
+    "Обнови краткое содержание с учётом новых реплик: сохрани факты, которые могут "
+    "понадобиться дальше (проекты, номера MR и issues, ветки, решения, договорённости, "
+    "нерешённые вопросы). Пиши кратко, по-русски, без вступлений."
+)
+
+# (текущее краткое содержание, реплики для сжатия) -> новое краткое содержание
+Summarizer = Callable[[Optional[str], List[HistoryMessage]], Awaitable[str]]
+
+
+class LLMSummarizer:
+    """Сжимает старые реплики диалога с помощью LLM."""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    async def __call__(self, summary: Optional[str], messages: List[HistoryMessage]) -> str:
+        lines = []
+        if summary:
+            lines.append(f"Текущее краткое содержание:\n{summary}\n")
+        lines.append("Новые реплики:")
+        for role, text in messages:
+            speaker = "Пользователь" if role == "human" else "Ассистент"
+            lines.append(f"{speaker}: {text}")
+        result = await self.llm.ainvoke([("system", SUMMARY_PROMPT), ("human", "\n".join(lines))])
+        return str(getattr(result, "content", result)).strip()
+
+
+class HistoryManager:
+    """
+    Собирает chat_history для LLM в пределах бюджета токенов.
+
+    В запрос попадают краткое содержание старой части диалога и самые свежие
+    реплики, укладывающиеся в token_budget. Реплики, не вошедшие в окно,
+    сжимаются в краткое содержание фоновой задачей после ответа пользователю,
+    поэтому вызов LLM-сжатия не задерживает запрос.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        summarizer: Optional[Summarizer] = None,
+        token_budget: int = 3000,
+    ):
+        self.store = store
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._compactions = 0
+        self._compaction_errors = 0
+
+    @classmethod
+    def from_env(cls, store: SessionStore, summarizer: Optional[Summarizer] = None) -> "HistoryManager":
+        return cls(store, summarizer, token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", 3000)))
+
+    def _split(self, history: List[HistoryMessage]) -> Tuple[List[HistoryMessage], List[HistoryMessage]]:
+        """Делит историю на (старые реплики вне окна, окно); последний ход попадает в окно всегда."""
+        if not self.token_budget:
+            return [], history
+        start = len(history)
+        used = 0
+        while start >= 2:
+            turn_tokens = estimate_tokens(history[start - 2][1]) + estimate_tokens(history[start - 1][1])
+            if used + turn_tokens > self.token_budget and start < len(history):
+                break
+            used += turn_tokens
+            start -= 2
+        return history[:start], history[start:]
+
+    async def build(self, session_id: str) -> List[HistoryMessage]:
+        """Возвращает историю для промпта: краткое содержание + окно свежих реплик."""
+        history = await self.store.get_history(session_id)
+        summary = await self.store.get_summary(session_id)
+        _, window = self._split(history)
+        if summary:
+            return [("system", SUMMARY_PREFIX + summary)] + window
+        return window
+
+    def schedule_compaction(self, session_id: str) -> None:
+        """Запускает фоновое сжатие реплик, вышедших за окно (не более одной задачи на сессию)."""
+        if self.summarizer is None or session_id in self._tasks:
+            return
+        task = asyncio.create_task(self._compact(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _compact(self, session_id: str) -> None:
+        history = await self.store.get_history(session_id)
+        overflow, _ = self._split(history)
+        if not overflow:
+            return
+        summary = await self.store.get_summary(session_id)
+        try:
+            new_summary = await self.summarizer(summary, overflow)
+        except Exception as e:
+            self._compaction_errors += 1
+            logger.error(f"Failed to summarize history for session {session_id}: {e}")
+            return
+        await self.store.compact(session_id, new_summary, overflow)
+        self._compactions += 1
+        logger.info(f"Compacted {len(overflow) // 2} turns of session {session_id} into summary")
+
+    async def aclose(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "compactions": self._compactions,
+            "compaction_errors": self._compaction_errors,
+            "pending_compactions": len(self._tasks),
+        }
@@ -0,0 +1,81 @@
+"""Идемпотентность запросов к агенту: повтор с тем же ключом не запускает агента заново."""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class IdempotencyCache:
+    """
+    Результаты запусков агента по ключу идемпотентности.
+
+    Пока запуск с ключом выполняется, повторы ждут его результата (wait);
+    успешный результат хранится ttl секунд (не больше max_entries ключей, LRU),
+    и повтор получает его без нового запуска. Неуспешные запуски не кэшируются,
+    чтобы повтор мог выполниться заново. Ключ — любой hashable (исполнитель
+    добавляет к ключу клиента контекст и хэш запроса).
+    """
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._done: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._hits = 0
+        self._joined = 0
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyCache":
+        return cls(
+            ttl=float(os.getenv("AGENT_IDEMPOTENCY_TTL", 600)),
+            max_entries=int(os.getenv("AGENT_IDEMPOTENCY_MAX_ENTRIES", 1000)),
+        )
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Сохранённый результат по ключу или None."""
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._done[key]
+            return None
+        self._done.move_to_end(key)
+        self._hits += 1
+        return result
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    async def wait(self, key: Hashable) -> Any:
+        """Ждёт результата выполняющегося запуска; исключение запуска пробрасывается."""
+        self._joined += 1
+        return await asyncio.shield(self._pending[key])
+
+    def begin(self, key: Hashable) -> None:
+        self._pending[key] = asyncio.get_running_loop().create_future()
+
+    def complete(self, key: Hashable, result: Any) -> None:
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+        self._done[key] = (time.monotonic(), result)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def fail(self, key: Hashable, error: BaseException) -> None:
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # Исключение могут не забрать, если повторов не было
+            future.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._pending),
+            "cached": len(self._done),
+            "hits": self._hits,
+            "joined": self._joined,
+        }
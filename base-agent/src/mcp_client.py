@@ -1,26 +1,196 @@
 """Клиент MCP для Streamable HTTP (JSON-RPC + optional SSE)."""
 
+import asyncio
 import json
 import logging
-from typing import Any, List, Optional
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
 from uuid import uuid4
 
 import httpx
-from httpx_sse import aconnect_sse
+from httpx_sse import EventSource
 
+from result_cache import ToolResultCache
+from single_flight import SingleFlight
+from tool_results import content_to_text
 from utils import parse_sse_like_body
 
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class BatchNotSupported(Exception):
+    """
+    Сервер не принимает JSON-RPC batch (массив запросов в одном POST).
+    remember=False — отказ мог быть вызван не самим batch (404 — ещё и «неизвестная сессия»).
+    """
+
+    def __init__(self, message: str, remember: bool = True):
+        super().__init__(message)
+        self.remember = remember
+
 
 class MCPClient:
-    """Простейший клиент MCP для Streamable HTTP (JSON-RPC over HTTP + optional SSE)."""
+    """
+    Простейший клиент MCP для Streamable HTTP (JSON-RPC over HTTP + optional SSE).
 
-    def __init__(self, base_url: str, protocol_version: str = "2025-06-18"):
+    Клиент владеет одним пулом соединений httpx, который переиспользуется
+    всеми запросами (initialize, tools/list, tools/call). Пул закрывается
+    через aclose() или при выходе из async with.
+    """
+
+    # Общий для процесса кэш результатов читающих инструментов (задаётся при старте сервера)
+    result_cache: Optional[ToolResultCache] = None
+    # Общее схлопывание одинаковых одновременных вызовов читающих инструментов
+    single_flight: Optional[SingleFlight] = None
+
+    def __init__(
+        self,
+        base_url: str,
+        protocol_version: str = "2025-06-18",
+        *,
+        http2: Optional[bool] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        result_cache: Optional[ToolResultCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        batch_window: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+        batch_retry_interval: Optional[float] = None,
+    ):
         self.base_url = base_url.rstrip('/')
+        if result_cache is not None:
+            self.result_cache = result_cache
+        if single_flight is not None:
+            self.single_flight = single_flight
         self._session_id: Optional[str] = None
         self._protocol_version = protocol_version
         self._initialized = False
+        # Режим ответа сервера ("json" или "sse"), согласованный на первом запросе
+        self._transport_mode: Optional[str] = None
+
+        if http2 is None:
+            # h2 не входит в зависимости пакета, поэтому HTTP/2 включается явно
+            http2 = os.getenv("MCP_HTTP2", "false").lower() == "true"
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested for MCP client, but h2 is not installed; using HTTP/1.1")
+            http2 = False
+        self._http2 = http2
+        self._limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("MCP_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=max_keepalive_connections or int(
+                os.getenv("MCP_MAX_KEEPALIVE_CONNECTIONS", 10)
+            ),
+            # Явный 0 — не держать простаивающие соединения, а не «взять значение по умолчанию»
+            keepalive_expiry=(
+                keepalive_expiry if keepalive_expiry is not None
+                else float(os.getenv("MCP_KEEPALIVE_EXPIRY", 30.0))
+            ),
+        )
+        self._transport = transport
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "transport_fallbacks": 0,
+            "cancelled": 0,
+            "batches": 0,
+            "batched_requests": 0,
+        }
+        # Микробатчинг tools/call: вызовы в пределах окна уходят одним POST
+        if batch_window is None:
+            batch_window = float(os.getenv("MCP_BATCH_WINDOW_MS", 0)) / 1000
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size or int(os.getenv("MCP_MAX_BATCH_SIZE", 16))
+        # Сервер отверг batch — до этого момента (monotonic) запросы идут по одному
+        if batch_retry_interval is None:
+            batch_retry_interval = float(os.getenv("MCP_BATCH_RETRY_INTERVAL", 600))
+        self._batch_retry_interval = batch_retry_interval
+        self._batch_disabled_until = 0.0
+        self._batch_pending: List[Tuple[dict, asyncio.Future]] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        self.server_info: dict = {}
+        self.server_capabilities: dict = {}
+        self._notification_handlers: List[Callable[[dict], None]] = []
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def protocol_version(self) -> str:
+        return self._protocol_version
+
+    async def __aenter__(self) -> "MCPClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    def _new_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            follow_redirects=True,
+            http2=self._http2,
+            limits=self._limits,
+            transport=self._transport,
+        )
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """
+        Возвращает общий httpx клиент, создавая его при первом обращении.
+        Соединения пула привязаны к event loop: новый пул создаётся, только если
+        loop прежнего уже закрыт (его соединения закрыть уже нельзя и незачем).
+        """
+        loop = asyncio.get_running_loop()
+        client = self._http_client
+        if client is None or client.is_closed or self._http_client_loop is not loop:
+            if client is not None and not client.is_closed:
+                logger.warning(
+                    "MCP connection pool for %s outlived its event loop; call aclose() before the loop ends",
+                    self.base_url,
+                )
+            self._http_client = self._new_http_client()
+            self._http_client_loop = loop
+        return self._http_client
+
+    @asynccontextmanager
+    async def _http(self) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        httpx клиент для запроса из текущего event loop.
+
+        Вызов из другого, ещё работающего loop (синхронный фоллбек инструмента
+        через asyncio.run в отдельном потоке) получает короткоживущий клиент,
+        который закрывается после запроса, — общий пул не подменяется и не теряется.
+        """
+        owner = self._http_client_loop
+        shared = self._http_client
+        foreign = (
+            shared is not None and not shared.is_closed and owner is not None
+            and owner is not asyncio.get_running_loop() and not owner.is_closed()
+        )
+        if not foreign:
+            yield self._get_http_client()
+            return
+        async with self._new_http_client() as client:
+            yield client
+
+    async def aclose(self) -> None:
+        """Закрывает пул соединений."""
+        pending = [t for t in self._background_tasks if t.get_loop() is asyncio.get_running_loop()]
+        if pending:
+            # Даём досылаться уведомлениям об отмене
+            await asyncio.gather(*pending, return_exceptions=True)
+        client = self._http_client
+        self._http_client = None
+        self._http_client_loop = None
+        if client is not None and not client.is_closed:
+            await client.aclose()
 
     def _headers(self) -> dict:
         headers = {
@@ -32,80 +202,332 @@ class MCPClient:
             headers["Mcp-Session-Id"] = self._session_id
         return headers
 
+    def _remember_session(self, response: httpx.Response) -> None:
+        sid = response.headers.get("Mcp-Session-Id")
+        if sid:
+            self._session_id = sid
+
+    def _remember_transport(self, mode: str) -> None:
+        """Запоминает режим ответа сервера для endpoint; смена режима считается фоллбеком."""
+        known = self._transport_mode
+        if known == mode:
+            return
+        if known is not None:
+            self.stats["transport_fallbacks"] += 1
+            logger.info("MCP server %s switched response mode %s -> %s", self.base_url, known, mode)
+        else:
+            logger.info("MCP server %s negotiated response mode: %s", self.base_url, mode)
+        self._transport_mode = mode
+
+    def _parse_json_response(self, response: httpx.Response, payload: dict) -> dict:
+        # Разбираем байты тела напрямую: большие ответы не декодируются в строку лишний раз
+        body = response.content
+        if not body or body.isspace():
+            logger.info("MCP HTTP response is empty body; returning empty result")
+            return {}
+        try:
+            msg = json.loads(body)
+        except Exception as exc:
+            sse_msg = parse_sse_like_body(response.text)
+            if sse_msg:
+                msg = sse_msg
+            else:
+                logger.error("Failed to parse MCP JSON response: %s; body=%r", exc, response.text)
+                raise
+        if "error" in msg:
+            raise Exception(f"MCP error: {msg['error']}")
+        if msg.get("id") != payload.get("id"):
+            logger.warning("Mismatched response id (got %s, expected %s)", msg.get("id"), payload.get("id"))
+        return msg.get("result", {})
+
+    async def _read_sse_response(self, response: httpx.Response, payload: dict) -> dict:
+        async for sse in EventSource(response).aiter_sse():
+            if not sse.data:
+                continue
+            try:
+                msg = json.loads(sse.data)
+            except Exception as exc:
+                logger.error(f"Failed to parse SSE JSON: {exc}")
+                continue
+            if msg.get("id") == payload.get("id"):
+                if "error" in msg:
+                    raise Exception(f"MCP error: {msg['error']}")
+                return msg.get("result", {})
+            if "method" in msg:
+                self._dispatch_notification(msg)
+        raise Exception(f"MCP SSE stream closed without response for id {payload.get('id')}")
+
+    def add_notification_handler(self, handler: Callable[[dict], None]) -> None:
+        """Регистрирует обработчик серверных уведомлений (например notifications/tools/list_changed)."""
+        self._notification_handlers.append(handler)
+
+    def _dispatch_notification(self, msg: dict) -> None:
+        logger.info("MCP notification from %s: %s", self.base_url, msg.get("method"))
+        for handler in self._notification_handlers:
+            try:
+                handler(msg)
+            except Exception as exc:
+                logger.error(f"MCP notification handler failed: {exc}")
+
+    @property
+    def supports_tools_list_changed(self) -> bool:
+        tools_capability = self.server_capabilities.get("tools") or {}
+        return bool(tools_capability.get("listChanged"))
+
+    async def listen_notifications(self) -> bool:
+        """
+        Слушает серверные уведомления через GET SSE поток Streamable HTTP.
+        Возвращает False, если сервер такой поток не поддерживает, и True, когда поток закрылся.
+        """
+        await self._ensure_initialized()
+        async with self._http() as client:
+            headers = self._headers()
+            headers["Accept"] = "text/event-stream"
+            async with client.stream(
+                "GET",
+                self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(30.0, read=None),
+            ) as response:
+                content_type = response.headers.get("content-type", "")
+                if response.status_code in (404, 405) or "text/event-stream" not in content_type:
+                    logger.info("MCP server %s has no notification stream (HTTP %s)", self.base_url, response.status_code)
+                    return False
+                response.raise_for_status()
+                async for sse in EventSource(response).aiter_sse():
+                    if not sse.data:
+                        continue
+                    try:
+                        msg = json.loads(sse.data)
+                    except Exception as exc:
+                        logger.error(f"Failed to parse SSE JSON: {exc}")
+                        continue
+                    if "method" in msg:
+                        self._dispatch_notification(msg)
+            return True
+
     async def _send_request(self, payload: dict, timeout: float = 60.0) -> dict:
         """
-        Отправляет JSON-RPC POST на MCP endpoint.
-        Если сервер отвечает SSE, обрабатываем поток и возвращаем response для нашего id.
+        Отправляет JSON-RPC POST на MCP endpoint — ровно один HTTP запрос на вызов.
+
+        Режим ответа сервера (JSON или SSE) определяется по Content-Type первого
+        ответа (обычно initialize) и запоминается для endpoint. Для JSON-серверов
+        дальше используется обычный POST, для SSE и неизвестных — потоковое чтение.
         """
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            # Пытаемся открыть SSE; если сервер отвечает application/json или 406, просто фоллбек на обычный POST
-            try:
-                async with aconnect_sse(
-                    client,
-                    method="POST",
-                    url=self.base_url,
+        async with self._http() as client:
+            self.stats["requests"] += 1
+
+            if self._transport_mode == "json":
+                response = await client.post(
+                    self.base_url,
                     json=payload,
                     headers=self._headers(),
-                    timeout=httpx.Timeout(timeout, read=timeout),
-                ) as event_source:
-                    sid = event_source.response.headers.get("Mcp-Session-Id")
-                    print(f'GOD SID FROM MCP SERVER: {sid}')
-                    if sid:
-                        self._session_id = sid
-                    async for sse in event_source.aiter_sse():
+                    timeout=timeout,
+                )
+                self._remember_session(response)
+                if response.status_code >= 400:
+                    logger.error(
+                        "MCP HTTP error %s: %s", response.status_code, response.text
+                    )
+                    response.raise_for_status()
+                if "text/event-stream" in response.headers.get("content-type", ""):
+                    # Сервер сменил режим: тело уже прочитано целиком, разбираем его как SSE
+                    self._remember_transport("sse")
+                return self._parse_json_response(response, payload)
+
+            async with client.stream(
+                "POST",
+                self.base_url,
+                json=payload,
+                headers=self._headers(),
+                timeout=httpx.Timeout(timeout, read=timeout),
+            ) as response:
+                self._remember_session(response)
+                if response.status_code >= 400:
+                    await response.aread()
+                    logger.error(
+                        "MCP HTTP error %s: %s", response.status_code, response.text
+                    )
+                    response.raise_for_status()
+                if "text/event-stream" in response.headers.get("content-type", ""):
+                    self._remember_transport("sse")
+                    return await self._read_sse_response(response, payload)
+                await response.aread()
+                self._remember_transport("json")
+                return self._parse_json_response(response, payload)
+
+    @property
+    def batching_enabled(self) -> bool:
+        return self._batch_window > 0 and self._batch_accepted()
+
+    def _batch_accepted(self) -> bool:
+        return time.monotonic() >= self._batch_disabled_until
+
+    def _batch_rejected(self, error: BatchNotSupported) -> None:
+        """Переводит клиент на одиночные запросы на batch_retry_interval секунд."""
+        if not error.remember:
+            logger.info(f"MCP server {self.base_url} rejected a JSON-RPC batch ({error}), sending one by one")
+            return
+        logger.info(
+            f"MCP server {self.base_url} does not accept JSON-RPC batches ({error}), "
+            f"sending one by one for {self._batch_retry_interval:.0f}s"
+        )
+        self._batch_disabled_until = time.monotonic() + self._batch_retry_interval
+
+    async def _send_batch(self, payloads: List[dict], timeout: float = 120.0) -> Dict[Any, dict]:
+        """
+        Отправляет массив JSON-RPC запросов одним POST и возвращает ответы по id.
+
+        Ответ может прийти JSON массивом или SSE потоком; уведомления из потока
+        передаются обработчикам. Если сервер отверг массив целиком, выбрасывается
+        BatchNotSupported — запросы можно повторить по одному.
+        """
+        async with self._http() as client:
+            self.stats["requests"] += 1
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(payloads)
+            expected = {payload["id"] for payload in payloads if "id" in payload}
+            responses: Dict[Any, dict] = {}
+
+            def collect(body: Any) -> None:
+                for msg in body if isinstance(body, list) else [body]:
+                    if not isinstance(msg, dict):
+                        continue
+                    if msg.get("id") in expected:
+                        responses[msg["id"]] = msg
+                    elif "method" in msg:
+                        self._dispatch_notification(msg)
+
+            async with client.stream(
+                "POST",
+                self.base_url,
+                json=payloads,
+                headers=self._headers(),
+                timeout=httpx.Timeout(timeout, read=timeout),
+            ) as response:
+                self._remember_session(response)
+                if response.status_code >= 400:
+                    await response.aread()
+                    if response.status_code in (400, 404, 405, 415, 422):
+                        raise BatchNotSupported(
+                            f"HTTP {response.status_code}: {response.text[:200]}",
+                            remember=response.status_code != 404,
+                        )
+                    logger.error("MCP HTTP error %s: %s", response.status_code, response.text)
+                    response.raise_for_status()
+                if "text/event-stream" in response.headers.get("content-type", ""):
+                    async for sse in EventSource(response).aiter_sse():
                         if not sse.data:
                             continue
                         try:
-                            msg = json.loads(sse.data)
+                            collect(json.loads(sse.data))
                         except Exception as exc:
                             logger.error(f"Failed to parse SSE JSON: {exc}")
                             continue
-                        if msg.get("id") == payload.get("id"):
-                            if "error" in msg:
-                                raise Exception(f"MCP error: {msg['error']}")
-                            return msg.get("result", {})
-            except Exception as sse_exc:
-                logger.info("SSE not available, falling back to JSON: %s", sse_exc)
-
-            # Обычный POST, ожидаем JSON ответ
-            response = await client.post(
-                self.base_url,
-                json=payload,
-                headers=self._headers(),
-            )
-            sid = response.headers.get("Mcp-Session-Id")
-            if sid:
-                self._session_id = sid
-            if response.status_code >= 400:
-                logger.error(
-                    "MCP HTTP error %s: %s", response.status_code, response.text
-                )
-                response.raise_for_status()
-            if not response.text.strip():
-                logger.info("MCP HTTP response is empty body; returning empty result")
-                return {}
-            try:
-                msg = response.json()
-            except Exception as exc:
-                sse_msg = parse_sse_like_body(response.text)
-                if sse_msg:
-                    msg = sse_msg
+                        if len(responses) == len(expected):
+                            break
                 else:
-                    logger.error("Failed to parse MCP JSON response: %s; body=%r", exc, response.text)
-                    raise
-            if "error" in msg:
-                raise Exception(f"MCP error: {msg['error']}")
-            if msg.get("id") != payload.get("id"):
-                logger.warning("Mismatched response id (got %s, expected %s)", msg.get("id"), payload.get("id"))
-            return msg.get("result", {})
+                    await response.aread()
+                    if response.text.strip():
+                        body = response.json()
+                        if isinstance(body, dict) and body.get("id") is None and "error" in body:
+                            raise BatchNotSupported(str(body["error"]))
+                        collect(body)
+            return responses
 
-    async def _ensure_initialized(self):
-        if self._initialized:
+    async def _send_many(self, payloads: List[dict], timeout: float = 120.0) -> List[Any]:
+        """
+        Выполняет несколько запросов: одним batch, если сервер его принимает, иначе параллельно.
+        Для каждого запроса возвращает result или исключение.
+        """
+        if len(payloads) > 1 and self._batch_accepted():
+            try:
+                responses = await self._send_batch(payloads, timeout)
+            except BatchNotSupported as exc:
+                self._batch_rejected(exc)
+            else:
+                return [self._unwrap_batch_response(responses.get(payload["id"]), payload) for payload in payloads]
+        return await asyncio.gather(
+            *(self._send_request(payload, timeout=timeout) for payload in payloads), return_exceptions=True
+        )
+
+    @staticmethod
+    def _raise_on_error(msg: Optional[dict]) -> dict:
+        if msg is None:
+            raise Exception("MCP batch response is incomplete")
+        if "error" in msg:
+            raise Exception(f"MCP error: {msg['error']}")
+        return msg.get("result", {})
+
+    @staticmethod
+    def _unwrap_batch_response(msg: Optional[dict], payload: dict) -> Any:
+        if msg is None:
+            return Exception(f"MCP batch response has no reply for id {payload['id']}")
+        if "error" in msg:
+            return Exception(f"MCP error: {msg['error']}")
+        return msg.get("result", {})
+
+    async def _submit_batched(self, payload: dict) -> dict:
+        """Ставит запрос в текущий микробатч; батч уходит по окну или по размеру."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch_pending.append((payload, future))
+        if len(self._batch_pending) >= self._max_batch_size:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = loop.call_later(self._batch_window, self._flush_batch)
+        return await future
+
+    def _flush_batch(self) -> None:
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        entries, self._batch_pending = self._batch_pending, []
+        # Вызовы, отменённые до отправки, не отправляем
+        entries = [(payload, future) for payload, future in entries if not future.done()]
+        if not entries:
             return
-        init_id = uuid4().hex
+        task = asyncio.get_running_loop().create_task(self._run_batch(entries))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _run_batch(self, entries: List[Tuple[dict, asyncio.Future]]) -> None:
+        try:
+            results = await self._send_many([payload for payload, _ in entries])
+        except Exception as exc:
+            results = [exc] * len(entries)
+        for (_, future), result in zip(entries, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _notify_cancelled(self, req_id: str) -> None:
+        """Фоном отправляет notifications/cancelled для прерванного запроса."""
+        self.stats["cancelled"] += 1
         payload = {
             "jsonrpc": "2.0",
-            "id": init_id,
+            "method": "notifications/cancelled",
+            "params": {"requestId": req_id, "reason": "Client cancelled the request"},
+        }
+
+        async def send():
+            try:
+                async with self._http() as client:
+                    await client.post(self.base_url, json=payload, headers=self._headers(), timeout=5.0)
+            except Exception as exc:
+                logger.debug(f"Failed to send cancellation for {req_id}: {exc}")
+
+        task = asyncio.get_running_loop().create_task(send())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _initialize_payload(self) -> dict:
+        return {
+            "jsonrpc": "2.0",
+            "id": uuid4().hex,
             "method": "initialize",
             "params": {
                 "protocolVersion": self._protocol_version,
@@ -117,20 +539,42 @@ class MCPClient:
                 "clientInfo": {"name": "langchain-agent", "version": "0.1.0"},
             },
         }
-        await self._send_request(payload, timeout=30.0)
+
+    def _apply_initialize(self, result: dict) -> None:
+        self.server_info = result.get("serverInfo", {}) or {}
+        self.server_capabilities = result.get("capabilities", {}) or {}
         self._initialized = True
 
+    async def _ensure_initialized(self):
+        if self._initialized:
+            return
+        result = await self._send_request(self._initialize_payload(), timeout=30.0)
+        self._apply_initialize(result)
+
     async def list_tools(self) -> List[dict]:
-        """Получает список доступных инструментов от MCP сервера по Streamable HTTP."""
-        await self._ensure_initialized()
-        req_id = uuid4().hex
+        """
+        Получает список доступных инструментов от MCP сервера по Streamable HTTP.
+        С включённым батчингом initialize и tools/list уходят одним запросом.
+        """
         payload = {
             "jsonrpc": "2.0",
-            "id": req_id,
+            "id": uuid4().hex,
             "method": "tools/list",
             "params": {},
         }
-        result = await self._send_request(payload, timeout=60.0)
+        result = None
+        if not self._initialized and self.batching_enabled:
+            init_payload = self._initialize_payload()
+            try:
+                responses = await self._send_batch([init_payload, payload], timeout=60.0)
+            except BatchNotSupported as exc:
+                self._batch_rejected(exc)
+            else:
+                self._apply_initialize(self._raise_on_error(responses.get(init_payload["id"])))
+                result = self._raise_on_error(responses.get(payload["id"]))
+        if result is None:
+            await self._ensure_initialized()
+            result = await self._send_request(payload, timeout=60.0)
         tools: List[dict] = []
         for tool in result.get("tools", []):
             tools.append(
@@ -145,19 +589,110 @@ class MCPClient:
     async def call_tool(self, tool_name: str, arguments: dict) -> Any:
         print(f'call_tool TOOL_NAME: {tool_name}')
         print(f'call_tool ARGUMENTS: {arguments}\n\n')
-        """Вызывает инструмент по Streamable HTTP."""
-        await self._ensure_initialized()
-        req_id = uuid4().hex
-        payload = {
+        """
+        Вызывает инструмент по Streamable HTTP.
+
+        Результаты читающих инструментов берутся из кэша, а одинаковые одновременные
+        вызовы одного чата (chat_id в ключе) схлопываются в один запрос (если заданы
+        result_cache и single_flight).
+        """
+        cache = self.result_cache
+        generation = 0
+        if cache is not None:
+            cached = cache.get(self.base_url, tool_name, arguments)
+            if cached is not None:
+                logger.info(f"MCP result cache hit: {tool_name}")
+                return cached
+            generation = cache.generation(self.base_url)
+        try:
+            flight = self.single_flight
+            if flight is not None and flight.applies(tool_name):
+                # Поколение в ключе: к запросу, начатому до изменяющего вызова,
+                # не присоединяются — иначе его устаревший результат попал бы в кэш
+                key = (ToolResultCache.key(self.base_url, tool_name, arguments), generation)
+                result = await flight.do(key, lambda: self._call_tool(tool_name, arguments))
+            else:
+                result = await self._call_tool(tool_name, arguments)
+        finally:
+            # Изменяющий инструмент мог выполниться, даже если ответ до нас не дошёл
+            if cache is not None:
+                cache.invalidate(self.base_url, tool_name, arguments)
+        text = self._result_text(result)
+        if cache is not None and not result.get("isError"):
+            cache.put(self.base_url, tool_name, arguments, text, generation)
+        return text
+
+    def _tool_payload(self, tool_name: str, arguments: Optional[dict]) -> dict:
+        return {
             "jsonrpc": "2.0",
-            "id": req_id,
+            "id": uuid4().hex,
             "method": "tools/call",
             "params": {"name": tool_name, "arguments": arguments or {}},
         }
-        result = await self._send_request(payload, timeout=120.0)
-        content = result.get("content", [])
-        if content:
-            first = content[0]
-            if isinstance(first, dict) and "text" in first:
-                return first["text"]
-        return str(result)
+
+    async def _call_tool(self, tool_name: str, arguments: dict) -> dict:
+        await self._ensure_initialized()
+        payload = self._tool_payload(tool_name, arguments)
+        try:
+            if self.batching_enabled:
+                return await self._submit_batched(payload)
+            return await self._send_request(payload, timeout=120.0)
+        except asyncio.CancelledError:
+            # Вызов отменён (например, отменена задача агента) — сообщаем серверу,
+            # чтобы он не тратил ресурсы на ненужный результат
+            self._notify_cancelled(payload["id"])
+            raise
+
+    async def call_tools_batch(
+        self, calls: Sequence[Tuple[str, dict]], return_exceptions: bool = False
+    ) -> List[Any]:
+        """
+        Вызывает несколько инструментов одним JSON-RPC batch (если сервер его принимает).
+
+        Результаты возвращаются в порядке calls; результаты из кэша не запрашиваются.
+        С return_exceptions=True ошибка отдельного вызова возвращается на его месте,
+        иначе выбрасывается первая из них.
+        """
+        await self._ensure_initialized()
+        cache = self.result_cache
+        results: List[Any] = [None] * len(calls)
+        pending: List[int] = []
+        for index, (tool_name, arguments) in enumerate(calls):
+            cached = cache.get(self.base_url, tool_name, arguments) if cache is not None else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append(index)
+        generation = cache.generation(self.base_url) if cache is not None else 0
+
+        payloads = [self._tool_payload(*calls[index]) for index in pending]
+        try:
+            responses = await self._send_many(payloads) if payloads else []
+        except asyncio.CancelledError:
+            for payload in payloads:
+                self._notify_cancelled(payload["id"])
+            raise
+        finally:
+            if cache is not None:
+                for index in pending:
+                    cache.invalidate(self.base_url, *calls[index])
+
+        for index, response in zip(pending, responses):
+            if isinstance(response, BaseException):
+                results[index] = response
+                continue
+            tool_name, arguments = calls[index]
+            results[index] = self._result_text(response)
+            if cache is not None and not response.get("isError"):
+                cache.put(self.base_url, tool_name, arguments, results[index], generation)
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+    @staticmethod
+    def _result_text(result: dict) -> str:
+        # Все части контента: у больших результатов текст бывает разбит на несколько частей
+        return content_to_text(result)
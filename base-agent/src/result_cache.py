@@ -0,0 +1,173 @@
+"""Кэш результатов читающих MCP инструментов (read-through перед MCPClient.call_tool)."""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Инструменты GitLab MCP сервера, которые только читают данные, и время жизни их результатов, сек
+DEFAULT_TTLS: Dict[str, float] = {
+    "list_projects": 300.0,
+    "list_merge_requests": 60.0,
+    "get_mr_details": 60.0,
+    "list_issues": 60.0,
+    "get_pipeline_status": 15.0,
+}
+
+# Изменяющие инструменты и читающие инструменты, результаты которых они делают устаревшими
+INVALIDATES: Dict[str, Tuple[str, ...]] = {
+    "create_issue": ("list_issues",),
+    "retry_pipeline": ("get_pipeline_status", "list_merge_requests", "get_mr_details"),
+}
+
+# Инструменты, меняющие учётные данные чата: сбрасывают все записи этого чата
+CREDENTIAL_TOOLS = ("register_user", "unregister_user", "update_user_credentials")
+
+# Аргумент, определяющий учётные данные GitLab (у каждого чата свой токен)
+SCOPE_ARGUMENT = "chat_id"
+
+CacheKey = Tuple[str, str, str, str]
+
+
+def parse_ttls(value: Optional[str]) -> Dict[str, float]:
+    """Разбирает "tool=ttl,tool=ttl" поверх значений по умолчанию; ttl 0 убирает инструмент из кэша."""
+    ttls = dict(DEFAULT_TTLS)
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        name, ttl = item.split("=", 1)
+        try:
+            ttls[name.strip()] = float(ttl)
+        except ValueError:
+            logger.warning(f"Ignoring invalid MCP result cache TTL: {item!r}")
+    return {name: ttl for name, ttl in ttls.items() if ttl > 0}
+
+
+class ToolResultCache:
+    """
+    LRU кэш результатов MCP инструментов из разрешённого списка (ttls).
+
+    Размер ограничен и числом записей (max_entries), и суммарной длиной
+    результатов (max_chars): diff большого MR весит мегабайты. Результат
+    длиннее max_entry_chars не кэшируется вовсе.
+
+    Ключ — сервер, инструмент, учётные данные (chat_id) и канонизированные аргументы:
+    порядок ключей и пробелы в JSON не влияют на попадание. Вызов изменяющего
+    инструмента сбрасывает записи зависимых читающих инструментов сервера,
+    а смена учётных данных — все записи чата. Результат запроса, начатого до
+    сброса, не сохраняется (поколение сервера сменилось).
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 1000,
+        max_chars: int = 8_000_000,
+        max_entry_chars: int = 200_000,
+    ):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.max_entry_chars = min(max_entry_chars, max_chars)
+        # key -> (срок жизни, результат, его длина в символах)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any, int]]" = OrderedDict()
+        self._chars = 0
+        self._generations: Dict[str, int] = {}
+        self.stats_counters: Dict[str, int] = {
+            "hits": 0, "misses": 0, "invalidated": 0, "evicted": 0, "too_large": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["ToolResultCache"]:
+        """Создаёт кэш по MCP_RESULT_CACHE_*; MCP_RESULT_CACHE_ENABLED=false выключает его."""
+        if os.getenv("MCP_RESULT_CACHE_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            ttls=parse_ttls(os.getenv("MCP_RESULT_CACHE_TTLS")),
+            max_entries=int(os.getenv("MCP_RESULT_CACHE_MAX_ENTRIES", 1000)),
+            max_chars=int(os.getenv("MCP_RESULT_CACHE_MAX_CHARS", 8_000_000)),
+            max_entry_chars=int(os.getenv("MCP_RESULT_CACHE_MAX_ENTRY_CHARS", 200_000)),
+        )
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return tool_name in self.ttls
+
+    @staticmethod
+    def key(server: str, tool_name: str, arguments: Optional[dict]) -> CacheKey:
+        arguments = dict(arguments or {})
+        scope = str(arguments.pop(SCOPE_ARGUMENT, ""))
+        canonical = json.dumps(arguments, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return server, tool_name, scope, canonical
+
+    def generation(self, server: str) -> int:
+        return self._generations.get(server, 0)
+
+    def get(self, server: str, tool_name: str, arguments: Optional[dict]) -> Optional[Any]:
+        """Результат из кэша или None (нет записи, истёк TTL или инструмент не кэшируется)."""
+        if not self.is_cacheable(tool_name):
+            return None
+        key = self.key(server, tool_name, arguments)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.stats_counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats_counters["hits"] += 1
+        return entry[1]
+
+    def put(self, server: str, tool_name: str, arguments: Optional[dict], value: Any, generation: int) -> None:
+        """Сохраняет результат, если с начала запроса (generation) кэш сервера не сбрасывался."""
+        if not self.is_cacheable(tool_name) or generation != self.generation(server):
+            return
+        size = len(value) if isinstance(value, str) else len(str(value))
+        if size > self.max_entry_chars:
+            # Например, get_mr_details с include_changes: кэш из таких записей съел бы всю память
+            self.stats_counters["too_large"] += 1
+            return
+        key = self.key(server, tool_name, arguments)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttls[tool_name], value, size)
+        self._chars += size
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            self._remove(next(iter(self._entries)))
+            self.stats_counters["evicted"] += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        self._chars -= self._entries.pop(key)[2]
+
+    def invalidate(self, server: str, tool_name: str, arguments: Optional[dict]) -> int:
+        """Сбрасывает записи, которые устаревают после вызова tool_name. Возвращает их число."""
+        if tool_name in CREDENTIAL_TOOLS:
+            scope = self.key(server, tool_name, arguments)[2]
+            stale = [k for k in self._entries if k[0] == server and k[2] == scope]
+        elif tool_name in INVALIDATES:
+            dependent = INVALIDATES[tool_name]
+            stale = [k for k in self._entries if k[0] == server and k[1] in dependent]
+        else:
+            return 0
+        self._generations[server] = self.generation(server) + 1
+        for key in stale:
+            self._remove(key)
+        if stale:
+            logger.info(f"{tool_name} invalidated {len(stale)} cached MCP results on {server}")
+        self.stats_counters["invalidated"] += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._chars = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.stats_counters["hits"] + self.stats_counters["misses"]
+        return {
+            "size": len(self._entries),
+            "chars": self._chars,
+            **self.stats_counters,
+            "hit_rate": round(self.stats_counters["hits"] / lookups, 3) if lookups else 0.0,
+        }
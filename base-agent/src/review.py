@@ -0,0 +1,302 @@
+"""Ревью merge request'ов: diff режется по файлам и hunk'ам, части проверяются параллельно (map) и сводятся в отчёт (reduce)."""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from tool_results import split_pages
+
+logger = logging.getLogger(__name__)
+
+MR_DETAILS_TOOL = "get_mr_details"
+
+# Ссылка на MR: https://gitlab.example.com/group/project/-/merge_requests/42
+_MR_URL = re.compile(r"https?://[^\s/]+/(?P<project>[\w.\-]+(?:/[\w.\-]+)+)/-/merge_requests/(?P<iid>\d+)")
+# Короткая ссылка GitLab: group/project!42
+_MR_REF = re.compile(r"(?<![\w/])(?P<project>[\w.\-]+(?:/[\w.\-]+)+)!(?P<iid>\d+)\b")
+_REVIEW_WORDS = re.compile(r"ревью|review|проверь\s+код|код[\s-]*ревью", re.IGNORECASE)
+
+NO_FINDINGS = "Замечаний нет"
+
+CHUNK_SYSTEM_PROMPT = (
+    "Ты опытный ревьюер кода. Тебе дана часть diff merge request'а. "
+    "Найди ошибки, уязвимости, проблемы производительности и сопровождаемости в изменённых строках. "
+    "Каждое замечание — одной строкой: `- [blocker|high|medium|low] путь:строка — суть и как исправить`. "
+    f"Не пересказывай изменения. Если замечаний нет, ответь ровно: {NO_FINDINGS}."
+)
+
+REDUCE_SYSTEM_PROMPT = (
+    "Ты готовишь итоговый отчёт code review. Тебе даны замечания по отдельным частям diff. "
+    "Убери дубликаты, сгруппируй по важности (сначала blocker и high), сохрани пути и строки. "
+    "Начни с краткого вывода: можно ли сливать MR. Не добавляй замечаний, которых нет во входных данных."
+)
+
+
+class ReviewUnavailable(Exception):
+    """Diff MR не удалось получить — запрос обрабатывает обычный агент."""
+
+
+@dataclass(frozen=True)
+class ReviewRequest:
+    project_path: str
+    mr_iid: int
+
+
+@dataclass(frozen=True)
+class DiffChunk:
+    """Часть diff одного файла; part/parts — номер части, если файл разрезан по hunk'ам."""
+
+    path: str
+    diff: str
+    part: int = 1
+    parts: int = 1
+
+    @property
+    def title(self) -> str:
+        return self.path if self.parts == 1 else f"{self.path} (часть {self.part}/{self.parts})"
+
+
+@dataclass(frozen=True)
+class ReviewUpdate:
+    """Элемент потока ревью: progress — событие, delta — часть отчёта, report — отчёт целиком."""
+
+    kind: str
+    text: str
+
+
+def parse_review_request(query: str) -> Optional[ReviewRequest]:
+    """Запрос на ревью: ссылка на MR (URL или group/project!iid) и слово «ревью»/«review»."""
+    if not _REVIEW_WORDS.search(query):
+        return None
+    match = _MR_URL.search(query) or _MR_REF.search(query)
+    if match is None:
+        return None
+    return ReviewRequest(match.group("project"), int(match.group("iid")))
+
+
+def split_hunks(diff: str) -> List[str]:
+    """Делит diff файла на hunk'и по заголовкам @@; строки до первого заголовка идут с первым hunk'ом."""
+    hunks: List[str] = []
+    current: List[str] = []
+    in_hunk = False
+    for line in diff.splitlines(keepends=True):
+        if line.startswith("@@"):
+            if in_hunk:
+                hunks.append("".join(current))
+                current = []
+            in_hunk = True
+        current.append(line)
+    if current:
+        hunks.append("".join(current))
+    return hunks
+
+
+def _file_chunks(diff: str, max_chars: int) -> List[str]:
+    """Группирует hunk'и файла в части не длиннее max_chars; огромный hunk режется по строкам."""
+    pieces: List[str] = []
+    for hunk in split_hunks(diff):
+        pieces.extend(split_pages(hunk, max_chars) if len(hunk) > max_chars else [hunk])
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_changes(changes: List[dict], max_chars: int) -> List[DiffChunk]:
+    """
+    Режет изменения MR (changes из get_mr_details) на части для ревью.
+
+    Маленький файл — одна часть, большой делится по границам hunk'ов, поэтому
+    время ревью определяется самой большой частью, а не размером всего MR.
+    Файлы без текстового diff (бинарные, только переименование) пропускаются.
+    """
+    chunks: List[DiffChunk] = []
+    for change in changes:
+        diff = change.get("diff") or ""
+        if not diff.strip():
+            continue
+        path = change.get("new_path") or change.get("old_path") or "?"
+        if change.get("deleted_file"):
+            path = f"{change.get('old_path') or path} (удалён)"
+        elif change.get("renamed_file") and change.get("old_path") not in (None, path):
+            path = f"{path} (было {change['old_path']})"
+        parts = _file_chunks(diff, max_chars)
+        chunks.extend(DiffChunk(path, part, index, len(parts)) for index, part in enumerate(parts, 1))
+    return chunks
+
+
+class ReviewPipeline:
+    """
+    Map-reduce ревью MR вместо одного хода AgentExecutor со всем diff.
+
+    Diff берётся у MCP инструмента get_mr_details (include_changes=true), режется
+    по файлам и hunk'ам (chunk_chars символов на часть), части проверяются LLM
+    параллельно — не больше max_parallel одновременно, — и замечания сводятся
+    в один отчёт, который отдаётся потоком.
+
+    MCP клиент выбирается bind() из текущего набора серверов; пока сервера
+    с get_mr_details нет, ревью выключено и запросы обрабатывает агент.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        mcp_client: Any,
+        max_parallel: int = 8,
+        chunk_chars: int = 12000,
+        max_chunks: int = 100,
+    ):
+        self.llm = llm
+        self.mcp_client = mcp_client
+        self.max_parallel = max(1, max_parallel)
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+        self.stats_counters: Dict[str, int] = {"reviews": 0, "chunks": 0, "failed_chunks": 0, "fallbacks": 0}
+
+    @classmethod
+    def from_env(cls, llm: BaseChatModel, discoveries: List[Any]) -> Optional["ReviewPipeline"]:
+        """
+        Создаёт пайплайн и привязывает его к MCP серверу с инструментом get_mr_details.
+        REVIEW_ENABLED=false отключает режим ревью.
+        """
+        if os.getenv("REVIEW_ENABLED", "true").lower() != "true":
+            return None
+        pipeline = cls(
+            llm,
+            None,
+            max_parallel=int(os.getenv("REVIEW_MAX_PARALLEL", 8)),
+            chunk_chars=int(os.getenv("REVIEW_CHUNK_CHARS", 12000)),
+            max_chunks=int(os.getenv("REVIEW_MAX_CHUNKS", 100)),
+        )
+        pipeline.bind(discoveries)
+        return pipeline
+
+    def bind(self, discoveries: List[Any]) -> None:
+        """Берёт клиент сервера с get_mr_details из актуального набора; вызывается и при обновлении инструментов."""
+        client = next(
+            (d.client for d in discoveries if d.ok and any(t["name"] == MR_DETAILS_TOOL for t in d.tools)),
+            None,
+        )
+        if client is not self.mcp_client:
+            if client is None:
+                logger.info(f"No MCP server provides {MR_DETAILS_TOOL}, review pipeline disabled")
+            else:
+                logger.info(f"Review pipeline uses {MR_DETAILS_TOOL} from {client.base_url}")
+        self.mcp_client = client
+
+    def match(self, query: str) -> Optional[ReviewRequest]:
+        if self.mcp_client is None:
+            return None
+        return parse_review_request(query)
+
+    async def fetch_changes(self, request: ReviewRequest, chat_id: str) -> dict:
+        """Детали MR с изменениями; ReviewUnavailable, если сервер вернул ошибку или не JSON."""
+        text = await self.mcp_client.call_tool(MR_DETAILS_TOOL, {
+            "chat_id": chat_id,
+            "project_path": request.project_path,
+            "mr_iid": request.mr_iid,
+            "include_changes": True,
+        })
+        try:
+            details = json.loads(text)
+        except (TypeError, ValueError):
+            self.stats_counters["fallbacks"] += 1
+            raise ReviewUnavailable(str(text)[:200])
+        if not isinstance(details, dict) or not isinstance(details.get("changes"), list):
+            self.stats_counters["fallbacks"] += 1
+            raise ReviewUnavailable("get_mr_details returned no changes")
+        return details
+
+    async def review(self, request: ReviewRequest, details: dict) -> AsyncGenerator[ReviewUpdate, None]:
+        """Проверяет части diff параллельно и сводит замечания в отчёт."""
+        started = time.perf_counter()
+        self.stats_counters["reviews"] += 1
+        mr = details.get("merge_request") or {}
+        header = f"MR !{request.mr_iid} «{mr.get('title', '')}» в {request.project_path}"
+
+        chunks = chunk_changes(details["changes"], self.chunk_chars)
+        if not chunks:
+            yield ReviewUpdate("report", f"{header}: в diff нет текстовых изменений для ревью.")
+            return
+        skipped = chunks[self.max_chunks:]
+        chunks = chunks[:self.max_chunks]
+        self.stats_counters["chunks"] += len(chunks)
+        files = len({chunk.path for chunk in chunks})
+        yield ReviewUpdate("progress", f"Ревью {header}: {files} файлов, {len(chunks)} частей\n")
+
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        tasks = [asyncio.ensure_future(self._review_chunk(i, chunk, semaphore)) for i, chunk in enumerate(chunks)]
+        findings: List[str] = [NO_FINDINGS] * len(chunks)
+        try:
+            # Прогресс отдаётся по мере готовности частей, а не в порядке файлов
+            for done, future in enumerate(asyncio.as_completed(tasks), 1):
+                index, text = await future
+                findings[index] = text
+                yield ReviewUpdate("progress", f"Проверено: {chunks[index].title} ({done}/{len(chunks)})\n")
+        finally:
+            for task in tasks:
+                task.cancel()
+        logger.info(f"Reviewed {len(chunks)} chunks of {header} in {time.perf_counter() - started:.2f}s")
+
+        report = ""
+        async for delta in self._reduce(header, list(zip(chunks, findings)), skipped):
+            report += delta
+            yield ReviewUpdate("delta", delta)
+        yield ReviewUpdate("report", report)
+
+    async def _review_chunk(self, index: int, chunk: DiffChunk, semaphore: asyncio.Semaphore) -> Tuple[int, str]:
+        async with semaphore:
+            try:
+                message = await self.llm.ainvoke([
+                    SystemMessage(content=CHUNK_SYSTEM_PROMPT),
+                    HumanMessage(content=f"Файл: {chunk.title}\n\n```diff\n{chunk.diff}\n```"),
+                ])
+                return index, str(message.content).strip() or NO_FINDINGS
+            except Exception as e:
+                # Одна неудачная часть не должна срывать ревью всего MR
+                logger.warning(f"Review of {chunk.title} failed: {e}")
+                self.stats_counters["failed_chunks"] += 1
+                return index, f"Не удалось проверить: {e}"
+
+    async def _reduce(
+        self, header: str, findings: List[Tuple[DiffChunk, str]], skipped: List[DiffChunk]
+    ) -> AsyncGenerator[str, None]:
+        sections = [f"### {chunk.title}\n{text}" for chunk, text in findings if text != NO_FINDINGS]
+        if skipped:
+            sections.append(f"Не проверено из-за лимита REVIEW_MAX_CHUNKS: {len(skipped)} частей "
+                            f"({', '.join(sorted({c.path for c in skipped}))})")
+        if not sections:
+            yield f"{header}: проверено {len(findings)} частей, {NO_FINDINGS.lower()}."
+            return
+        prompt = f"{header}\n\nЗамечания по частям diff:\n\n" + "\n\n".join(sections)
+        streamed = False
+        try:
+            async for chunk in self.llm.astream([
+                SystemMessage(content=REDUCE_SYSTEM_PROMPT),
+                HumanMessage(content=prompt),
+            ]):
+                if isinstance(chunk.content, str) and chunk.content:
+                    streamed = True
+                    yield chunk.content
+        except Exception as e:
+            if streamed:
+                raise
+            # Сводка не удалась — отдаём замечания по частям как есть
+            logger.warning(f"Review reduce step failed, returning raw findings: {e}")
+            yield prompt
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.stats_counters)
@@ -0,0 +1,170 @@
+"""Планировщик запусков агента: очередь на контекст и справедливые лимиты параллелизма."""
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Set
+
+
+class SchedulerRejected(Exception):
+    """Запрос отклонён: очередь переполнена."""
+
+
+class _Waiter:
+    __slots__ = ("context_id", "user_id", "future", "enqueued_at")
+
+    def __init__(self, context_id: str, user_id: str, future: asyncio.Future):
+        self.context_id = context_id
+        self.user_id = user_id
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class ContextScheduler:
+    """
+    Выдаёт слоты на запуск агента.
+
+    - В одном context_id одновременно выполняется не больше одного запуска,
+      следующие сообщения ждут в очереди контекста в порядке поступления.
+    - Общее число запусков ограничено max_concurrent, запусков одного
+      пользователя — max_per_user.
+    - Освободившийся слот получает следующий по кругу контекст (round-robin),
+      поэтому активный групповой чат не вытесняет остальных.
+    - Если очередь контекста или общая очередь заполнена, запрос отклоняется
+      с SchedulerRejected.
+
+    Значение 0 отключает соответствующий лимит.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_per_user: int = 2,
+        max_queue_per_context: int = 5,
+        max_queued_total: int = 100,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue_per_context = max_queue_per_context
+        self.max_queued_total = max_queued_total
+        # Порядок ключей — порядок обхода round-robin
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        # Очереди контекстов, у которых сейчас идёт запуск
+        self._parked: Dict[str, Deque[_Waiter]] = {}
+        self._running_contexts: Set[str] = set()
+        self._running_per_user: Counter = Counter()
+        self._running = 0
+        self._waiting = 0
+        self._granted = 0
+        self._rejected = 0
+        self._max_wait = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ContextScheduler":
+        return cls(
+            max_concurrent=int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", 8)),
+            max_per_user=int(os.getenv("AGENT_MAX_RUNS_PER_USER", 2)),
+            max_queue_per_context=int(os.getenv("AGENT_MAX_QUEUE_PER_CONTEXT", 5)),
+            max_queued_total=int(os.getenv("AGENT_MAX_QUEUED_TOTAL", 100)),
+        )
+
+    def _can_run(self, waiter: _Waiter) -> bool:
+        return (
+            waiter.context_id not in self._running_contexts
+            and (not self.max_concurrent or self._running < self.max_concurrent)
+            and (not self.max_per_user or self._running_per_user[waiter.user_id] < self.max_per_user)
+        )
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self._running += 1
+        self._running_contexts.add(waiter.context_id)
+        self._running_per_user[waiter.user_id] += 1
+        self._granted += 1
+        self._max_wait = max(self._max_wait, time.monotonic() - waiter.enqueued_at)
+        waiter.future.set_result(None)
+
+    def _dispatch(self) -> None:
+        """Раздаёт свободные слоты ожидающим контекстам по кругу."""
+        for context_id in list(self._queues):
+            if self.max_concurrent and self._running >= self.max_concurrent:
+                return
+            queue = self._queues[context_id]
+            self._drop_cancelled(queue)
+            if queue and self._can_run(queue[0]):
+                self._waiting -= 1
+                self._grant(queue.popleft())
+                # Пока контекст выполняется, его очередь стоит вне круга и
+                # возвращается в конец круга только после release
+                del self._queues[context_id]
+                if queue:
+                    self._parked[context_id] = queue
+            elif not queue:
+                del self._queues[context_id]
+
+    def _drop_cancelled(self, queue: Deque[_Waiter]) -> None:
+        while queue and queue[0].future.done():
+            queue.popleft()
+            self._waiting -= 1
+
+    def _release(self, context_id: str, user_id: str) -> None:
+        self._running -= 1
+        self._running_contexts.discard(context_id)
+        self._running_per_user[user_id] -= 1
+        if self._running_per_user[user_id] <= 0:
+            del self._running_per_user[user_id]
+        queue = self._parked.pop(context_id, None)
+        if queue:
+            self._queues[context_id] = queue
+        self._dispatch()
+
+    async def acquire(self, context_id: str, user_id: Optional[str] = None) -> None:
+        """Ждёт слот для запуска в контексте; после работы нужно вызвать release."""
+        user_id = user_id or context_id
+        queue = self._queues.get(context_id) or self._parked.get(context_id)
+        if self.max_queue_per_context and queue is not None and len(queue) >= self.max_queue_per_context:
+            self._rejected += 1
+            raise SchedulerRejected(
+                f"Слишком много сообщений в очереди этого чата ({len(queue)}), дождитесь ответа на предыдущие"
+            )
+        if self.max_queued_total and self._waiting >= self.max_queued_total:
+            self._rejected += 1
+            raise SchedulerRejected("Агент перегружен, попробуйте ещё раз через минуту")
+
+        waiter = _Waiter(context_id, user_id, asyncio.get_running_loop().create_future())
+        if context_id in self._running_contexts:
+            self._parked.setdefault(context_id, deque()).append(waiter)
+        else:
+            self._queues.setdefault(context_id, deque()).append(waiter)
+        self._waiting += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже выдан, но ждущий отменён — возвращаем слот
+                self._release(context_id, user_id)
+            else:
+                self._dispatch()
+            raise
+
+    def release(self, context_id: str, user_id: Optional[str] = None) -> None:
+        self._release(context_id, user_id or context_id)
+
+    @asynccontextmanager
+    async def slot(self, context_id: str, user_id: Optional[str] = None) -> AsyncIterator[None]:
+        await self.acquire(context_id, user_id)
+        try:
+            yield
+        finally:
+            self.release(context_id, user_id)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "waiting_contexts": len(self._queues) + len(self._parked),
+            "granted": self._granted,
+            "rejected": self._rejected,
+            "max_wait_seconds": round(self._max_wait, 3),
+        }
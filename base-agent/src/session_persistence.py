@@ -0,0 +1,397 @@
+"""Внешние хранилища истории сессий (SQLite, Redis) с пакетной записью."""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from session_store import HistoryMessage, InMemorySessionStore, SessionStore
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentSessionStore(SessionStore):
+    """
+    Базовый класс хранилища, сохраняющего сессии во внешний backend.
+
+    Рабочая копия сессий живёт в InMemorySessionStore (с теми же лимитами).
+    Запись не блокирует запрос: изменённая сессия помечается «грязной» вместе
+    со снимком, а фоновая задача раз в flush_interval (или при накоплении
+    batch_size сессий) сохраняет все снимки одной пачкой. Несколько изменений
+    одной сессии между сбросами схлопываются в одну запись.
+
+    Чтение истории сессии без несохранённых изменений идёт в backend, чтобы
+    реплики агента за балансировщиком видели ответы друг друга.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[InMemorySessionStore] = None,
+        flush_interval: float = 0.5,
+        batch_size: int = 100,
+    ):
+        self.cache = cache or InMemorySessionStore.from_env()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # session_id -> снимок для записи (None — удалить сессию)
+        self._dirty: Dict[str, Optional[dict]] = {}
+        # session_id -> число идущих записей: backend ещё может отдать старый снимок
+        self._saving: Dict[str, int] = {}
+        self._flush_now = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._flushes = 0
+        self._flushed_sessions = 0
+        self._loads = 0
+        self._errors = 0
+
+    @abstractmethod
+    async def _load(self, session_id: str) -> Optional[dict]:
+        """Читает снимок сессии из backend."""
+
+    @abstractmethod
+    async def _save_batch(self, batch: Dict[str, Optional[dict]]) -> None:
+        """Сохраняет пачку снимков (None — удалить) в backend."""
+
+    async def _close_backend(self) -> None:
+        pass
+
+    async def _refresh(self, session_id: str) -> None:
+        if session_id in self._dirty or session_id in self._saving:
+            # Локальная копия новее сохранённой (или её запись ещё не завершилась)
+            return
+        try:
+            snapshot = await self._load(session_id)
+            self._loads += 1
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Failed to load session {session_id}, using local copy: {e}")
+            return
+        if snapshot is None:
+            # Сессия удалена или истекла в backend (например, другой репликой)
+            await self.cache.clear(session_id)
+        else:
+            self.cache.restore(session_id, snapshot)
+
+    def _mark_dirty(self, session_id: str, snapshot: Optional[dict]) -> None:
+        self._dirty[session_id] = snapshot
+        if len(self._dirty) >= self.batch_size:
+            self._flush_now.set()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._dirty and not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Сохраняет все накопленные изменения одной пачкой."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        for session_id in batch:
+            self._saving[session_id] = self._saving.get(session_id, 0) + 1
+        saved = False
+        try:
+            await self._save_batch(batch)
+            saved = True
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Failed to persist {len(batch)} sessions, will retry: {e}")
+        finally:
+            if not saved:
+                # Пачка возвращается и при отмене задачи, иначе изменения потеряются
+                for session_id, snapshot in batch.items():
+                    # Более свежие изменения, пришедшие во время записи, важнее
+                    self._dirty.setdefault(session_id, snapshot)
+            for session_id in batch:
+                left = self._saving[session_id] - 1
+                if left:
+                    self._saving[session_id] = left
+                else:
+                    del self._saving[session_id]
+        if not saved:
+            return
+        self._flushes += 1
+        self._flushed_sessions += len(batch)
+
+    async def get_history(self, session_id: str) -> List[HistoryMessage]:
+        await self._refresh(session_id)
+        return await self.cache.get_history(session_id)
+
+    async def get_summary(self, session_id: str) -> Optional[str]:
+        # Вызывается сразу после get_history, поэтому читаем уже обновлённую локальную копию
+        return await self.cache.get_summary(session_id)
+
+    async def append_turn(self, session_id: str, human: str, assistant: str) -> None:
+        await self.cache.append_turn(session_id, human, assistant)
+        self._mark_dirty(session_id, self.cache.snapshot(session_id))
+
+    async def compact(self, session_id: str, summary: str, covered: List[HistoryMessage]) -> None:
+        await self.cache.compact(session_id, summary, covered)
+        snapshot = self.cache.snapshot(session_id)
+        if snapshot is not None:
+            self._mark_dirty(session_id, snapshot)
+
+    async def clear(self, session_id: str) -> None:
+        await self.cache.clear(session_id)
+        self._mark_dirty(session_id, None)
+
+    async def aclose(self) -> None:
+        # Идущую запись не отменяем, а дожидаемся: фоновый цикл завершится после неё
+        self._closing = True
+        self._flush_now.set()
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        await self._close_backend()
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.cache.stats())
+        stats.update({
+            "pending_writes": len(self._dirty),
+            "flushes": self._flushes,
+            "flushed_sessions": self._flushed_sessions,
+            "backend_loads": self._loads,
+            "backend_errors": self._errors,
+        })
+        return stats
+
+
+class SqliteSessionStore(PersistentSessionStore):
+    """Сессии в локальном SQLite файле (WAL); запросы выполняются в пуле потоков."""
+
+    def __init__(self, path: str, ttl: float = 86400.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _load_sync(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if self.ttl and updated_at < time.time() - self.ttl:
+            return None
+        return json.loads(data)
+
+    def _save_batch_sync(self, batch: Dict[str, Optional[dict]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for session_id, snapshot in batch.items():
+                    if snapshot is None:
+                        self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                            (session_id, json.dumps(snapshot, ensure_ascii=False), now),
+                        )
+                if self.ttl:
+                    self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def _load(self, session_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._load_sync, session_id)
+
+    async def _save_batch(self, batch: Dict[str, Optional[dict]]) -> None:
+        await asyncio.to_thread(self._save_batch_sync, batch)
+
+    def _close_sync(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def _close_backend(self) -> None:
+        await asyncio.to_thread(self._close_sync)
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул Redis-совместимый сервер."""
+
+
+class RespClient:
+    """Минимальный клиент протокола Redis (RESP2) поверх asyncio streams, с пайплайнингом."""
+
+    def __init__(self, host: str, port: int = 6379, password: Optional[str] = None, db: int = 0, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RespClient":
+        """redis://[:password@]host[:port][/db]"""
+        parts = urlsplit(url)
+        db = parts.path.lstrip("/")
+        return cls(
+            parts.hostname or "localhost",
+            parts.port or 6379,
+            password=unquote(parts.password) if parts.password else None,
+            db=int(db) if db else 0,
+        )
+
+    @staticmethod
+    def _encode(command: Sequence) -> bytes:
+        out = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            return RespError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+    async def _roundtrip(self, commands: List[Sequence]) -> list:
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await self._roundtrip(setup):
+                if isinstance(reply, RespError):
+                    raise reply
+
+    async def pipeline(self, commands: List[Sequence]) -> list:
+        """Отправляет команды одной пачкой и возвращает ответы; ошибка любой команды поднимается."""
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(self._roundtrip(commands), self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                # Соединение в неизвестном состоянии — переподключимся при следующем вызове
+                await self._reset()
+                raise
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def execute(self, *command):
+        return (await self.pipeline([command]))[0]
+
+    async def _reset(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            await self._reset()
+
+
+class RedisSessionStore(PersistentSessionStore):
+    """Сессии в Redis-совместимом хранилище: один ключ на сессию, TTL через EX."""
+
+    def __init__(self, url: str, ttl: float = 86400.0, key_prefix: str = "agent:session:", **kwargs):
+        super().__init__(**kwargs)
+        self.client = RespClient.from_url(url)
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}"
+
+    async def _load(self, session_id: str) -> Optional[dict]:
+        raw = await self.client.execute("GET", self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    async def _save_batch(self, batch: Dict[str, Optional[dict]]) -> None:
+        commands: List[Tuple] = []
+        for session_id, snapshot in batch.items():
+            if snapshot is None:
+                commands.append(("DEL", self._key(session_id)))
+            elif self.ttl:
+                data = json.dumps(snapshot, ensure_ascii=False)
+                commands.append(("SET", self._key(session_id), data, "EX", int(self.ttl)))
+            else:
+                commands.append(("SET", self._key(session_id), json.dumps(snapshot, ensure_ascii=False)))
+        await self.client.pipeline(commands)
+
+    async def _close_backend(self) -> None:
+        await self.client.aclose()
+
+
+def create_session_store() -> SessionStore:
+    """Создаёт хранилище сессий по SESSION_STORE (memory | sqlite | redis)."""
+    kind = os.getenv("SESSION_STORE", "memory").lower()
+    if kind == "memory":
+        return InMemorySessionStore.from_env()
+
+    options = {
+        "ttl": float(os.getenv("SESSION_TTL_SECONDS", 86400)),
+        "flush_interval": float(os.getenv("SESSION_FLUSH_INTERVAL", 0.5)),
+        "batch_size": int(os.getenv("SESSION_FLUSH_BATCH_SIZE", 100)),
+    }
+    if kind == "sqlite":
+        path = os.getenv("SESSION_SQLITE_PATH", "/app/.data/sessions.db")
+        logger.info(f"Using SQLite session store at {path}")
+        return SqliteSessionStore(path, **options)
+    if kind == "redis":
+        url = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+        logger.info(f"Using Redis session store at {urlsplit(url).hostname}")
+        return RedisSessionStore(url, **options)
+    raise ValueError(f"Unknown SESSION_STORE: {kind}")
@@ -0,0 +1,224 @@
+"""Хранилища истории диалогов агента."""
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Реплика истории в формате LangChain: ("human" | "assistant", текст)
+HistoryMessage = Tuple[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~4 символа на токен) без загрузки токенизатора."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+class SessionStore(ABC):
+    """
+    Интерфейс хранилища истории сессий (context_id -> список реплик).
+    Методы асинхронные, чтобы реализации могли ходить во внешние хранилища.
+    """
+
+    @abstractmethod
+    async def get_history(self, session_id: str) -> List[HistoryMessage]:
+        """Возвращает копию истории сессии (пустой список для новой сессии)."""
+
+    @abstractmethod
+    async def append_turn(self, session_id: str, human: str, assistant: str) -> None:
+        """Добавляет в историю пару реплик пользователь/агент."""
+
+    @abstractmethod
+    async def get_summary(self, session_id: str) -> Optional[str]:
+        """Возвращает краткое содержание уже сжатой части диалога."""
+
+    @abstractmethod
+    async def compact(self, session_id: str, summary: str, covered: List[HistoryMessage]) -> None:
+        """
+        Заменяет самые старые реплики сессии кратким содержанием.
+        Удаляются только реплики из начала истории, совпадающие с covered.
+        """
+
+    @abstractmethod
+    async def clear(self, session_id: str) -> None:
+        """Удаляет историю сессии."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Статистика хранилища для мониторинга."""
+
+    async def aclose(self) -> None:
+        """Освобождает ресурсы хранилища."""
+
+
+def pair_turns(history: List[HistoryMessage]) -> List[Tuple[str, str]]:
+    """Собирает плоскую историю [("human", q), ("assistant", a), ...] в пары (q, a)."""
+    return [(history[i][1], history[i + 1][1]) for i in range(0, len(history) - 1, 2)]
+
+
+class _Session:
+    __slots__ = ("turns", "tokens", "chars", "touched_at", "summary")
+
+    def __init__(self):
+        self.turns: Deque[Tuple[str, str]] = deque()
+        self.summary: Optional[str] = None
+        self.tokens = 0
+        self.chars = 0
+        self.touched_at = time.monotonic()
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Хранилище сессий в памяти процесса с ограничениями:
+
+    - max_sessions: при превышении вытесняется давно не использованная сессия (LRU);
+    - ttl: сессии без активности дольше ttl секунд удаляются;
+    - max_turns / max_tokens: у каждой сессии хранятся только последние ходы,
+      укладывающиеся в лимиты (последний ход сохраняется всегда).
+
+    Значение 0 отключает соответствующее ограничение.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl: float = 86400.0,
+        max_turns: int = 50,
+        max_tokens: int = 8000,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+        self._trimmed_turns = 0
+
+    @classmethod
+    def from_env(cls) -> "InMemorySessionStore":
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 1000)),
+            ttl=float(os.getenv("SESSION_TTL_SECONDS", 86400)),
+            max_turns=int(os.getenv("SESSION_MAX_TURNS", 50)),
+            max_tokens=int(os.getenv("SESSION_MAX_TOKENS", 8000)),
+        )
+
+    def _evict_expired(self) -> None:
+        if not self.ttl:
+            return
+        deadline = time.monotonic() - self.ttl
+        # Сессии упорядочены по времени последнего обращения — просроченные в начале
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.touched_at > deadline:
+                break
+            del self._sessions[session_id]
+            self._evicted_ttl += 1
+
+    def _touch(self, session_id: str, create: bool) -> Optional[_Session]:
+        self._evict_expired()
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = _Session()
+            while self.max_sessions and len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                self._evicted_lru += 1
+                logger.debug(f"Evicted least recently used session {evicted_id}")
+        else:
+            self._sessions.move_to_end(session_id)
+        session.touched_at = time.monotonic()
+        return session
+
+    @staticmethod
+    def _pop_oldest(session: _Session) -> None:
+        human, assistant = session.turns.popleft()
+        session.tokens -= estimate_tokens(human) + estimate_tokens(assistant)
+        session.chars -= len(human) + len(assistant)
+
+    def _trim(self, session: _Session) -> None:
+        while len(session.turns) > 1 and (
+            (self.max_turns and len(session.turns) > self.max_turns)
+            or (self.max_tokens and session.tokens > self.max_tokens)
+        ):
+            self._pop_oldest(session)
+            self._trimmed_turns += 1
+
+    async def get_history(self, session_id: str) -> List[HistoryMessage]:
+        session = self._touch(session_id, create=False)
+        if session is None:
+            return []
+        history: List[HistoryMessage] = []
+        for human, assistant in session.turns:
+            history.append(("human", human))
+            history.append(("assistant", assistant))
+        return history
+
+    async def append_turn(self, session_id: str, human: str, assistant: str) -> None:
+        session = self._touch(session_id, create=True)
+        session.turns.append((human, assistant))
+        session.tokens += estimate_tokens(human) + estimate_tokens(assistant)
+        session.chars += len(human) + len(assistant)
+        self._trim(session)
+
+    async def get_summary(self, session_id: str) -> Optional[str]:
+        session = self._sessions.get(session_id)
+        return session.summary if session else None
+
+    async def compact(self, session_id: str, summary: str, covered: List[HistoryMessage]) -> None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        turns = pair_turns(covered)
+        head = list(session.turns)[:len(turns)]
+        # Начало covered могло уже уйти при обрезке по max_turns/max_tokens:
+        # удаляем ту часть covered, которая ещё лежит в начале истории
+        for start in range(len(turns)):
+            remaining = turns[start:]
+            if head[:len(remaining)] == remaining:
+                for _ in remaining:
+                    self._pop_oldest(session)
+                break
+        session.summary = summary
+
+    async def clear(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def snapshot(self, session_id: str) -> Optional[dict]:
+        """Сериализуемый снимок сессии {turns, summary} или None, если сессии нет."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return {"turns": [list(turn) for turn in session.turns], "summary": session.summary}
+
+    def restore(self, session_id: str, snapshot: dict) -> None:
+        """Заменяет содержимое сессии снимком (например, загруженным из внешнего хранилища)."""
+        session = self._touch(session_id, create=True)
+        session.turns.clear()
+        session.tokens = 0
+        session.chars = 0
+        for human, assistant in snapshot.get("turns", []):
+            session.turns.append((human, assistant))
+            session.tokens += estimate_tokens(human) + estimate_tokens(assistant)
+            session.chars += len(human) + len(assistant)
+        session.summary = snapshot.get("summary")
+        self._trim(session)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "turns": sum(len(s.turns) for s in self._sessions.values()),
+            "approx_tokens": sum(s.tokens for s in self._sessions.values()),
+            "history_chars": sum(
+                s.chars + len(s.summary or "") for s in self._sessions.values()
+            ),
+            "evicted_lru": self._evicted_lru,
+            "evicted_ttl": self._evicted_ttl,
+            "trimmed_turns": self._trimmed_turns,
+        }
@@ -0,0 +1,82 @@
+"""Single-flight: одинаковые одновременные вызовы MCP инструментов выполняются одним запросом."""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterable, Optional
+
+from result_cache import DEFAULT_TTLS
+
+logger = logging.getLogger(__name__)
+
+# Читающие инструменты: их одновременные одинаковые вызовы безопасно схлопывать
+READ_ONLY_TOOLS: FrozenSet[str] = frozenset(DEFAULT_TTLS)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные вызовы с одинаковым ключом в один.
+
+    Первый вызов запускает запрос отдельной задачей, следующие с тем же ключом
+    ждут её результата (или исключения). Отмена одного из ожидающих не прерывает
+    запрос для остальных; запрос отменяется, только когда его никто не ждёт.
+    Схлопываются только вызовы инструментов из tools — изменяющие всегда идут отдельно.
+    """
+
+    def __init__(self, tools: Iterable[str] = READ_ONLY_TOOLS):
+        self.tools = frozenset(tools)
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.stats_counters: Dict[str, int] = {"calls": 0, "upstream": 0, "collapsed": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["SingleFlight"]:
+        """MCP_SINGLE_FLIGHT_ENABLED=false выключает схлопывание; MCP_SINGLE_FLIGHT_TOOLS добавляет инструменты."""
+        if os.getenv("MCP_SINGLE_FLIGHT_ENABLED", "true").lower() != "true":
+            return None
+        extra = [name.strip() for name in os.getenv("MCP_SINGLE_FLIGHT_TOOLS", "").split(",") if name.strip()]
+        return cls(READ_ONLY_TOOLS | frozenset(extra))
+
+    def applies(self, tool_name: str) -> bool:
+        return tool_name in self.tools
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет factory() или присоединяется к уже идущему вызову с тем же ключом."""
+        self.stats_counters["calls"] += 1
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done() or flight.task.get_loop() is not asyncio.get_running_loop():
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._forget(k, f))
+            self.stats_counters["upstream"] += 1
+        else:
+            self.stats_counters["collapsed"] += 1
+            logger.debug(f"Collapsed concurrent call into in-flight request {key}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Результат больше никому не нужен
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Исключение уже получили ожидающие; без этого asyncio ругается в лог
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.stats_counters["calls"]
+        return {
+            "in_flight": len(self._flights),
+            **self.stats_counters,
+            "collapse_rate": round(self.stats_counters["collapsed"] / calls, 3) if calls else 0.0,
+        }
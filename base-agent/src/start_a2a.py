@@ -1,6 +1,7 @@
 """Точка входа для запуска LangChain агента через A2A протокол."""
 import os
 import logging
+from contextlib import asynccontextmanager
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
 from a2a.server.tasks import InMemoryTaskStore
@@ -9,10 +10,22 @@ from a2a.types import (
     AgentCard,
 )
 from phoenix.otel import register
+from starlette.responses import JSONResponse
+from starlette.routing import Route
 
-from agent import create_langchain_agent
+from agent import create_langchain_agent, create_llm, load_mcp_servers, tools_from_discoveries
 from a2a_wrapper import LangChainA2AWrapper
+from history import HistoryManager, LLMSummarizer
+from session_persistence import create_session_store
 from agent_task_manager import LangChainAgentExecutor
+from scheduler import ContextScheduler
+from mcp_client import MCPClient
+from result_cache import ToolResultCache
+from review import ReviewPipeline
+from single_flight import SingleFlight
+from tool_cache import ToolSchemaCache
+from tool_refresh import ToolSetRefresher
+from tool_results import ToolResultPager
 import uvicorn
 
 # Настройка логирования
@@ -35,15 +48,40 @@ def main():
                 auto_instrument=True
             )
         
-        # Создаем LangChain агента
+        # Результаты читающих инструментов кэшируются для всех MCP клиентов процесса
+        MCPClient.result_cache = ToolResultCache.from_env()
+        # Одинаковые одновременные вызовы читающих инструментов схлопываются в один запрос
+        # только в пределах одного чата: chat_id входит в ключ, учётные данные у чатов свои
+        MCPClient.single_flight = SingleFlight.from_env()
+
+        # Получаем инструменты MCP: из дискового кэша, если он есть, иначе по сети
         mcp_urls = os.getenv("MCP_URL")
-        agent_executor = create_langchain_agent(mcp_urls)
+        tool_cache = ToolSchemaCache.from_env()
+        mcp_servers = load_mcp_servers(mcp_urls, cache=tool_cache)
+
+        # Создаем LangChain агента
+        # Большие результаты инструментов агент читает постранично
+        result_pager = ToolResultPager.from_env()
+        agent_executor = create_langchain_agent(mcp_urls, tools=tools_from_discoveries(mcp_servers, result_pager))
         
-        # Создаем A2A обертку
-        agent_wrapper = LangChainA2AWrapper(agent_executor)
+        # Создаем A2A обертку: история сессий + окно по бюджету токенов с фоновым сжатием
+        session_store = create_session_store()
+        summarizer = None
+        if os.getenv('HISTORY_SUMMARY_ENABLED', 'true').lower() == 'true':
+            summarizer = LLMSummarizer(create_llm(temperature=0))
+        history_manager = HistoryManager.from_env(session_store, summarizer)
+        # Ревью MR: diff по частям параллельно, затем сводный отчёт
+        review_pipeline = ReviewPipeline.from_env(create_llm(temperature=0), mcp_servers)
+        agent_wrapper = LangChainA2AWrapper(
+            agent_executor, session_store, history_manager, review_pipeline=review_pipeline
+        )
+
+        # После старта сервера ревалидируем закэшированные инструменты в фоне
+        tool_refresher = ToolSetRefresher(agent_wrapper, mcp_servers, cache=tool_cache, pager=result_pager)
         
-        # Создаем A2A executor
-        agent_executor_a2a = LangChainAgentExecutor(agent_wrapper)
+        # Создаем A2A executor: очередь на контекст и лимиты параллельных запусков
+        scheduler = ContextScheduler.from_env()
+        agent_executor_a2a = LangChainAgentExecutor(agent_wrapper, scheduler)
         
         # Настройка AgentCard
         capabilities = AgentCapabilities(streaming=True)
@@ -70,9 +108,33 @@ def main():
             http_handler=request_handler
         )
         
+        # Статистика для мониторинга (сессии, очереди и т.п.)
+        async def stats(request):
+            return JSONResponse({
+                **agent_wrapper.stats(),
+                "scheduler": scheduler.stats(),
+                "idempotency": agent_executor_a2a.idempotency.stats(),
+                "tool_results": MCPClient.result_cache.stats() if MCPClient.result_cache else None,
+                "tool_single_flight": MCPClient.single_flight.stats() if MCPClient.single_flight else None,
+            })
+
+        @asynccontextmanager
+        async def lifespan(app):
+            async with tool_refresher.lifespan(app):
+                try:
+                    yield
+                finally:
+                    await history_manager.aclose()
+                    await session_store.aclose()
+
+        app = server.build(
+            lifespan=lifespan,
+            routes=[Route("/stats", stats, methods=["GET"])],
+        )
+
         port = int(os.getenv("PORT", 10000))
         logger.info(f"Starting LangChain Agent server on port {port}")
-        uvicorn.run(server.build(), host='0.0.0.0', port=port)
+        uvicorn.run(app, host='0.0.0.0', port=port)
         
     except Exception as e:
         logger.error(f'An error occurred during server startup: {e}', exc_info=True)
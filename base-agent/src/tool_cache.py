@@ -0,0 +1,90 @@
+"""Дисковый кэш списков инструментов MCP серверов для быстрого старта агента."""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ToolSchemaCache:
+    """
+    Хранит результат tools/list каждого MCP сервера в JSON файле.
+
+    Ключ записи — URL сервера и версия протокола MCP. Вместе со списком
+    инструментов сохраняются serverInfo и хэш листинга, по которому фоновая
+    ревалидация понимает, изменился ли набор инструментов.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def from_env(cls) -> Optional["ToolSchemaCache"]:
+        """Создаёт кэш по MCP_TOOL_CACHE_PATH; без переменной кэш выключен."""
+        path = os.getenv("MCP_TOOL_CACHE_PATH")
+        return cls(path) if path else None
+
+    @staticmethod
+    def listing_hash(tools: List[dict], server_info: Optional[dict] = None) -> str:
+        """Стабильный хэш листинга: не зависит от порядка ключей в схемах."""
+        canonical = json.dumps(
+            {"tools": tools, "serverInfo": server_info or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(url: str, protocol_version: str) -> str:
+        return f"{url}|{protocol_version}"
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable MCP tool cache {self.path}: {e}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def load(self, url: str, protocol_version: str) -> Optional[dict]:
+        """Возвращает запись {tools, server_info, hash, updated_at} или None."""
+        entry = self._read().get(self._key(url, protocol_version))
+        if not isinstance(entry, dict) or not isinstance(entry.get("tools"), list):
+            return None
+        if entry.get("hash") != self.listing_hash(entry["tools"], entry.get("server_info")):
+            logger.warning(f"MCP tool cache entry for {url} is corrupted, ignoring it")
+            return None
+        return entry
+
+    def store(self, url: str, protocol_version: str, tools: List[dict], server_info: Optional[dict] = None) -> str:
+        """Сохраняет листинг сервера и возвращает его хэш. Файл заменяется атомарно."""
+        listing_hash = self.listing_hash(tools, server_info)
+        data = self._read()
+        key = self._key(url, protocol_version)
+        if data.get(key, {}).get("hash") == listing_hash:
+            return listing_hash
+
+        data[key] = {
+            "tools": tools,
+            "server_info": server_info or {},
+            "hash": listing_hash,
+            "updated_at": time.time(),
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mcp_tools.", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Failed to write MCP tool cache {self.path}: {e}")
+        return listing_hash
@@ -0,0 +1,187 @@
+"""Фоновое обновление инструментов MCP и горячая замена AgentExecutor."""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+from a2a_wrapper import LangChainA2AWrapper
+from agent import (
+    MCPServerDiscovery,
+    create_langchain_agent,
+    discover_mcp_server,
+    log_discovery_summary,
+    tools_from_discoveries,
+)
+from mcp_client import MCPClient
+from tool_cache import ToolSchemaCache
+from tool_results import ToolResultPager
+
+logger = logging.getLogger(__name__)
+
+TOOLS_LIST_CHANGED = "notifications/tools/list_changed"
+
+
+def diff_tool_listings(old: List[dict], new: List[dict]) -> Tuple[List[str], List[str], List[str]]:
+    """Сравнивает два листинга tools/list и возвращает (добавленные, удалённые, изменённые) имена."""
+    old_by_name = {tool["name"]: tool for tool in old}
+    new_by_name = {tool["name"]: tool for tool in new}
+    added = [name for name in new_by_name if name not in old_by_name]
+    removed = [name for name in old_by_name if name not in new_by_name]
+    changed = [
+        name for name, tool in new_by_name.items()
+        if name in old_by_name and old_by_name[name] != tool
+    ]
+    return added, removed, changed
+
+
+class ToolSetRefresher:
+    """
+    Держит актуальный набор MCP инструментов агента.
+
+    Списки инструментов перезапрашиваются в фоне: сразу после старта, если агент
+    поднят из дискового кэша или часть серверов была недоступна; затем раз в
+    MCP_TOOLS_REFRESH_INTERVAL секунд и по уведомлению notifications/tools/list_changed
+    от серверов, которые его поддерживают. При изменении листинга собирается новый
+    AgentExecutor и атомарно подменяется в LangChainA2AWrapper — уже запущенные
+    запросы дорабатывают со старым.
+    """
+
+    def __init__(
+        self,
+        agent_wrapper: LangChainA2AWrapper,
+        servers: List[MCPServerDiscovery],
+        cache: Optional[ToolSchemaCache] = None,
+        timeout: Optional[float] = None,
+        interval: Optional[float] = None,
+        pager: Optional[ToolResultPager] = None,
+    ):
+        self.agent = agent_wrapper
+        self.cache = cache
+        self.pager = pager
+        self.timeout = timeout if timeout is not None else float(os.getenv("MCP_DISCOVERY_TIMEOUT", 15))
+        self.interval = interval if interval is not None else float(os.getenv("MCP_TOOLS_REFRESH_INTERVAL", 300))
+        self._servers: Dict[str, MCPServerDiscovery] = {server.url: server for server in servers}
+        self._clients: Dict[str, MCPClient] = {
+            server.url: server.client or MCPClient(server.url) for server in servers
+        }
+        for client in self._clients.values():
+            client.add_notification_handler(self._on_notification)
+        self._lock = asyncio.Lock()
+        self._list_changed = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._listening: Set[str] = set()
+
+    @property
+    def needs_revalidation(self) -> bool:
+        return any(server.from_cache or not server.ok for server in self._servers.values())
+
+    def _on_notification(self, msg: dict) -> None:
+        if msg.get("method") == TOOLS_LIST_CHANGED:
+            self._list_changed.set()
+
+    async def refresh(self) -> bool:
+        """Перезапрашивает tools/list у всех серверов; возвращает True, если набор изменился."""
+        async with self._lock:
+            started = time.perf_counter()
+            discoveries = await asyncio.gather(*(
+                discover_mcp_server(url, self.timeout, self.cache, client=self._clients[url])
+                for url in self._servers
+            ))
+            log_discovery_summary(discoveries, time.perf_counter() - started)
+
+            changed = False
+            servers = []
+            for discovery in discoveries:
+                previous = self._servers[discovery.url]
+                if not discovery.ok:
+                    # Сервер недоступен — оставляем последний известный набор инструментов
+                    servers.append(previous)
+                    continue
+                if discovery.listing_hash != previous.listing_hash:
+                    added, removed, modified = diff_tool_listings(previous.tools, discovery.tools)
+                    logger.info(
+                        f"MCP tool listing changed for {discovery.url}: "
+                        f"added={added}, removed={removed}, changed={modified}"
+                    )
+                    changed = True
+                servers.append(discovery)
+
+            self._servers = {server.url: server for server in servers}
+            if self.agent.review is not None:
+                # Сервер с get_mr_details мог подняться или смениться после старта
+                self.agent.review.bind(servers)
+            if changed:
+                self._swap_agent(servers)
+            return changed
+
+    def _swap_agent(self, servers: List[MCPServerDiscovery]) -> None:
+        tools = tools_from_discoveries(servers, self.pager)
+        agent_executor = create_langchain_agent(tools=tools)
+        # Присваивание атомарно: новые запросы берут новый executor, текущие — дорабатывают со старым
+        self.agent.agent_executor = agent_executor
+        logger.info(f"Swapped agent tool set: {len(tools)} tools")
+
+    async def _revalidate(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Background MCP tool refresh failed: {e}", exc_info=True)
+
+    async def _watch(self) -> None:
+        """Обновляет инструменты по таймеру или по уведомлению list_changed."""
+        if self.needs_revalidation:
+            await self._revalidate()
+            self._start_listeners()
+
+        while True:
+            try:
+                await asyncio.wait_for(self._list_changed.wait(), timeout=self.interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._list_changed.clear()
+            await self._revalidate()
+            self._start_listeners()
+
+    def _start_listeners(self) -> None:
+        """Подписывается на уведомления серверов, которые объявили tools.listChanged."""
+        for url, client in self._clients.items():
+            if url in self._listening or not client.supports_tools_list_changed:
+                continue
+            self._listening.add(url)
+            self._tasks.append(asyncio.create_task(self._listen(client)))
+
+    async def _listen(self, client: MCPClient) -> None:
+        """Держит поток уведомлений сервера, переподключаясь с нарастающей паузой."""
+        delay = 1.0
+        while True:
+            try:
+                if not await client.listen_notifications():
+                    return
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"MCP notification stream for {client.base_url} dropped: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        """Lifespan для Starlette: фоновое обновление инструментов, закрытие клиентов на остановке."""
+        if self._servers:
+            self._tasks.append(asyncio.create_task(self._watch()))
+            self._start_listeners()
+        try:
+            yield
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks.clear()
+            self._listening.clear()
+            await asyncio.gather(
+                *(client.aclose() for client in self._clients.values()),
+                return_exceptions=True,
+            )
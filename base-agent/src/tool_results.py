@@ -0,0 +1,174 @@
+"""Результаты MCP инструментов с учётом размера: все части контента, бюджет и постраничное чтение."""
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+READ_RESULT_TOOL_NAME = "read_tool_result"
+
+# Сессия (A2A context_id), для которой сейчас работает агент: сохранённые страницы видны только ей
+_current_session: ContextVar[Optional[str]] = ContextVar("tool_result_session", default=None)
+
+
+@contextmanager
+def session_scope(session_id: str) -> Iterator[None]:
+    """Привязывает результаты инструментов, сохранённые внутри блока, к сессии."""
+    token = _current_session.set(session_id)
+    try:
+        yield
+    finally:
+        try:
+            _current_session.reset(token)
+        except ValueError:
+            # Async-генератор закрыли из другой задачи: её контекст и так не наш
+            pass
+
+
+def content_to_text(result: dict) -> str:
+    """
+    Собирает текст из всех частей content результата tools/call.
+
+    Текстовые части и встроенные текстовые ресурсы идут как есть, бинарные
+    (изображения, аудио, blob ресурсы) — короткой пометкой вместо base64.
+    """
+    content = result.get("content")
+    if not content:
+        return str(result)
+    texts: List[str] = []
+    for part in content:
+        if not isinstance(part, dict):
+            texts.append(str(part))
+            continue
+        kind = part.get("type")
+        if "text" in part:
+            texts.append(part["text"])
+        elif kind == "resource":
+            resource = part.get("resource") or {}
+            if "text" in resource:
+                texts.append(resource["text"])
+            else:
+                texts.append(f"[ресурс {resource.get('uri', '')} ({resource.get('mimeType', 'binary')})]")
+        elif kind == "resource_link":
+            texts.append(f"[ссылка на ресурс {part.get('uri', '')}]")
+        else:
+            size = len(part.get("data") or "")
+            texts.append(f"[{kind} {part.get('mimeType', '')}, {size} символов base64 опущено]")
+    return "\n".join(texts)
+
+
+def split_pages(text: str, page_chars: int) -> List[str]:
+    """Делит текст на страницы не длиннее page_chars, по возможности по границе строки."""
+    pages = []
+    start = 0
+    while start < len(text):
+        end = min(start + page_chars, len(text))
+        if end < len(text):
+            newline = text.rfind("\n", start, end)
+            if newline > start + page_chars // 2:
+                end = newline + 1
+        pages.append(text[start:end])
+        start = end
+    return pages
+
+
+class ReadToolResultInput(BaseModel):
+    handle: str = Field(description="Идентификатор результата из пометки об обрезке")
+    page: int = Field(default=2, description="Номер страницы, начиная с 1")
+
+
+class ToolResultPager:
+    """
+    Ограничивает размер результата инструмента, который попадает в контекст LLM.
+
+    Результат длиннее max_chars (≈ max_chars / 4 токенов) делится на страницы:
+    агент получает первую страницу и пометку с handle, по которому читает
+    остальные через инструмент read_tool_result. Полные результаты хранятся
+    ttl секунд, не больше max_entries штук (LRU), и читаются только из той
+    сессии (session_scope), в которой были получены.
+
+    Ограничивается только контекст LLM: ответ MCP сервера по-прежнему
+    читается и хранится целиком.
+    """
+
+    def __init__(self, max_chars: int = 16000, ttl: float = 1800.0, max_entries: int = 100):
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (сессия, handle) -> (срок хранения, инструмент, страницы)
+        self._results: "OrderedDict[Tuple[Optional[str], str], Tuple[float, str, List[str]]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> Optional["ToolResultPager"]:
+        """Создаёт пейджер по MCP_RESULT_MAX_CHARS; 0 отключает ограничение."""
+        max_chars = int(os.getenv("MCP_RESULT_MAX_CHARS", 16000))
+        if max_chars <= 0:
+            return None
+        return cls(
+            max_chars=max_chars,
+            ttl=float(os.getenv("MCP_RESULT_PAGE_TTL", 1800)),
+            max_entries=int(os.getenv("MCP_RESULT_MAX_STORED", 100)),
+        )
+
+    def fit(self, tool_name: str, text: str) -> str:
+        """Возвращает результат целиком или его первую страницу с пометкой о продолжении."""
+        if len(text) <= self.max_chars:
+            return text
+        pages = split_pages(text, self.max_chars)
+        handle = uuid4().hex[:12]
+        self._results[(_current_session.get(), handle)] = (time.monotonic() + self.ttl, tool_name, pages)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        logger.info(f"{tool_name} result of {len(text)} chars split into {len(pages)} pages, handle={handle}")
+        return self._with_notice(handle, pages, 1, len(text))
+
+    def read(self, handle: str, page: int = 2) -> str:
+        """Страница сохранённого результата текущей сессии."""
+        key = (_current_session.get(), handle)
+        entry = self._results.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._results.pop(key, None)
+            return f"Результат {handle} не найден или устарел — вызовите исходный инструмент снова."
+        _, _, pages = entry
+        if not 1 <= page <= len(pages):
+            return f"Страницы {page} нет: у результата {handle} страниц {len(pages)}."
+        self._results.move_to_end(key)
+        return self._with_notice(handle, pages, page, sum(len(p) for p in pages))
+
+    @staticmethod
+    def _with_notice(handle: str, pages: List[str], page: int, total_chars: int) -> str:
+        notice = f"[Страница {page} из {len(pages)}, всего {total_chars} символов."
+        if page < len(pages):
+            notice += f" Продолжение: {READ_RESULT_TOOL_NAME}(handle=\"{handle}\", page={page + 1})"
+        return f"{pages[page - 1]}\n{notice}]"
+
+    def as_tool(self) -> StructuredTool:
+        """LangChain инструмент для чтения страниц обрезанных результатов."""
+
+        def read_tool_result(handle: str, page: int = 2) -> str:
+            return self.read(handle, page)
+
+        async def aread_tool_result(handle: str, page: int = 2) -> str:
+            return self.read(handle, page)
+
+        return StructuredTool.from_function(
+            func=read_tool_result,
+            coroutine=aread_tool_result,
+            name=READ_RESULT_TOOL_NAME,
+            description=(
+                "Читает следующую страницу большого результата другого инструмента. "
+                "Используй handle и номер страницы из пометки об обрезке."
+            ),
+            args_schema=ReadToolResultInput,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"stored": len(self._results)}
@@ -0,0 +1,85 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from langchain_core.agents import AgentAction, AgentFinish  # noqa: E402  # isort: skip
+from langchain_core.language_models import GenericFakeChatModel  # noqa: E402  # isort: skip
+from langchain_core.messages import AIMessage  # noqa: E402  # isort: skip
+from langchain_core.runnables import RunnableLambda  # noqa: E402  # isort: skip
+from langchain_core.tools import StructuredTool  # noqa: E402  # isort: skip
+
+from a2a_wrapper import LangChainA2AWrapper  # noqa: E402  # isort: skip
+from agent import ConcurrentAgentExecutor  # noqa: E402  # isort: skip
+from session_store import InMemorySessionStore  # noqa: E402  # isort: skip
+
+ANSWER = "MR !42 готов к слиянию: пайплайн зелёный, замечаний нет"
+
+
+def make_executor() -> ConcurrentAgentExecutor:
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content=ANSWER)]))
+
+    async def get_mr(mr: int) -> str:
+        return f"mr-{mr}: ok"
+
+    tool = StructuredTool.from_function(coroutine=get_mr, name="get_mr_details", description="MR")
+
+    async def plan(inputs):
+        if not inputs["intermediate_steps"]:
+            return [AgentAction("get_mr_details", {"mr": 42}, "")]
+        message = await llm.ainvoke("summarize")
+        return AgentFinish({"output": message.content}, "")
+
+    return ConcurrentAgentExecutor(agent=RunnableLambda(plan), tools=[tool])
+
+
+class StreamTests(unittest.TestCase):
+    def collect(self, wrapper):
+        async def run():
+            return [item async for item in wrapper.stream("проверь MR 42", "chat")]
+
+        return asyncio.run(run())
+
+    def test_streams_tool_events_and_token_deltas(self):
+        store = InMemorySessionStore()
+        wrapper = LangChainA2AWrapper(
+            make_executor(), store, stream_flush_chars=10, stream_flush_interval=60
+        )
+
+        items = self.collect(wrapper)
+
+        events = [i["content"] for i in items if i["is_event"]]
+        self.assertEqual(
+            events,
+            ["Использую инструмент: get_mr_details\n", "Инструмент get_mr_details выполнен\n"],
+        )
+        deltas = [i["content"] for i in items if not i["is_event"] and not i["is_task_complete"]]
+        # Токены склеиваются в части, а не отправляются по одному
+        self.assertGreater(len(deltas), 1)
+        self.assertLess(len(deltas), len(ANSWER.split(" ")))
+        self.assertEqual("".join(deltas), ANSWER)
+
+        final = items[-1]
+        self.assertTrue(final["is_task_complete"])
+        self.assertFalse(final["is_error"])
+        self.assertEqual(final["content"], ANSWER)
+        history = asyncio.run(store.get_history("chat"))
+        self.assertEqual(history[-1], ("assistant", ANSWER))
+
+    def test_large_flush_threshold_sends_single_delta(self):
+        wrapper = LangChainA2AWrapper(
+            make_executor(), InMemorySessionStore(), stream_flush_chars=10_000, stream_flush_interval=60
+        )
+
+        deltas = [i for i in self.collect(wrapper) if not i["is_event"] and not i["is_task_complete"]]
+
+        self.assertEqual([d["content"] for d in deltas], [ANSWER])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -55,6 +55,37 @@ class AgentTests(unittest.TestCase):
         self.assertEqual(result, "simple:{'input': 'ping'}")
         self.assertEqual(tool.name, "simple")
 
+    def test_tools_run_natively_in_event_loop(self):
+        class LoopAwareClient(FakeMCPClient):
+            async def call_tool(self, name, arguments):
+                self.loop = asyncio.get_running_loop()
+                return await super().call_tool(name, arguments)
+
+        client = LoopAwareClient()
+        structured = agent.create_langchain_tool_from_mcp(
+            client,
+            {
+                "name": "demo",
+                "description": "demo tool",
+                "inputSchema": {"properties": {"count": {"type": "integer"}}},
+            },
+        )
+        simple = agent.create_langchain_tool_from_mcp(
+            client, {"name": "simple", "description": "", "inputSchema": {}}
+        )
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            first = await structured.ainvoke({"count": 3})
+            self.assertIs(client.loop, loop)
+            second = await simple.ainvoke("ping")
+            self.assertIs(client.loop, loop)
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, "demo:{'count': 3}")
+        self.assertEqual(second, "simple:{'input': 'ping'}")
+
     def test_get_mcp_tools_async_collects_from_urls(self):
         class FakeClientForList(FakeMCPClient):
             def __init__(self, url: str):
@@ -73,6 +104,36 @@ class AgentTests(unittest.TestCase):
         self.assertIn("tool-http://two", tool_names)
         self.assertEqual(len(tool_names), 2)
 
+    def test_get_mcp_tools_async_skips_slow_and_failing_servers(self):
+        closed = []
+
+        class FlakyClient(FakeMCPClient):
+            def __init__(self, url: str):
+                self.url = url
+
+            async def list_tools(self):
+                if self.url == "http://slow":
+                    await asyncio.sleep(1)
+                if self.url == "http://dead":
+                    raise ConnectionError("refused")
+                return [{"name": f"tool-{self.url}", "description": "", "inputSchema": {}}]
+
+            async def aclose(self):
+                closed.append(self.url)
+
+        async def run():
+            started = asyncio.get_running_loop().time()
+            tools = await agent.get_mcp_tools_async("http://slow, http://ok, http://dead", timeout=0.05)
+            return tools, asyncio.get_running_loop().time() - started
+
+        with patch("agent.MCPClient", FlakyClient), self.assertLogs("agent", level="WARNING") as logs:
+            tools, elapsed = asyncio.run(run())
+
+        self.assertEqual([tool.name for tool in tools], ["tool-http://ok"])
+        self.assertLess(elapsed, 0.5)
+        self.assertCountEqual(closed, ["http://slow", "http://dead"])
+        self.assertTrue(any("1/3 servers ok" in line for line in logs.output))
+
     def test_get_mcp_tools_none_returns_empty(self):
         self.assertEqual(agent.get_mcp_tools(None), [])
 
@@ -84,7 +145,7 @@ class AgentTests(unittest.TestCase):
         with patch("agent.ChatOpenAI", return_value=fake_llm) as chat_cls, \
              patch("agent.get_mcp_tools", return_value=["tool-a"]) as get_tools, \
              patch("agent.create_openai_tools_agent", return_value=fake_core_agent) as create_agent, \
-             patch("agent.AgentExecutor", return_value=fake_executor) as executor_cls:
+             patch("agent.ConcurrentAgentExecutor", return_value=fake_executor) as executor_cls:
 
             result = agent.create_langchain_agent("http://dummy")
 
@@ -103,7 +164,7 @@ class AgentTests(unittest.TestCase):
              patch("agent.ChatOpenAI", return_value=fake_llm) as chat_cls, \
              patch("agent.get_mcp_tools", return_value=[]) as get_tools, \
              patch("agent.create_openai_tools_agent", return_value=fake_core_agent) as create_agent, \
-             patch("agent.AgentExecutor", return_value=fake_executor):
+             patch("agent.ConcurrentAgentExecutor", return_value=fake_executor):
 
             agent.create_langchain_agent(None)
 
@@ -112,6 +173,43 @@ class AgentTests(unittest.TestCase):
         self.assertEqual(kwargs["model"], "openai/gpt-oss-120b")
         get_tools.assert_called_once_with(None)
 
+    def test_concurrent_executor_caps_parallel_tool_calls(self):
+        from langchain_core.agents import AgentAction, AgentFinish
+        from langchain_core.runnables import RunnableLambda
+
+        state = {"active": 0, "peak": 0}
+
+        async def slow_tool(mr: int) -> str:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            # Первые MR отвечают дольше — порядок наблюдений всё равно должен сохраниться
+            await asyncio.sleep(0.01 * (5 - mr))
+            state["active"] -= 1
+            return f"mr-{mr}"
+
+        tool = agent.StructuredTool.from_function(
+            coroutine=slow_tool, name="get_mr", description="MR details"
+        )
+
+        def plan(inputs):
+            if inputs["intermediate_steps"]:
+                return AgentFinish({"output": "done"}, "")
+            return [AgentAction("get_mr", {"mr": i}, "") for i in range(1, 5)]
+
+        executor = agent.ConcurrentAgentExecutor(
+            agent=RunnableLambda(plan),
+            tools=[tool],
+            max_concurrent_tool_calls=2,
+            return_intermediate_steps=True,
+        )
+
+        result = asyncio.run(executor.ainvoke({"input": "review"}))
+
+        self.assertEqual(result["output"], "done")
+        observations = [step[1] for step in result["intermediate_steps"]]
+        self.assertEqual(observations, ["mr-1", "mr-2", "mr-3", "mr-4"])
+        self.assertEqual(state["peak"], 2)
+
     def test_create_langchain_tool_from_mcp_error_returns_string(self):
         class FailingClient(FakeMCPClient):
             async def call_tool(self, name, arguments):
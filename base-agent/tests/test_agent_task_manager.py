@@ -0,0 +1,265 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from a2a.server.agent_execution import RequestContext  # noqa: E402  # isort: skip
+from a2a.server.events import EventQueue  # noqa: E402  # isort: skip
+from a2a.types import (  # noqa: E402  # isort: skip
+    MessageSendParams,
+    TaskArtifactUpdateEvent,
+    TaskState,
+    TaskStatusUpdateEvent,
+)
+from a2a.utils import new_agent_text_message  # noqa: E402  # isort: skip
+
+from agent_task_manager import LangChainAgentExecutor, extract_user_id  # noqa: E402  # isort: skip
+from idempotency import IdempotencyCache  # noqa: E402  # isort: skip
+from scheduler import ContextScheduler  # noqa: E402  # isort: skip
+
+
+def make_context(text, context_id="chat", metadata=None):
+    message = new_agent_text_message(text, context_id)
+    message.role = "user"
+    return RequestContext(request=MessageSendParams(message=message, metadata=metadata))
+
+
+async def drain(queue: EventQueue) -> list:
+    events = []
+    while not queue.queue.empty():
+        events.append(await queue.dequeue_event())
+    return events
+
+
+def statuses(events) -> list:
+    return [e.status.state for e in events if isinstance(e, TaskStatusUpdateEvent)]
+
+
+class FakeWrapper:
+    async def stream(self, query, session_id):
+        yield {
+            "is_task_complete": True,
+            "require_user_input": False,
+            "content": f"ok: {query}",
+            "is_error": False,
+            "is_event": False,
+        }
+
+
+class StreamingWrapper:
+    async def stream(self, query, session_id):
+        for item in (
+            {"content": "Использую инструмент: list_issues\n", "is_event": True, "is_task_complete": False},
+            {"content": "Открыто ", "is_event": False, "is_task_complete": False},
+            {"content": "3 задачи", "is_event": False, "is_task_complete": False},
+            {"content": "Открыто 3 задачи", "is_event": False, "is_task_complete": True},
+        ):
+            yield {"require_user_input": False, "is_error": False, **item}
+
+
+class SlowWrapper:
+    """Агент, который "думает" до отмены."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def stream(self, query, session_id):
+        self.started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        yield {
+            "is_task_complete": True,
+            "require_user_input": False,
+            "content": "late",
+            "is_error": False,
+            "is_event": False,
+        }
+
+
+class CountingWrapper:
+    """Агент, который отвечает после release и считает запуски."""
+
+    def __init__(self, fail=False):
+        self.runs = 0
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def stream(self, query, session_id):
+        self.runs += 1
+        await self.release.wait()
+        yield {
+            "is_task_complete": not self.fail,
+            "require_user_input": False,
+            "content": f"ответ {self.runs}",
+            "is_error": self.fail,
+            "is_event": False,
+        }
+
+
+def final_text(events) -> str:
+    return [e for e in events if isinstance(e, TaskStatusUpdateEvent)][-1].status.message.parts[0].root.text
+
+
+class ExecutorSchedulingTests(unittest.TestCase):
+    def test_extract_user_id_from_bot_prefix(self):
+        context = make_context("[Информация о пользователе: Имя: Иван, Telegram ID: 42]\n\nпривет")
+        self.assertEqual(extract_user_id(context), "42")
+        self.assertIsNone(extract_user_id(make_context("привет")))
+
+    def test_rejected_when_context_queue_is_full(self):
+        scheduler = ContextScheduler(max_queue_per_context=1)
+        executor = LangChainAgentExecutor(FakeWrapper(), scheduler)
+
+        async def run():
+            # Контекст занят, его очередь заполнена
+            await scheduler.acquire("chat")
+            waiter = asyncio.create_task(scheduler.acquire("chat"))
+            await asyncio.sleep(0)
+
+            queue = EventQueue()
+            await executor.execute(make_context("привет"), queue)
+            waiter.cancel()
+            return await drain(queue)
+
+        self.assertEqual(statuses(asyncio.run(run())), [TaskState.rejected])
+
+
+class ExecutorStreamingTests(unittest.TestCase):
+    def test_stream_parts_are_tagged_and_final_answer_is_complete(self):
+        executor = LangChainAgentExecutor(StreamingWrapper(), ContextScheduler())
+
+        async def run():
+            queue = EventQueue()
+            await executor.execute(make_context("сколько задач?"), queue)
+            return await drain(queue)
+
+        events = asyncio.run(run())
+        updates = [e for e in events if isinstance(e, TaskStatusUpdateEvent)]
+        working = [(u.status.message.metadata["stream"], u.status.message.parts[0].root.text) for u in updates[:-1]]
+        self.assertEqual(
+            working,
+            [("event", "Использую инструмент: list_issues\n"), ("delta", "Открыто "), ("delta", "3 задачи")],
+        )
+        self.assertEqual(updates[-1].status.state, TaskState.completed)
+        self.assertEqual(updates[-1].status.message.parts[0].root.text, "Открыто 3 задачи")
+        artifacts = [e for e in events if isinstance(e, TaskArtifactUpdateEvent)]
+        self.assertEqual(artifacts[0].artifact.parts[0].root.text, "Открыто 3 задачи")
+
+
+class ExecutorIdempotencyTests(unittest.TestCase):
+    def test_duplicate_joins_running_task_and_retry_gets_cached_answer(self):
+        wrapper = CountingWrapper()
+        executor = LangChainAgentExecutor(wrapper, ContextScheduler(), IdempotencyCache())
+        metadata = {"idempotency_key": "chat:1"}
+
+        async def run():
+            queues = [EventQueue(), EventQueue()]
+            first = asyncio.create_task(executor.execute(make_context("привет", metadata=metadata), queues[0]))
+            second = asyncio.create_task(executor.execute(make_context("привет", metadata=metadata), queues[1]))
+            await asyncio.sleep(0.01)
+            wrapper.release.set()
+            await asyncio.gather(first, second)
+
+            retry = EventQueue()
+            await executor.execute(make_context("привет", metadata=metadata), retry)
+            return [await drain(queue) for queue in (*queues, retry)]
+
+        results = asyncio.run(run())
+        self.assertEqual(wrapper.runs, 1)
+        for events in results:
+            self.assertEqual(statuses(events)[-1], TaskState.completed)
+            self.assertEqual(final_text(events), "ответ 1")
+        self.assertEqual(executor.idempotency.stats()["joined"], 1)
+
+    def test_failed_run_is_not_cached(self):
+        wrapper = CountingWrapper(fail=True)
+        wrapper.release.set()
+        executor = LangChainAgentExecutor(wrapper, ContextScheduler(), IdempotencyCache())
+        metadata = {"idempotency_key": "chat:2"}
+
+        async def run():
+            for _ in range(2):
+                await executor.execute(make_context("привет", metadata=metadata), EventQueue())
+
+        asyncio.run(run())
+        self.assertEqual(wrapper.runs, 2)
+        self.assertEqual(executor.idempotency.stats()["cached"], 0)
+
+    def test_key_is_scoped_to_context_and_query(self):
+        wrapper = CountingWrapper()
+        wrapper.release.set()
+        executor = LangChainAgentExecutor(wrapper, ContextScheduler(), IdempotencyCache())
+        metadata = {"idempotency_key": "tg:1:1"}
+
+        async def run():
+            await executor.execute(make_context("привет", metadata=metadata), EventQueue())
+            other_chat = EventQueue()
+            await executor.execute(make_context("привет", context_id="other", metadata=metadata), other_chat)
+            await executor.execute(make_context("другой вопрос", metadata=metadata), EventQueue())
+            return await drain(other_chat)
+
+        events = asyncio.run(run())
+        # Тот же ключ из другого контекста или с другим текстом — новый запуск, а не чужой ответ
+        self.assertEqual(wrapper.runs, 3)
+        self.assertEqual(final_text(events), "ответ 2")
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        wrapper = CountingWrapper()
+        wrapper.release.set()
+        executor = LangChainAgentExecutor(wrapper, ContextScheduler(), IdempotencyCache())
+
+        async def run():
+            for _ in range(2):
+                await executor.execute(make_context("привет"), EventQueue())
+
+        asyncio.run(run())
+        self.assertEqual(wrapper.runs, 2)
+
+
+class ExecutorCancellationTests(unittest.TestCase):
+    def test_cancel_stops_running_task_and_frees_slot(self):
+        wrapper = SlowWrapper()
+        scheduler = ContextScheduler()
+        executor = LangChainAgentExecutor(wrapper, scheduler)
+
+        async def run():
+            queue = EventQueue()
+            context = make_context("долгий запрос")
+            execution = asyncio.create_task(executor.execute(context, queue))
+            await asyncio.wait_for(wrapper.started.wait(), timeout=1)
+            task = (await drain(queue))[0]
+
+            cancel_context = RequestContext(task_id=task.id, context_id=task.context_id, task=task)
+            await executor.cancel(cancel_context, queue)
+            await asyncio.wait_for(execution, timeout=1)
+            return await drain(queue)
+
+        events = asyncio.run(run())
+        self.assertEqual(statuses(events), [TaskState.canceled])
+        self.assertTrue(events[-1].final)
+        self.assertTrue(wrapper.cancelled)
+        self.assertEqual(executor._running, {})
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_cancel_unknown_task_still_reports_canceled(self):
+        executor = LangChainAgentExecutor(FakeWrapper(), ContextScheduler())
+
+        async def run():
+            queue = EventQueue()
+            await executor.cancel(RequestContext(task_id="t1", context_id="chat"), queue)
+            return await drain(queue)
+
+        self.assertEqual(statuses(asyncio.run(run())), [TaskState.canceled])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from history import SUMMARY_PREFIX, HistoryManager  # noqa: E402  # isort: skip
+from session_store import InMemorySessionStore  # noqa: E402  # isort: skip
+
+
+class HistoryManagerTests(unittest.TestCase):
+    def test_build_keeps_latest_turns_within_budget(self):
+        store = InMemorySessionStore(max_tokens=0)
+        manager = HistoryManager(store, token_budget=10)
+
+        async def run():
+            for i in range(4):
+                # ~4 токена на ход
+                await store.append_turn("chat", f"q{i}" * 3, f"a{i}" * 3)
+            return await manager.build("chat")
+
+        history = asyncio.run(run())
+        self.assertEqual(history, [("human", "q2" * 3), ("assistant", "a2" * 3), ("human", "q3" * 3), ("assistant", "a3" * 3)])
+
+    def test_latest_turn_kept_even_if_over_budget(self):
+        store = InMemorySessionStore(max_tokens=0)
+        manager = HistoryManager(store, token_budget=1)
+
+        async def run():
+            await store.append_turn("chat", "long question", "long answer")
+            return await manager.build("chat")
+
+        self.assertEqual(len(asyncio.run(run())), 2)
+
+    def test_overflow_is_compacted_in_background(self):
+        store = InMemorySessionStore(max_tokens=0)
+        calls = []
+
+        async def run():
+            gate = asyncio.Event()
+
+            async def summarizer(summary, messages):
+                calls.append((summary, list(messages)))
+                await gate.wait()
+                return f"summary of {len(messages) // 2} turns"
+
+            manager = HistoryManager(store, summarizer, token_budget=10)
+            for i in range(4):
+                await store.append_turn("chat", f"q{i}" * 3, f"a{i}" * 3)
+            manager.schedule_compaction("chat")
+            manager.schedule_compaction("chat")  # дубликат не создаёт вторую задачу
+            await asyncio.sleep(0)
+            # Пока сжатие не завершилось, запрос обслуживается окном без ожидания LLM
+            before = await manager.build("chat")
+            gate.set()
+            await asyncio.sleep(0.01)
+            await store.append_turn("chat", "q4", "a4")
+            return manager, before, await manager.build("chat")
+
+        manager, before, after = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(before), 4)
+        self.assertEqual(after[0], ("system", SUMMARY_PREFIX + "summary of 2 turns"))
+        self.assertEqual(after[-2:], [("human", "q4"), ("assistant", "a4")])
+        self.assertEqual(manager.stats()["compactions"], 1)
+        self.assertEqual(store.stats()["turns"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
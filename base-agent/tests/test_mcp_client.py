@@ -0,0 +1,289 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from mcp_client import MCPClient  # noqa: E402  # isort: skip
+
+
+def make_transport(calls: list) -> httpx.MockTransport:
+    """Фейковый MCP сервер, который всегда отвечает JSON."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        calls.append(payload["method"])
+        if payload["method"] == "tools/list":
+            result = {"tools": [{"name": "demo", "inputSchema": {}}]}
+        elif payload["method"] == "tools/call":
+            result = {"content": [{"type": "text", "text": "ok"}]}
+        else:
+            result = {}
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": result})
+
+    return httpx.MockTransport(handler)
+
+
+class MCPClientTests(unittest.TestCase):
+    def test_http_client_is_reused_between_requests(self):
+        calls = []
+
+        async def run():
+            async with MCPClient("http://mcp", transport=make_transport(calls)) as client:
+                await client.list_tools()
+                first = client._http_client
+                result = await client.call_tool("demo", {})
+                self.assertIs(client._http_client, first)
+                return result, first
+
+        result, http_client = asyncio.run(run())
+        self.assertEqual(result, "ok")
+        self.assertTrue(http_client.is_closed)
+        self.assertIn("tools/call", calls)
+
+    def test_json_server_gets_single_request_per_call(self):
+        calls = []
+
+        async def run():
+            async with MCPClient("http://json-only", transport=make_transport(calls)) as client:
+                await client.list_tools()
+                await client.call_tool("demo", {})
+                return client
+
+        client = asyncio.run(run())
+        self.assertEqual(calls, ["initialize", "tools/list", "tools/call"])
+        self.assertEqual(client._transport_mode, "json")
+        self.assertEqual(client.stats["requests"], 3)
+        self.assertEqual(client.stats["transport_fallbacks"], 0)
+
+    def test_sse_server_response_is_read_from_stream(self):
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            calls.append(payload["method"])
+            body = json.dumps({"jsonrpc": "2.0", "id": payload["id"], "result": {"tools": []}})
+            return httpx.Response(
+                200,
+                content=f"event: message\ndata: {body}\n\n".encode(),
+                headers={"Content-Type": "text/event-stream"},
+            )
+
+        async def run():
+            async with MCPClient("http://sse", transport=httpx.MockTransport(handler)) as client:
+                return await client.list_tools(), client._transport_mode
+
+        self.assertEqual(asyncio.run(run()), ([], "sse"))
+        self.assertEqual(calls, ["initialize", "tools/list"])
+
+    def test_notifications_in_sse_stream_are_dispatched(self):
+        notifications = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            note = json.dumps({"jsonrpc": "2.0", "method": "notifications/tools/list_changed"})
+            body = json.dumps({"jsonrpc": "2.0", "id": payload["id"], "result": {"tools": []}})
+            return httpx.Response(
+                200,
+                content=f"data: {note}\n\ndata: {body}\n\n".encode(),
+                headers={"Content-Type": "text/event-stream"},
+            )
+
+        async def run():
+            async with MCPClient("http://sse-notify", transport=httpx.MockTransport(handler)) as client:
+                client.add_notification_handler(notifications.append)
+                await client.list_tools()
+
+        asyncio.run(run())
+        self.assertEqual(
+            [n["method"] for n in notifications],
+            ["notifications/tools/list_changed", "notifications/tools/list_changed"],
+        )
+
+    def test_cancelled_call_notifies_server(self):
+        calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            calls.append(payload)
+            if payload["method"] == "tools/call":
+                await asyncio.sleep(10)
+            if "id" not in payload:
+                return httpx.Response(202)
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": {}})
+
+        async def run():
+            async with MCPClient("http://cancel", transport=httpx.MockTransport(handler)) as client:
+                call = asyncio.create_task(client.call_tool("slow", {}))
+                await asyncio.sleep(0.05)
+                call.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await call
+                return client
+
+        client = asyncio.run(run())
+        call_id = next(c["id"] for c in calls if c["method"] == "tools/call")
+        cancelled = [c for c in calls if c["method"] == "notifications/cancelled"]
+        self.assertEqual(len(cancelled), 1)
+        self.assertEqual(cancelled[0]["params"]["requestId"], call_id)
+        self.assertEqual(client.stats["cancelled"], 1)
+
+    def test_http_client_recreated_for_new_event_loop(self):
+        client = MCPClient("http://mcp", transport=make_transport([]))
+
+        async def grab():
+            return client._get_http_client()
+
+        first = asyncio.run(grab())
+        second = asyncio.run(grab())
+        self.assertIsNot(first, second)
+        asyncio.run(client.aclose())
+        self.assertIsNone(client._http_client)
+
+    def test_pool_defaults_and_explicit_zero_keepalive(self):
+        with patch.dict(os.environ):
+            os.environ.pop("MCP_HTTP2", None)
+            self.assertFalse(MCPClient("http://mcp")._http2)
+        self.assertEqual(MCPClient("http://mcp", keepalive_expiry=0)._limits.keepalive_expiry, 0)
+
+    def test_call_from_other_running_loop_uses_short_lived_client(self):
+        calls = []
+
+        async def run():
+            async with MCPClient("http://mcp", transport=make_transport(calls)) as client:
+                await client.list_tools()
+                shared = client._http_client
+                # Синхронный фоллбек инструмента: asyncio.run в отдельном потоке
+                text = await asyncio.to_thread(asyncio.run, client.call_tool("demo", {}))
+                return text, shared, client._http_client
+
+        text, before, after = asyncio.run(run())
+        self.assertEqual(text, "ok")
+        # Общий пул не подменён вызовом из чужого loop
+        self.assertIs(before, after)
+
+
+def make_batch_transport(posts: list, accept_batches: bool = True) -> httpx.MockTransport:
+    """Фейковый MCP сервер с поддержкой JSON-RPC batch; ответы в батче идут в обратном порядке."""
+
+    def reply(payload: dict) -> dict:
+        if payload["method"] == "tools/list":
+            return {"jsonrpc": "2.0", "id": payload["id"], "result": {"tools": [{"name": "demo"}]}}
+        if payload["method"] == "tools/call" and payload["params"]["name"] == "broken":
+            return {"jsonrpc": "2.0", "id": payload["id"], "error": {"code": -32000, "message": "boom"}}
+        if payload["method"] == "tools/call":
+            text = f"{payload['params']['name']}:{payload['params']['arguments'].get('n')}"
+            return {"jsonrpc": "2.0", "id": payload["id"], "result": {"content": [{"type": "text", "text": text}]}}
+        return {"jsonrpc": "2.0", "id": payload["id"], "result": {"serverInfo": {"name": "fake"}}}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        posts.append(body)
+        if isinstance(body, list):
+            if not accept_batches:
+                error = {"code": -32600, "message": "Invalid Request"}
+                return httpx.Response(400, json={"jsonrpc": "2.0", "id": None, "error": error})
+            return httpx.Response(200, json=[reply(payload) for payload in reversed(body)])
+        return httpx.Response(200, json=reply(body))
+
+    return httpx.MockTransport(handler)
+
+
+class MCPClientBatchTests(unittest.TestCase):
+    def test_call_tools_batch_sends_one_post_and_keeps_order(self):
+        posts = []
+
+        async def run():
+            async with MCPClient("http://batch", transport=make_batch_transport(posts)) as client:
+                await client.list_tools()
+                posts.clear()
+                return await client.call_tools_batch(
+                    [("demo", {"n": 1}), ("broken", {}), ("demo", {"n": 2})], return_exceptions=True
+                )
+
+        results = asyncio.run(run())
+        self.assertEqual(len(posts), 1)
+        self.assertEqual([p["params"]["name"] for p in posts[0]], ["demo", "broken", "demo"])
+        self.assertEqual(results[0], "demo:1")
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(results[2], "demo:2")
+
+    def test_micro_batcher_coalesces_concurrent_calls(self):
+        posts = []
+
+        async def run():
+            transport = make_batch_transport(posts)
+            async with MCPClient("http://micro-batch", transport=transport, batch_window=0.01) as client:
+                tools = await client.list_tools()
+                results = await asyncio.gather(*(client.call_tool("demo", {"n": n}) for n in range(3)))
+                return tools, results, client.stats
+
+        tools, results, stats = asyncio.run(run())
+        # initialize + tools/list одним запросом, затем три вызова одним батчем
+        self.assertEqual([[p["method"] for p in post] for post in posts], [
+            ["initialize", "tools/list"],
+            ["tools/call", "tools/call", "tools/call"],
+        ])
+        self.assertEqual(tools[0]["name"], "demo")
+        self.assertEqual(results, ["demo:0", "demo:1", "demo:2"])
+        self.assertEqual((stats["batches"], stats["batched_requests"]), (2, 5))
+
+    def test_falls_back_to_single_requests_when_batches_are_rejected(self):
+        posts = []
+
+        async def run():
+            transport = make_batch_transport(posts, accept_batches=False)
+            async with MCPClient("http://no-batch", transport=transport, batch_window=0.01) as client:
+                await client.list_tools()
+                first = await client.call_tools_batch([("demo", {"n": 1}), ("demo", {"n": 2})])
+                second = await asyncio.gather(*(client.call_tool("demo", {"n": n}) for n in range(2)))
+                return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, ["demo:1", "demo:2"])
+        self.assertEqual(second, ["demo:0", "demo:1"])
+        # Массив отправлен только один раз — дальше сервер помечен как не поддерживающий batch
+        self.assertEqual(sum(isinstance(post, list) for post in posts), 1)
+
+    def test_batching_is_retried_after_interval_and_not_disabled_by_404(self):
+        posts = []
+
+        async def run():
+            transport = make_batch_transport(posts, accept_batches=False)
+            async with MCPClient(
+                "http://no-batch", transport=transport, batch_window=0.01, batch_retry_interval=0.05
+            ) as client:
+                await client.list_tools()
+                await asyncio.sleep(0.06)
+                await client.call_tools_batch([("demo", {"n": 1}), ("demo", {"n": 2})])
+                return client.batching_enabled
+
+        self.assertFalse(asyncio.run(run()))
+        # initialize+tools/list и повторная попытка после интервала
+        self.assertEqual(sum(isinstance(post, list) for post in posts), 2)
+
+        def not_found(request: httpx.Request) -> httpx.Response:
+            body = json.loads(request.content)
+            if isinstance(body, list):
+                return httpx.Response(404, text="Session not found")
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": body["id"], "result": {}})
+
+        async def run_404():
+            async with MCPClient("http://expired", transport=httpx.MockTransport(not_found), batch_window=0.01) as client:
+                await client.call_tools_batch([("demo", {}), ("demo", {})])
+                return client.batching_enabled
+
+        self.assertTrue(asyncio.run(run_404()))
+
+
+if __name__ == "__main__":
+    unittest.main()
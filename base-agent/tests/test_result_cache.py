@@ -0,0 +1,140 @@
+import asyncio
+import json
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from mcp_client import MCPClient  # noqa: E402  # isort: skip
+from result_cache import ToolResultCache, parse_ttls  # noqa: E402  # isort: skip
+
+
+def make_transport(calls: list) -> httpx.MockTransport:
+    """Фейковый MCP сервер: отвечает номером вызова инструмента, ошибкой для broken."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        result = {}
+        if payload["method"] == "tools/call":
+            calls.append(payload["params"]["name"])
+            text = f"{payload['params']['name']} #{len(calls)}"
+            result = {"content": [{"type": "text", "text": text}]}
+            if payload["params"]["name"] == "list_issues" and payload["params"]["arguments"].get("broken"):
+                result["isError"] = True
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": result})
+
+    return httpx.MockTransport(handler)
+
+
+class ToolResultCacheTests(unittest.TestCase):
+    def test_key_ignores_argument_order_and_separates_chats(self):
+        cache = ToolResultCache()
+        cache.put("s", "list_issues", {"project_path": "g/p", "state": "opened", "chat_id": "1"}, "v", 0)
+        self.assertEqual(cache.get("s", "list_issues", {"chat_id": "1", "state": "opened", "project_path": "g/p"}), "v")
+        self.assertIsNone(cache.get("s", "list_issues", {"chat_id": "2", "state": "opened", "project_path": "g/p"}))
+        self.assertIsNone(cache.get("other", "list_issues", {"chat_id": "1", "state": "opened", "project_path": "g/p"}))
+
+    def test_only_allow_listed_tools_are_cached(self):
+        cache = ToolResultCache()
+        cache.put("s", "create_issue", {"chat_id": "1"}, "v", 0)
+        self.assertIsNone(cache.get("s", "create_issue", {"chat_id": "1"}))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_ttl_and_lru_eviction(self):
+        cache = ToolResultCache(ttls={"list_projects": 0.05, "list_issues": 60}, max_entries=2)
+        cache.put("s", "list_projects", {"chat_id": "1"}, "projects", 0)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("s", "list_projects", {"chat_id": "1"}))
+
+        for chat in ("1", "2", "3"):
+            cache.put("s", "list_issues", {"chat_id": chat}, chat, 0)
+        self.assertIsNone(cache.get("s", "list_issues", {"chat_id": "1"}))
+        self.assertEqual(cache.get("s", "list_issues", {"chat_id": "3"}), "3")
+        self.assertEqual(cache.stats()["evicted"], 1)
+
+    def test_size_bounds_total_and_per_entry_chars(self):
+        cache = ToolResultCache(max_chars=10, max_entry_chars=6)
+        cache.put("s", "get_mr_details", {"chat_id": "1", "mr_iid": 1}, "x" * 7, 0)
+        self.assertIsNone(cache.get("s", "get_mr_details", {"chat_id": "1", "mr_iid": 1}))
+        self.assertEqual(cache.stats()["too_large"], 1)
+
+        for iid in (1, 2, 3):
+            cache.put("s", "get_mr_details", {"chat_id": "1", "mr_iid": iid}, "x" * 4, 0)
+        # Третья запись не помещается в 10 символов — вытесняется самая старая
+        self.assertIsNone(cache.get("s", "get_mr_details", {"chat_id": "1", "mr_iid": 1}))
+        self.assertEqual(cache.stats()["chars"], 8)
+        cache.put("s", "get_mr_details", {"chat_id": "1", "mr_iid": 3}, "x", 0)
+        self.assertEqual(cache.stats()["chars"], 5)
+
+    def test_mutations_invalidate_dependent_and_credential_entries(self):
+        cache = ToolResultCache()
+        for chat in ("1", "2"):
+            cache.put("s", "list_issues", {"chat_id": chat}, "issues", 0)
+            cache.put("s", "list_projects", {"chat_id": chat}, "projects", 0)
+
+        self.assertEqual(cache.invalidate("s", "create_issue", {"chat_id": "1", "title": "bug"}), 2)
+        self.assertIsNone(cache.get("s", "list_issues", {"chat_id": "2"}))
+        self.assertEqual(cache.get("s", "list_projects", {"chat_id": "2"}), "projects")
+
+        self.assertEqual(cache.invalidate("s", "update_user_credentials", {"chat_id": "1"}), 1)
+        self.assertIsNone(cache.get("s", "list_projects", {"chat_id": "1"}))
+        self.assertEqual(cache.invalidate("s", "get_user_info", {"chat_id": "2"}), 0)
+
+    def test_result_started_before_invalidation_is_not_stored(self):
+        cache = ToolResultCache()
+        generation = cache.generation("s")
+        cache.invalidate("s", "create_issue", {"chat_id": "1"})
+        cache.put("s", "list_issues", {"chat_id": "1"}, "stale", generation)
+        self.assertIsNone(cache.get("s", "list_issues", {"chat_id": "1"}))
+
+    def test_parse_ttls_overrides_defaults(self):
+        ttls = parse_ttls("get_pipeline_status=0, list_projects=600, review_patch=30, broken")
+        self.assertNotIn("get_pipeline_status", ttls)
+        self.assertEqual(ttls["list_projects"], 600)
+        self.assertEqual(ttls["review_patch"], 30)
+        self.assertIn("list_issues", ttls)
+
+
+class MCPClientResultCacheTests(unittest.TestCase):
+    def test_call_tool_reads_through_cache_and_invalidates_on_mutation(self):
+        calls = []
+
+        async def run():
+            cache = ToolResultCache()
+            async with MCPClient("http://mcp", transport=make_transport(calls), result_cache=cache) as client:
+                args = {"chat_id": "1", "project_path": "g/p"}
+                first = await client.call_tool("list_issues", args)
+                second = await client.call_tool("list_issues", dict(reversed(list(args.items()))))
+                await client.call_tool("create_issue", {**args, "title": "bug"})
+                third = await client.call_tool("list_issues", args)
+                # Ошибки инструмента не кэшируются
+                await client.call_tool("list_issues", {**args, "broken": True})
+                await client.call_tool("list_issues", {**args, "broken": True})
+                return first, second, third
+
+        first, second, third = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertEqual(calls, ["list_issues", "create_issue", "list_issues", "list_issues", "list_issues"])
+
+    def test_without_cache_every_call_goes_upstream(self):
+        calls = []
+
+        async def run():
+            async with MCPClient("http://nocache", transport=make_transport(calls)) as client:
+                for _ in range(2):
+                    await client.call_tool("list_projects", {"chat_id": "1"})
+
+        asyncio.run(run())
+        self.assertEqual(calls, ["list_projects", "list_projects"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import sys
+import time
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from langchain_core.messages import AIMessage, AIMessageChunk  # noqa: E402  # isort: skip
+
+from a2a_wrapper import LangChainA2AWrapper  # noqa: E402  # isort: skip
+from review import (  # noqa: E402  # isort: skip
+    NO_FINDINGS,
+    ReviewPipeline,
+    ReviewRequest,
+    chunk_changes,
+    parse_review_request,
+    split_hunks,
+)
+from session_store import InMemorySessionStore  # noqa: E402  # isort: skip
+
+HUNK_A = "@@ -1,2 +1,2 @@\n-old = 1\n+new = 1\n"
+HUNK_B = "@@ -10,2 +10,3 @@\n context\n+password = 'secret'\n"
+
+
+def change(path: str, diff: str, **flags) -> dict:
+    return {"old_path": path, "new_path": path, "diff": diff, **flags}
+
+
+class FakeReviewLLM:
+    """Ревью части: замечание, если в diff есть пароль; отслеживает параллельность."""
+
+    def __init__(self, delay: float = 0.0, fail_on: str = ""):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.active = 0
+        self.max_active = 0
+        self.reviewed = []
+        self.reduce_prompts = []
+
+    async def ainvoke(self, messages):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            prompt = messages[-1].content
+            self.reviewed.append(prompt.split("\n", 1)[0])
+            if self.fail_on and self.fail_on in prompt:
+                raise RuntimeError("LLM timeout")
+            if "password" in prompt:
+                return AIMessage(content="- [high] app.py:11 — пароль в коде")
+            return AIMessage(content=NO_FINDINGS)
+        finally:
+            self.active -= 1
+
+    async def astream(self, messages):
+        self.reduce_prompts.append(messages[-1].content)
+        for token in ["Итог: ", "не сливать. ", "[high] пароль в коде"]:
+            yield AIMessageChunk(content=token)
+
+
+class FakeMCPClient:
+    def __init__(self, changes, error: bool = False):
+        self.changes = changes
+        self.error = error
+        self.calls = []
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, arguments))
+        if self.error:
+            return "Error: User not registered"
+        return json.dumps({"merge_request": {"title": "Фича"}, "changes": self.changes})
+
+
+class ParseReviewRequestTests(unittest.TestCase):
+    def test_url_and_short_reference(self):
+        self.assertEqual(
+            parse_review_request("Сделай ревью https://gitlab.com/group/sub/app/-/merge_requests/42"),
+            ReviewRequest("group/sub/app", 42),
+        )
+        self.assertEqual(parse_review_request("review group/app!7 please"), ReviewRequest("group/app", 7))
+
+    def test_requires_review_intent(self):
+        self.assertIsNone(parse_review_request("Какой статус у group/app!7?"))
+        self.assertIsNone(parse_review_request("Сделай ревью моего кода"))
+
+
+class ChunkingTests(unittest.TestCase):
+    def test_split_hunks(self):
+        self.assertEqual(split_hunks(HUNK_A + HUNK_B), [HUNK_A, HUNK_B])
+
+    def test_small_files_are_single_chunks(self):
+        chunks = chunk_changes([change("a.py", HUNK_A), change("b.py", HUNK_B)], max_chars=1000)
+
+        self.assertEqual([(c.path, c.diff, c.parts) for c in chunks], [("a.py", HUNK_A, 1), ("b.py", HUNK_B, 1)])
+
+    def test_large_file_split_on_hunk_boundaries(self):
+        chunks = chunk_changes([change("big.py", HUNK_A + HUNK_B)], max_chars=len(HUNK_B) + 1)
+
+        self.assertEqual([c.diff for c in chunks], [HUNK_A, HUNK_B])
+        self.assertEqual([c.title for c in chunks], ["big.py (часть 1/2)", "big.py (часть 2/2)"])
+
+    def test_oversized_hunk_split_by_lines(self):
+        hunk = "@@ -1,40 +1,40 @@\n" + "".join(f"+line {i}\n" for i in range(40))
+
+        chunks = chunk_changes([change("gen.py", hunk)], max_chars=100)
+
+        self.assertTrue(all(len(c.diff) <= 100 for c in chunks))
+        self.assertEqual("".join(c.diff for c in chunks), hunk)
+
+    def test_skips_binary_and_marks_deleted(self):
+        chunks = chunk_changes(
+            [change("logo.png", ""), change("old.py", HUNK_A, deleted_file=True)], max_chars=1000
+        )
+
+        self.assertEqual([c.path for c in chunks], ["old.py (удалён)"])
+
+
+class ReviewPipelineTests(unittest.TestCase):
+    def run_review(self, pipeline, changes):
+        async def run():
+            details = await pipeline.fetch_changes(ReviewRequest("group/app", 7), "123")
+            return [update async for update in pipeline.review(ReviewRequest("group/app", 7), details)]
+
+        pipeline.mcp_client = FakeMCPClient(changes)
+        return asyncio.run(run())
+
+    def test_chunks_reviewed_concurrently_with_bounded_parallelism(self):
+        llm = FakeReviewLLM(delay=0.05)
+        pipeline = ReviewPipeline(llm, None, max_parallel=4)
+        changes = [change(f"f{i}.py", HUNK_A) for i in range(8)]
+
+        started = time.perf_counter()
+        updates = self.run_review(pipeline, changes)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(llm.max_active, 4)
+        # 8 частей по 0.05с при 4 параллельных — две «волны», а не восемь
+        self.assertLess(elapsed, 0.3)
+        progress = [u.text for u in updates if u.kind == "progress"]
+        self.assertEqual(len(progress), 1 + len(changes))
+        self.assertEqual(
+            pipeline.mcp_client.calls[0],
+            ("get_mr_details", {"chat_id": "123", "project_path": "group/app", "mr_iid": 7, "include_changes": True}),
+        )
+
+    def test_reduce_merges_only_findings_and_streams_report(self):
+        llm = FakeReviewLLM()
+        pipeline = ReviewPipeline(llm, None)
+
+        updates = self.run_review(pipeline, [change("a.py", HUNK_A), change("app.py", HUNK_B)])
+
+        self.assertEqual(len(llm.reduce_prompts), 1)
+        self.assertIn("### app.py\n- [high] app.py:11", llm.reduce_prompts[0])
+        self.assertNotIn("### a.py", llm.reduce_prompts[0])
+        deltas = [u.text for u in updates if u.kind == "delta"]
+        self.assertEqual(updates[-1].kind, "report")
+        self.assertEqual(updates[-1].text, "".join(deltas))
+
+    def test_clean_mr_skips_reduce_llm(self):
+        llm = FakeReviewLLM()
+        pipeline = ReviewPipeline(llm, None)
+
+        updates = self.run_review(pipeline, [change("a.py", HUNK_A)])
+
+        self.assertEqual(llm.reduce_prompts, [])
+        self.assertIn(NO_FINDINGS.lower(), updates[-1].text)
+
+    def test_failed_chunk_does_not_abort_review(self):
+        llm = FakeReviewLLM(fail_on="b.py")
+        pipeline = ReviewPipeline(llm, None)
+
+        self.run_review(pipeline, [change("a.py", HUNK_A), change("b.py", HUNK_A)])
+
+        self.assertIn("### b.py\nНе удалось проверить: LLM timeout", llm.reduce_prompts[0])
+        self.assertEqual(pipeline.stats()["failed_chunks"], 1)
+
+
+class WrapperReviewTests(unittest.TestCase):
+    def collect(self, wrapper, query):
+        async def run():
+            return [item async for item in wrapper.stream(query, "123")]
+
+        return asyncio.run(run())
+
+    def test_review_request_streams_report(self):
+        store = InMemorySessionStore()
+        pipeline = ReviewPipeline(FakeReviewLLM(), FakeMCPClient([change("app.py", HUNK_B)]))
+        wrapper = LangChainA2AWrapper(
+            None, store, stream_flush_chars=10_000, stream_flush_interval=60, review_pipeline=pipeline
+        )
+
+        items = self.collect(wrapper, "Проведи ревью group/app!7")
+
+        self.assertTrue(any(i["is_event"] for i in items))
+        final = items[-1]
+        self.assertTrue(final["is_task_complete"])
+        self.assertFalse(final["is_error"])
+        self.assertEqual(final["content"], "Итог: не сливать. [high] пароль в коде")
+        history = asyncio.run(store.get_history("123"))
+        self.assertEqual(history[-1], ("assistant", final["content"]))
+
+    def test_falls_back_to_agent_when_diff_unavailable(self):
+        pipeline = ReviewPipeline(FakeReviewLLM(), FakeMCPClient([], error=True))
+        wrapper = LangChainA2AWrapper(None, InMemorySessionStore(), review_pipeline=pipeline)
+
+        items = self.collect(wrapper, "Проведи ревью group/app!7")
+
+        # Агента нет (None), поэтому обычный путь завершается ошибкой — но именно он был вызван
+        self.assertTrue(items[-1]["is_error"])
+        self.assertEqual(pipeline.stats()["fallbacks"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from scheduler import ContextScheduler, SchedulerRejected  # noqa: E402  # isort: skip
+
+
+class ContextSchedulerTests(unittest.TestCase):
+    def test_same_context_runs_sequentially_in_order(self):
+        scheduler = ContextScheduler(max_concurrent=4)
+        events = []
+
+        async def job(name):
+            async with scheduler.slot("chat"):
+                events.append(f"start {name}")
+                await asyncio.sleep(0.01)
+                events.append(f"end {name}")
+
+        async def run():
+            await asyncio.gather(job("a"), job("b"), job("c"))
+
+        asyncio.run(run())
+        self.assertEqual(events, ["start a", "end a", "start b", "end b", "start c", "end c"])
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_different_contexts_run_in_parallel_up_to_global_limit(self):
+        scheduler = ContextScheduler(max_concurrent=2, max_per_user=0)
+        active = 0
+        peak = 0
+
+        async def job(context_id):
+            nonlocal active, peak
+            async with scheduler.slot(context_id):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        async def run():
+            await asyncio.gather(*(job(f"chat-{i}") for i in range(5)))
+
+        asyncio.run(run())
+        self.assertEqual(peak, 2)
+        self.assertEqual(scheduler.stats()["granted"], 5)
+
+    def test_busy_context_does_not_starve_others(self):
+        scheduler = ContextScheduler(max_concurrent=1, max_per_user=0)
+        order = []
+
+        async def job(context_id, name):
+            async with scheduler.slot(context_id):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async def run():
+            # Группа шлёт пачку сообщений, личный чат — одно, но позже
+            tasks = [asyncio.create_task(job("group", f"g{i}")) for i in range(3)]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(job("private", "p")))
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        self.assertLess(order.index("p"), order.index("g2"))
+
+    def test_per_user_limit(self):
+        scheduler = ContextScheduler(max_concurrent=10, max_per_user=1)
+        active = 0
+        peak = 0
+
+        async def job(context_id):
+            nonlocal active, peak
+            async with scheduler.slot(context_id, "user-1"):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        async def run():
+            await asyncio.gather(job("a"), job("b"), job("c"))
+
+        asyncio.run(run())
+        self.assertEqual(peak, 1)
+
+    def test_rejects_when_context_queue_is_full(self):
+        scheduler = ContextScheduler(max_queue_per_context=1)
+
+        async def run():
+            await scheduler.acquire("chat")
+            waiter = asyncio.create_task(scheduler.acquire("chat"))
+            await asyncio.sleep(0)
+            with self.assertRaises(SchedulerRejected):
+                await scheduler.acquire("chat")
+            scheduler.release("chat")
+            await waiter
+            scheduler.release("chat")
+
+        asyncio.run(run())
+        stats = scheduler.stats()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["running"], 0)
+        self.assertEqual(stats["waiting"], 0)
+
+    def test_cancelled_waiter_frees_its_place(self):
+        scheduler = ContextScheduler(max_concurrent=1)
+
+        async def run():
+            await scheduler.acquire("a")
+            waiter = asyncio.create_task(scheduler.acquire("b"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            scheduler.release("a")
+            await asyncio.wait_for(scheduler.acquire("c"), timeout=1)
+            scheduler.release("c")
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.stats()["waiting"], 0)
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
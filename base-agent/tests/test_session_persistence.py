@@ -0,0 +1,238 @@
+import asyncio
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from session_persistence import RedisSessionStore, RespClient, SqliteSessionStore  # noqa: E402  # isort: skip
+
+
+class FakeRedisServer:
+    """Локальный фейковый Redis: GET/SET/DEL/PING/AUTH/SELECT по протоколу RESP."""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    async def _handle(self, reader, writer):
+        authed = self.password is None
+        while True:
+            command = await self._read_command(reader)
+            if command is None:
+                break
+            name = command[0].upper()
+            self.commands.append(name)
+            if name == "AUTH":
+                authed = command[1] == self.password
+                writer.write(b"+OK\r\n" if authed else b"-ERR invalid password\r\n")
+            elif not authed:
+                writer.write(b"-NOAUTH Authentication required.\r\n")
+            elif name in ("PING", "SELECT"):
+                writer.write(b"+OK\r\n")
+            elif name == "SET":
+                self.data[command[1]] = command[2]
+                writer.write(b"+OK\r\n")
+            elif name == "GET":
+                value = self.data.get(command[1])
+                if value is None:
+                    writer.write(b"$-1\r\n")
+                else:
+                    raw = value.encode()
+                    writer.write(b"$%d\r\n%s\r\n" % (len(raw), raw))
+            elif name == "DEL":
+                writer.write(b":%d\r\n" % int(self.data.pop(command[1], None) is not None))
+            await writer.drain()
+        writer.close()
+
+
+class SqliteSessionStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "sessions.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_history_survives_restart_and_uses_wal(self):
+        async def write():
+            store = SqliteSessionStore(self.path, flush_interval=10)
+            await store.append_turn("chat", "q1", "a1")
+            await store.compact("chat", "summary", [])
+            await store.append_turn("chat", "q2", "a2")
+            # Ничего не записано до сброса: запись не блокирует запрос
+            self.assertEqual(store.stats()["pending_writes"], 1)
+            await store.aclose()
+            return store.stats()
+
+        stats = asyncio.run(write())
+        self.assertEqual(stats["flushes"], 1)
+        self.assertEqual(stats["flushed_sessions"], 1)
+
+        async def read():
+            store = SqliteSessionStore(self.path)
+            try:
+                return await store.get_history("chat"), await store.get_summary("chat")
+            finally:
+                await store.aclose()
+
+        history, summary = asyncio.run(read())
+        self.assertEqual(history, [("human", "q1"), ("assistant", "a1"), ("human", "q2"), ("assistant", "a2")])
+        self.assertEqual(summary, "summary")
+        mode = sqlite3.connect(self.path).execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_replicas_see_each_other_after_flush(self):
+        async def run():
+            first = SqliteSessionStore(self.path, flush_interval=0.01)
+            second = SqliteSessionStore(self.path, flush_interval=0.01)
+            await first.append_turn("chat", "q1", "a1")
+            await asyncio.sleep(0.05)
+            history = await second.get_history("chat")
+            await second.clear("chat")
+            await second.flush()
+            after_clear = await first.get_history("chat")
+            await first.aclose()
+            await second.aclose()
+            return history, after_clear
+
+        history, after_clear = asyncio.run(run())
+        self.assertEqual(history, [("human", "q1"), ("assistant", "a1")])
+        # Сессию очистила другая реплика — локальная копия первой тоже сбрасывается
+        self.assertEqual(after_clear, [])
+
+    def test_read_during_slow_flush_keeps_local_turns(self):
+        async def run():
+            store = SqliteSessionStore(self.path, flush_interval=10)
+            await store.append_turn("chat", "q1", "a1")
+            await store.flush()
+            await store.append_turn("chat", "q2", "a2")
+
+            saving = asyncio.Event()
+            release = asyncio.Event()
+            save_batch = store._save_batch
+
+            async def slow_save_batch(batch):
+                saving.set()
+                await release.wait()
+                await save_batch(batch)
+
+            store._save_batch = slow_save_batch
+            flush = asyncio.create_task(store.flush())
+            await saving.wait()
+            # В backend ещё старый снимок, а запись нового идёт
+            during = await store.get_history("chat")
+            release.set()
+            await flush
+            await store.aclose()
+            return during
+
+        during = asyncio.run(run())
+        self.assertEqual(during, [("human", "q1"), ("assistant", "a1"), ("human", "q2"), ("assistant", "a2")])
+
+        async def reopen():
+            store = SqliteSessionStore(self.path)
+            try:
+                return await store.get_history("chat")
+            finally:
+                await store.aclose()
+
+        self.assertEqual(len(asyncio.run(reopen())), 4)
+
+    def test_close_during_background_flush_keeps_batch(self):
+        async def run():
+            store = SqliteSessionStore(self.path, flush_interval=0.01)
+            save_batch = store._save_batch
+
+            async def slow_save_batch(batch):
+                await asyncio.sleep(0.2)
+                await save_batch(batch)
+
+            store._save_batch = slow_save_batch
+            await store.append_turn("chat", "q1", "a1")
+            await asyncio.sleep(0.05)
+            # Фоновая запись ещё идёт
+            await store.aclose()
+
+        asyncio.run(run())
+
+        async def reopen():
+            store = SqliteSessionStore(self.path)
+            try:
+                return await store.get_history("chat")
+            finally:
+                await store.aclose()
+
+        self.assertEqual(asyncio.run(reopen()), [("human", "q1"), ("assistant", "a1")])
+
+
+class RedisSessionStoreTests(unittest.TestCase):
+    def test_roundtrip_against_fake_server(self):
+        fake = FakeRedisServer(password="secret")
+
+        async def run():
+            port = await fake.start()
+            url = f"redis://:secret@127.0.0.1:{port}/1"
+            store = RedisSessionStore(url, flush_interval=10)
+            for i in range(3):
+                await store.append_turn("chat", f"q{i}", f"a{i}")
+            await store.append_turn("other", "q", "a")
+            await store.aclose()
+
+            reader = RedisSessionStore(url)
+            history = await reader.get_history("chat")
+            await reader.clear("other")
+            await reader.aclose()
+            await fake.stop()
+            return history
+
+        history = asyncio.run(run())
+        self.assertEqual(len(history), 6)
+        self.assertEqual(history[-1], ("assistant", "a2"))
+        # Четыре изменения двух сессий — одна пачка из двух SET
+        self.assertEqual(fake.commands.count("SET"), 2)
+        self.assertEqual(list(fake.data), ["agent:session:chat"])
+
+    def test_resp_client_raises_server_errors(self):
+        fake = FakeRedisServer(password="secret")
+
+        async def run():
+            port = await fake.start()
+            client = RespClient("127.0.0.1", port)
+            try:
+                await client.execute("GET", "key")
+            finally:
+                await client.aclose()
+                await fake.stop()
+
+        with self.assertRaisesRegex(Exception, "NOAUTH"):
+            asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
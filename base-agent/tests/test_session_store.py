@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import session_store  # noqa: E402  # isort: skip
+from session_store import InMemorySessionStore  # noqa: E402  # isort: skip
+
+
+class InMemorySessionStoreTests(unittest.TestCase):
+    def test_history_roundtrip_returns_copy(self):
+        store = InMemorySessionStore()
+
+        async def run():
+            await store.append_turn("chat", "привет", "здравствуйте")
+            history = await store.get_history("chat")
+            history.append(("human", "mutated"))
+            return await store.get_history("chat")
+
+        self.assertEqual(asyncio.run(run()), [("human", "привет"), ("assistant", "здравствуйте")])
+        self.assertEqual(asyncio.run(store.get_history("unknown")), [])
+        self.assertEqual(store.stats()["sessions"], 1)
+
+    def test_lru_evicts_least_recently_used_session(self):
+        store = InMemorySessionStore(max_sessions=2)
+
+        async def run():
+            await store.append_turn("a", "q", "a")
+            await store.append_turn("b", "q", "a")
+            await store.get_history("a")  # a становится самой свежей
+            await store.append_turn("c", "q", "a")
+
+        asyncio.run(run())
+        self.assertEqual(list(store._sessions), ["a", "c"])
+        self.assertEqual(store.stats()["evicted_lru"], 1)
+
+    def test_ttl_expires_idle_sessions(self):
+        store = InMemorySessionStore(ttl=10)
+        now = [1000.0]
+
+        with patch.object(session_store.time, "monotonic", side_effect=lambda: now[0]):
+            asyncio.run(store.append_turn("old", "q", "a"))
+            now[0] += 5
+            asyncio.run(store.append_turn("fresh", "q", "a"))
+            now[0] += 6
+            self.assertEqual(asyncio.run(store.get_history("old")), [])
+            self.assertEqual(len(asyncio.run(store.get_history("fresh"))), 2)
+
+        self.assertEqual(store.stats()["evicted_ttl"], 1)
+
+    def test_compact_skips_covered_turns_already_trimmed(self):
+        store = InMemorySessionStore(max_turns=3)
+
+        async def run():
+            for i in range(3):
+                await store.append_turn("chat", f"q{i}", f"a{i}")
+            covered = (await store.get_history("chat"))[:4]
+            # Пока шло сжатие, q0 вытеснен лимитом ходов
+            await store.append_turn("chat", "q3", "a3")
+            await store.compact("chat", "summary", covered)
+            return await store.get_history("chat"), await store.get_summary("chat")
+
+        history, summary = asyncio.run(run())
+        self.assertEqual(history, [("human", "q2"), ("assistant", "a2"), ("human", "q3"), ("assistant", "a3")])
+        self.assertEqual(summary, "summary")
+
+    def test_turn_and_token_limits_keep_latest_turns(self):
+        store = InMemorySessionStore(max_turns=2, max_tokens=10)
+
+        async def run():
+            for i in range(3):
+                await store.append_turn("chat", f"q{i}", f"a{i}")
+            turns_limited = await store.get_history("chat")
+            await store.append_turn("chat", "x" * 100, "y")
+            return turns_limited, await store.get_history("chat")
+
+        turns_limited, token_limited = asyncio.run(run())
+        self.assertEqual(turns_limited, [("human", "q1"), ("assistant", "a1"), ("human", "q2"), ("assistant", "a2")])
+        # Последний ход сохраняется, даже если один превышает бюджет токенов
+        self.assertEqual(token_limited, [("human", "x" * 100), ("assistant", "y")])
+        self.assertEqual(store.stats()["trimmed_turns"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import sys
+import unittest
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from mcp_client import MCPClient  # noqa: E402  # isort: skip
+from result_cache import ToolResultCache  # noqa: E402  # isort: skip
+from single_flight import SingleFlight  # noqa: E402  # isort: skip
+
+
+class Upstream:
+    """Запрос, который завершается по команде и считает запуски."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.cancelled = False
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return f"result {self.calls}"
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_concurrent_identical_calls_share_one_request(self):
+        flight = SingleFlight()
+
+        async def run():
+            upstream = Upstream()
+            callers = [asyncio.create_task(flight.do("k", upstream)) for _ in range(5)]
+            other = asyncio.create_task(flight.do("other", upstream))
+            await asyncio.sleep(0)
+            upstream.release.set()
+            results = await asyncio.gather(*callers)
+            return upstream.calls, results, await other
+
+        calls, results, other = asyncio.run(run())
+        self.assertEqual(calls, 2)
+        self.assertEqual(set(results), {results[0]})
+        self.assertNotEqual(other, results[0])
+        stats = flight.stats()
+        self.assertEqual((stats["upstream"], stats["collapsed"], stats["in_flight"]), (2, 4, 0))
+        self.assertAlmostEqual(stats["collapse_rate"], 4 / 6, places=3)
+
+    def test_errors_are_shared_and_not_remembered(self):
+        flight = SingleFlight()
+
+        async def run():
+            upstream = Upstream(error=RuntimeError("gitlab down"))
+            callers = [asyncio.create_task(flight.do("k", upstream)) for _ in range(2)]
+            await asyncio.sleep(0)
+            upstream.release.set()
+            results = await asyncio.gather(*callers, return_exceptions=True)
+            upstream.error = None
+            return results, await flight.do("k", upstream)
+
+        results, retry = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(retry, "result 2")
+
+    def test_cancelling_one_waiter_keeps_request_for_others(self):
+        flight = SingleFlight()
+
+        async def run():
+            upstream = Upstream()
+            first = asyncio.create_task(flight.do("k", upstream))
+            second = asyncio.create_task(flight.do("k", upstream))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            self.assertFalse(upstream.cancelled)
+            upstream.release.set()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "result 1")
+
+    def test_request_is_cancelled_when_nobody_waits(self):
+        flight = SingleFlight()
+
+        async def run():
+            upstream = Upstream()
+            callers = [asyncio.create_task(flight.do("k", upstream)) for _ in range(2)]
+            await asyncio.sleep(0)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0)
+            return upstream.cancelled
+
+        self.assertTrue(asyncio.run(run()))
+
+
+class MCPClientSingleFlightTests(unittest.TestCase):
+    def test_only_read_only_tools_are_collapsed(self):
+        calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            result = {}
+            if payload["method"] == "tools/call":
+                calls.append(payload["params"]["name"])
+                await asyncio.sleep(0.01)
+                result = {"content": [{"type": "text", "text": "ok"}]}
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": result})
+
+        async def run():
+            flight = SingleFlight()
+            async with MCPClient(
+                "http://single-flight", transport=httpx.MockTransport(handler), single_flight=flight
+            ) as client:
+                await client.list_tools()
+                args = {"chat_id": "1", "project_path": "g/p"}
+                await asyncio.gather(*(client.call_tool("get_pipeline_status", args) for _ in range(3)))
+                await asyncio.gather(*(client.call_tool("retry_pipeline", args) for _ in range(2)))
+
+        asyncio.run(run())
+        self.assertEqual(calls, ["get_pipeline_status", "retry_pipeline", "retry_pipeline"])
+
+    def test_calls_from_different_chats_are_not_collapsed(self):
+        chats = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            result = {}
+            if payload["method"] == "tools/call":
+                chats.append(payload["params"]["arguments"]["chat_id"])
+                await asyncio.sleep(0.01)
+                result = {"content": [{"type": "text", "text": "ok"}]}
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": result})
+
+        async def run():
+            async with MCPClient(
+                "http://single-flight", transport=httpx.MockTransport(handler), single_flight=SingleFlight()
+            ) as client:
+                await client.list_tools()
+                await asyncio.gather(*(
+                    client.call_tool("list_projects", {"chat_id": chat_id}) for chat_id in ("1", "1", "2")
+                ))
+
+        asyncio.run(run())
+        self.assertEqual(sorted(chats), ["1", "2"])
+
+    def test_call_after_mutation_does_not_join_older_flight(self):
+        issues = ["old"]
+        release = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            result = {}
+            if payload["method"] == "tools/call":
+                name = payload["params"]["name"]
+                if name == "create_issue":
+                    issues.append("new")
+                    text = "created"
+                else:
+                    text = ",".join(issues)
+                    await release.wait()
+                result = {"content": [{"type": "text", "text": text}]}
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": payload["id"], "result": result})
+
+        async def run():
+            cache = ToolResultCache()
+            async with MCPClient(
+                "http://single-flight", transport=httpx.MockTransport(handler),
+                result_cache=cache, single_flight=SingleFlight(),
+            ) as client:
+                await client.list_tools()
+                args = {"chat_id": "1", "project_path": "g/p"}
+                before = asyncio.ensure_future(client.call_tool("list_issues", args))
+                await asyncio.sleep(0.01)
+                await client.call_tool("create_issue", {**args, "title": "t"})
+                after = asyncio.ensure_future(client.call_tool("list_issues", args))
+                await asyncio.sleep(0.01)
+                release.set()
+                results = await asyncio.gather(before, after)
+                return results, await client.call_tool("list_issues", args)
+
+        (before, after), cached = asyncio.run(run())
+        self.assertEqual(before, "old")
+        self.assertEqual(after, "old,new")
+        self.assertEqual(cached, "old,new")
+
+
+if __name__ == "__main__":
+    unittest.main()
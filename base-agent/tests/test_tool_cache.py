@@ -0,0 +1,89 @@
+import asyncio
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import agent  # noqa: E402  # isort: skip
+from tool_cache import ToolSchemaCache  # noqa: E402  # isort: skip
+
+
+class FakeListingClient:
+    """Фейковый MCP клиент с изменяемым списком инструментов."""
+
+    listings = {}
+    list_calls = []
+
+    def __init__(self, url: str):
+        self.url = url
+        self.protocol_version = "2025-06-18"
+        self.server_info = {}
+
+    async def list_tools(self):
+        self.list_calls.append(self.url)
+        self.server_info = {"name": "fake", "version": "1"}
+        return self.listings[self.url]
+
+    async def call_tool(self, name, arguments):
+        return f"{name}:{arguments}"
+
+    async def aclose(self):
+        pass
+
+
+class ToolCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "cache" / "mcp_tools.json")
+        FakeListingClient.listings = {
+            "http://one": [{"name": "list_projects", "description": "", "inputSchema": {}}],
+        }
+        FakeListingClient.list_calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_store_and_load_roundtrip(self):
+        cache = ToolSchemaCache(self.path)
+        tools = [{"name": "a", "description": "", "inputSchema": {"properties": {"x": {"type": "string"}}}}]
+        listing_hash = cache.store("http://one", "v1", tools, {"name": "srv"})
+
+        entry = cache.load("http://one", "v1")
+        self.assertEqual(entry["tools"], tools)
+        self.assertEqual(entry["hash"], listing_hash)
+        self.assertIsNone(cache.load("http://one", "v2"))
+        self.assertIsNone(cache.load("http://other", "v1"))
+
+    def test_corrupted_entry_is_ignored(self):
+        cache = ToolSchemaCache(self.path)
+        cache.store("http://one", "v1", [{"name": "a"}])
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        data["http://one|v1"]["tools"].append({"name": "injected"})
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        self.assertIsNone(cache.load("http://one", "v1"))
+
+    def test_second_start_uses_cache_without_network(self):
+        cache = ToolSchemaCache(self.path)
+        with patch("agent.MCPClient", FakeListingClient):
+            first = asyncio.run(agent.load_mcp_servers_async("http://one", cache=cache))
+            second = asyncio.run(agent.load_mcp_servers_async("http://one", cache=cache))
+
+        self.assertEqual(FakeListingClient.list_calls, ["http://one"])
+        self.assertFalse(first[0].from_cache)
+        self.assertTrue(second[0].from_cache)
+        self.assertEqual(first[0].listing_hash, second[0].listing_hash)
+        self.assertEqual([t.name for t in agent.tools_from_discoveries(second)], ["list_projects"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import agent  # noqa: E402  # isort: skip
+from review import ReviewPipeline  # noqa: E402  # isort: skip
+from tool_cache import ToolSchemaCache  # noqa: E402  # isort: skip
+from tool_refresh import TOOLS_LIST_CHANGED, ToolSetRefresher, diff_tool_listings  # noqa: E402  # isort: skip
+
+
+class FakeListingClient:
+    """Фейковый MCP клиент с изменяемым списком инструментов."""
+
+    listings = {}
+
+    def __init__(self, url: str):
+        self.url = url
+        self.base_url = url
+        self.protocol_version = "2025-06-18"
+        self.server_info = {}
+        self.supports_tools_list_changed = False
+        self.handlers = []
+
+    def add_notification_handler(self, handler):
+        self.handlers.append(handler)
+
+    async def list_tools(self):
+        return list(self.listings[self.url])
+
+    async def call_tool(self, name, arguments):
+        return f"{name}:{arguments}"
+
+    async def aclose(self):
+        pass
+
+
+class FakeWrapper:
+    def __init__(self, agent_executor, review=None):
+        self.agent_executor = agent_executor
+        self.review = review
+
+
+def tool(name, description=""):
+    return {"name": name, "description": description, "inputSchema": {}}
+
+
+class ToolRefreshTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ToolSchemaCache(str(Path(self.tmp.name) / "mcp_tools.json"))
+        FakeListingClient.listings = {"http://one": [tool("list_projects")]}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load_cached_servers(self):
+        with patch("agent.MCPClient", FakeListingClient):
+            asyncio.run(agent.load_mcp_servers_async("http://one", cache=self.cache))
+            return asyncio.run(agent.load_mcp_servers_async("http://one", cache=self.cache))
+
+    def test_diff_tool_listings(self):
+        added, removed, changed = diff_tool_listings(
+            [tool("a"), tool("b"), tool("c")],
+            [tool("a"), tool("c", "new"), tool("d")],
+        )
+        self.assertEqual((added, removed, changed), (["d"], ["b"], ["c"]))
+
+    def test_refresh_swaps_executor_only_when_listing_changes(self):
+        servers = self.load_cached_servers()
+        wrapper = FakeWrapper("initial")
+        refresher = ToolSetRefresher(wrapper, servers, cache=self.cache, timeout=1, interval=0)
+        self.assertTrue(refresher.needs_revalidation)
+
+        with patch("tool_refresh.create_langchain_agent", side_effect=lambda tools: [t.name for t in tools]):
+            self.assertFalse(asyncio.run(refresher.refresh()))
+            self.assertEqual(wrapper.agent_executor, "initial")
+            self.assertFalse(refresher.needs_revalidation)
+
+            FakeListingClient.listings["http://one"] = [tool("list_projects"), tool("list_issues")]
+            self.assertTrue(asyncio.run(refresher.refresh()))
+
+        self.assertEqual(wrapper.agent_executor, ["list_projects", "list_issues"])
+        self.assertEqual(len(self.cache.load("http://one", "2025-06-18")["tools"]), 2)
+
+    def test_review_pipeline_picks_up_server_added_by_refresh(self):
+        servers = self.load_cached_servers()
+        review = ReviewPipeline(None, None)
+        review.bind(servers)
+        wrapper = FakeWrapper("initial", review)
+        refresher = ToolSetRefresher(wrapper, servers, cache=self.cache, timeout=1, interval=0)
+        self.assertIsNone(review.match("Сделай ревью group/app!7"))
+
+        FakeListingClient.listings["http://one"] = [tool("list_projects"), tool("get_mr_details")]
+        with patch("tool_refresh.create_langchain_agent", side_effect=lambda tools: [t.name for t in tools]):
+            asyncio.run(refresher.refresh())
+
+        self.assertIs(review.mcp_client, servers[0].client)
+        self.assertIsNotNone(review.match("Сделай ревью group/app!7"))
+
+    def test_list_changed_notification_triggers_refresh(self):
+        servers = self.load_cached_servers()
+        wrapper = FakeWrapper("initial")
+        refresher = ToolSetRefresher(wrapper, servers, cache=self.cache, timeout=1, interval=0)
+        client = servers[0].client
+
+        async def run():
+            async with refresher.lifespan(app=None):
+                await asyncio.sleep(0.01)
+                self.assertEqual(wrapper.agent_executor, "initial")
+
+                FakeListingClient.listings["http://one"] = [tool("create_issue")]
+                for handler in client.handlers:
+                    handler({"jsonrpc": "2.0", "method": TOOLS_LIST_CHANGED})
+                for _ in range(100):
+                    if wrapper.agent_executor != "initial":
+                        break
+                    await asyncio.sleep(0.01)
+
+        with patch("tool_refresh.create_langchain_agent", side_effect=lambda tools: [t.name for t in tools]):
+            asyncio.run(run())
+
+        self.assertEqual(wrapper.agent_executor, ["create_issue"])
+
+
+if __name__ == "__main__":
+    unittest.main()
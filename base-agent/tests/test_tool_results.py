@@ -0,0 +1,127 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import agent  # noqa: E402  # isort: skip
+from tool_results import (  # noqa: E402  # isort: skip
+    READ_RESULT_TOOL_NAME,
+    ToolResultPager,
+    content_to_text,
+    session_scope,
+    split_pages,
+)
+
+
+class BigResultClient:
+    async def call_tool(self, name, arguments):
+        return "\n".join(f"diff line {i}" for i in range(100))
+
+
+class ContentToTextTests(unittest.TestCase):
+    def test_keeps_all_parts_and_omits_binary_payloads(self):
+        result = {
+            "content": [
+                {"type": "text", "text": "summary"},
+                {"type": "text", "text": "details"},
+                {"type": "resource", "resource": {"uri": "gitlab://mr/1.diff", "text": "+added"}},
+                {"type": "image", "mimeType": "image/png", "data": "QUJD" * 1000},
+            ]
+        }
+        text = content_to_text(result)
+        self.assertEqual(text.splitlines()[:3], ["summary", "details", "+added"])
+        self.assertIn("image image/png", text)
+        self.assertNotIn("QUJD", text)
+
+    def test_result_without_content_is_stringified(self):
+        self.assertEqual(content_to_text({"ok": True}), "{'ok': True}")
+
+
+class ToolResultPagerTests(unittest.TestCase):
+    def test_split_pages_prefers_line_boundaries(self):
+        pages = split_pages("aaaa\nbbbb\ncccc\n", 7)
+        self.assertEqual(pages, ["aaaa\n", "bbbb\n", "cccc\n"])
+        self.assertEqual("".join(split_pages("x" * 25, 10)), "x" * 25)
+
+    def test_small_result_is_returned_as_is(self):
+        pager = ToolResultPager(max_chars=100)
+        self.assertEqual(pager.fit("list_issues", "short"), "short")
+        self.assertEqual(pager.stats()["stored"], 0)
+
+    def test_large_result_is_paged_with_handle(self):
+        pager = ToolResultPager(max_chars=50)
+        text = "\n".join(f"line {i:02d}" for i in range(20))
+        first = pager.fit("get_mr_details", text)
+        self.assertIn("Страница 1 из", first)
+        handle = first.split('handle="')[1].split('"')[0]
+
+        pages = [first.rsplit("\n[", 1)[0]]
+        page = 2
+        while True:
+            chunk = pager.read(handle, page)
+            pages.append(chunk.rsplit("\n[", 1)[0])
+            if "Продолжение" not in chunk:
+                break
+            page += 1
+        self.assertEqual("".join(pages), text)
+        self.assertIn("нет", pager.read(handle, page + 1))
+        self.assertIn("не найден", pager.read("unknown"))
+
+    def test_stored_results_are_bounded(self):
+        pager = ToolResultPager(max_chars=5, max_entries=1)
+        first = pager.fit("t", "x" * 20)
+        pager.fit("t", "y" * 20)
+        handle = first.split('handle="')[1].split('"')[0]
+        self.assertIn("не найден", pager.read(handle))
+
+    def test_pages_are_visible_only_to_their_session(self):
+        pager = ToolResultPager(max_chars=5)
+        with session_scope("chat-1"):
+            first = pager.fit("get_mr_details", "x" * 20)
+        handle = first.split('handle="')[1].split('"')[0]
+
+        with session_scope("chat-2"):
+            self.assertIn("не найден", pager.read(handle))
+        with session_scope("chat-1"):
+            self.assertIn("Страница 2", pager.read(handle))
+
+
+class PagedToolTests(unittest.TestCase):
+    def test_mcp_tool_returns_first_page_and_reader_tool_is_added(self):
+        pager = ToolResultPager(max_chars=200)
+        discovery = agent.MCPServerDiscovery(
+            "http://mcp", BigResultClient(), [{"name": "get_mr_details", "description": "", "inputSchema": {}}]
+        )
+        tools = {tool.name: tool for tool in agent.tools_from_discoveries([discovery], pager)}
+        self.assertEqual(set(tools), {"get_mr_details", READ_RESULT_TOOL_NAME})
+
+        first = tools["get_mr_details"].invoke("")
+        self.assertLess(len(first), 300)
+        handle = first.split('handle="')[1].split('"')[0]
+        second = tools[READ_RESULT_TOOL_NAME].invoke({"handle": handle, "page": 2})
+        self.assertIn("Страница 2", second)
+
+    def test_reader_tool_is_async(self):
+        pager = ToolResultPager(max_chars=5)
+        handle = pager.fit("t", "x" * 20).split('handle="')[1].split('"')[0]
+
+        reader = pager.as_tool()
+        page = asyncio.run(reader.ainvoke({"handle": handle, "page": 2}))
+
+        self.assertIsNotNone(reader.coroutine)
+        self.assertIn("Страница 2", page)
+
+    def test_without_pager_result_is_unchanged(self):
+        tool = agent.create_langchain_tool_from_mcp(
+            BigResultClient(), {"name": "get_mr_details", "description": "", "inputSchema": {}}
+        )
+        self.assertEqual(tool.invoke("").count("\n"), 99)
+
+
+if __name__ == "__main__":
+    unittest.main()
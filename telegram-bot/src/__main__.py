@@ -5,7 +5,10 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from src.config import settings
+from src.chat_dispatcher import chat_dispatcher
 from src.handlers import setup_routers
+from src.outbound import outbound
+from src.webhook import run_webhook
 
 
 logger = logging.getLogger(__name__)
@@ -33,6 +36,9 @@ async def on_startup():
 async def on_shutdown():
     """Действия при остановке бота"""
     logger.info("Bot is shutting down...")
+    # Дорабатываем принятые сообщения и досылаем то, что осталось в очереди исходящих
+    await chat_dispatcher.close(settings.shutdown_timeout)
+    await outbound.close()
     await bot.session.close()
 
 
@@ -40,8 +46,14 @@ async def main():
     """Главная функция запуска бота"""
     try:
         await on_startup()
-        logger.info("Starting polling...")
-        await dp.start_polling(bot)
+        if settings.bot_mode == "webhook":
+            logger.info("Starting webhook server...")
+            await run_webhook(bot, dp)
+        else:
+            logger.info("Starting polling...")
+            # Webhook мог остаться от запуска в webhook режиме
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
         await on_shutdown()
 
@@ -1,58 +1,264 @@
 """A2A клиент для общения с base-agent."""
+import asyncio
+import hashlib
 import logging
-from typing import Optional
-from uuid import uuid4
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Set
+from uuid import NAMESPACE_URL, uuid4, uuid5
 
 import httpx
 from a2a.client import A2ACardResolver, A2AClient
+from a2a.client.errors import A2AClientError
 from a2a.types import (
     AgentCard,
+    CancelTaskRequest,
     Message,
     MessageSendParams,
     SendMessageRequest,
+    SendStreamingMessageRequest,
+    Task,
+    TaskArtifactUpdateEvent,
+    TaskIdParams,
+    TaskState,
+    TaskStatusUpdateEvent,
     TextPart,
 )
 
 from src.config import settings
+from src.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_delay,
+    is_read_timeout,
+    is_transient,
+    was_not_sent,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# Ключ идемпотентности в metadata запроса — агент отвечает на повтор без нового запуска
+IDEMPOTENCY_METADATA_KEY = "idempotency_key"
+
+# Состояния, после которых агент больше ничего не пришлёт
+FINAL_STATES = {
+    TaskState.completed,
+    TaskState.failed,
+    TaskState.canceled,
+    TaskState.rejected,
+    TaskState.input_required,
+    TaskState.auth_required,
+}
+
+
+@dataclass
+class AgentStreamEvent:
+    """Событие потокового ответа агента."""
+
+    kind: str  # "delta" — часть ответа, "event" — действие агента, "final" — полный ответ
+    text: str
+    state: Optional[TaskState] = None
+
+    @property
+    def is_error(self) -> bool:
+        return self.state in (TaskState.failed, TaskState.rejected, TaskState.canceled)
+
+
+@dataclass
+class StreamRun:
+    """Задача агента, запущенная потоковым запросом; не дочитанную до конца отменяют."""
+
+    task_id: Optional[str] = None
+    finished: bool = False
+
+
+@dataclass
+class AgentEndpoint:
+    """Экземпляр агента: адрес, клиент с agent card и предохранитель."""
+
+    url: str
+    breaker: CircuitBreaker
+    client: Optional[A2AClient] = None
+    card: Optional[AgentCard] = None
+    card_fetched_at: float = 0.0
+    in_flight: int = 0
+
 
 class AgentClient:
-    """Клиент для общения с A2A агентом."""
+    """
+    Клиент для общения с A2A агентом.
+
+    - Один пул HTTP соединений на все экземпляры агента (лимиты из настроек).
+    - A2A_AGENT_URL может содержать несколько экземпляров через запятую: запросы
+      одного контекста идут на один и тот же экземпляр (там его история диалога),
+      при его недоступности — на следующий.
+    - Временные сбои повторяются с экспоненциальной паузой и джиттером: всегда,
+      если запрос не дошёл до агента (и тогда на другом экземпляре), иначе — только
+      при наличии ключа идемпотентности и только на том же экземпляре.
+    - На каждый экземпляр — circuit breaker: недоступный экземпляр не получает
+      запросов до пробного запроса после паузы. Таймаут ответа сбоем не считается.
+    - Agent card перечитывается раз в agent_card_ttl секунд.
+    - Потоковый ответ, брошенный до финального статуса (таймаут, отмена задачи
+      бота, обрыв), отменяется на агенте запросом tasks/cancel, чтобы запуск
+      не занимал слот планировщика впустую.
+    """
 
     def __init__(self):
-        self._client: Optional[A2AClient] = None
         self._http_client: Optional[httpx.AsyncClient] = None
-        self._agent_card: Optional[AgentCard] = None
-
-    async def _get_client(self) -> A2AClient:
-        """Получает или создает A2A клиент."""
-        if self._client is None:
-            self._http_client = httpx.AsyncClient(timeout=60.0)
-
-            # Используем A2ACardResolver для получения agent card
-            resolver = A2ACardResolver(
-                httpx_client=self._http_client,
-                base_url=settings.a2a_agent_url,
+        self._endpoints: List[AgentEndpoint] = []
+        self._cancel_tasks: Set[asyncio.Task] = set()
+
+    def _get_endpoints(self) -> List[AgentEndpoint]:
+        if not self._endpoints:
+            self._endpoints = [
+                AgentEndpoint(
+                    url=url,
+                    breaker=CircuitBreaker(settings.agent_breaker_threshold, settings.agent_breaker_reset),
+                )
+                for url in settings.agent_urls
+            ]
+        return self._endpoints
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.agent_timeout, connect=settings.agent_connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=settings.agent_max_connections,
+                    max_keepalive_connections=settings.agent_max_keepalive,
+                ),
             )
+        return self._http_client
 
-            self._agent_card = await resolver.get_agent_card()
-            logger.info(f"Successfully fetched agent card: {self._agent_card.name}")
+    async def _get_client(self, endpoint: AgentEndpoint) -> A2AClient:
+        """Получает или создает A2A клиент экземпляра, обновляя устаревшую agent card."""
+        now = time.monotonic()
+        ttl = settings.agent_card_ttl
+        if endpoint.client is not None and (ttl <= 0 or now - endpoint.card_fetched_at < ttl):
+            return endpoint.client
 
-            # Создаем клиент с полученной agent card
-            self._client = A2AClient(
-                httpx_client=self._http_client,
-                agent_card=self._agent_card,
+        # Используем A2ACardResolver для получения agent card
+        resolver = A2ACardResolver(httpx_client=self._get_http_client(), base_url=endpoint.url)
+        try:
+            card = await resolver.get_agent_card()
+        except Exception as e:
+            if endpoint.client is None:
+                raise
+            # Старая карточка ещё годится; попробуем обновить её через ttl
+            logger.warning(f"Failed to refresh agent card from {endpoint.url}, keeping cached one: {e}")
+            endpoint.card_fetched_at = now
+            return endpoint.client
+
+        if endpoint.card is None or endpoint.card != card:
+            logger.info(f"Successfully fetched agent card from {endpoint.url}: {card.name} {card.version}")
+        endpoint.card = card
+        endpoint.card_fetched_at = now
+        # Создаем клиент с полученной agent card. У реплик обычно общий url в карточке,
+        # поэтому при нескольких экземплярах запросы идут на адрес из A2A_AGENT_URL
+        endpoint.client = A2AClient(
+            httpx_client=self._get_http_client(),
+            agent_card=card,
+            url=endpoint.url if len(self._get_endpoints()) > 1 else None,
+        )
+        return endpoint.client
+
+    def _pick_endpoint(self, context_id: Optional[str], tried: Set[str]) -> AgentEndpoint:
+        """Выбирает экземпляр: доступный, ещё не пробованный, по привязке контекста или наименее занятый."""
+        endpoints = self._get_endpoints()
+        if not endpoints:
+            raise RuntimeError("A2A_AGENT_URL is not configured")
+        available = [e for e in endpoints if e.breaker.available()]
+        if not available:
+            raise CircuitOpenError("Агент временно недоступен")
+        candidates = [e for e in available if e.url not in tried] or available
+        if context_id:
+            # Rendezvous hashing: контекст остаётся на своём экземпляре, пока тот доступен
+            endpoint = max(
+                candidates,
+                key=lambda e: hashlib.sha1(f"{context_id}|{e.url}".encode()).digest(),
             )
-        return self._client
+        else:
+            least = min(e.in_flight for e in candidates)
+            endpoint = random.choice([e for e in candidates if e.in_flight == least])
+        endpoint.breaker.allow()
+        return endpoint
+
+    def _select_endpoint(
+        self, context_id: Optional[str], tried: Set[str], pinned: Optional[AgentEndpoint]
+    ) -> AgentEndpoint:
+        """Экземпляр для очередной попытки; повтор дошедшего запроса идёт только на pinned."""
+        if pinned is None:
+            return self._pick_endpoint(context_id, tried)
+        if not pinned.breaker.allow():
+            raise CircuitOpenError("Агент временно недоступен")
+        return pinned
+
+    @staticmethod
+    def _record(endpoint: AgentEndpoint, error: BaseException) -> None:
+        """Учитывает исход неудачного запроса в предохранителе экземпляра."""
+        if is_read_timeout(error):
+            # Долгий ответ ещё не признак неисправности — не размыкаем цепь из-за медленных запусков
+            endpoint.breaker.release()
+        elif is_transient(error):
+            endpoint.breaker.record_failure()
+        elif isinstance(error, A2AClientError):
+            # Агент ответил (ошибкой протокола) — значит, он жив
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.release()
+
+    @staticmethod
+    def _should_retry(error: BaseException, attempt: int, idempotency_key: Optional[str]) -> bool:
+        if attempt >= settings.agent_max_retries:
+            return False
+        # Без ключа идемпотентности повтор запроса, дошедшего до агента, запустит его второй раз
+        return was_not_sent(error) or (bool(idempotency_key) and is_transient(error))
+
+    @staticmethod
+    def _retry_pin(endpoint: AgentEndpoint, error: BaseException) -> Optional[AgentEndpoint]:
+        """
+        Куда повторять: не отправленный запрос — на любой экземпляр, дошедший — только туда же.
+        Ключи идемпотентности живут в памяти экземпляра, другой запустил бы агента второй раз.
+        """
+        return None if was_not_sent(error) else endpoint
+
+    async def _call(self, context_id: Optional[str], idempotency_key: Optional[str], operation):
+        """Выполняет operation(client) на одном из экземпляров с повторами при временных сбоях."""
+        tried: Set[str] = set()
+        pinned: Optional[AgentEndpoint] = None
+        attempt = 0
+        while True:
+            endpoint = self._select_endpoint(context_id, tried, pinned)
+            tried.add(endpoint.url)
+            endpoint.in_flight += 1
+            try:
+                client = await self._get_client(endpoint)
+                result = await operation(client)
+                endpoint.breaker.record_success()
+                return result
+            except Exception as e:
+                self._record(endpoint, e)
+                if not self._should_retry(e, attempt, idempotency_key):
+                    raise
+                pinned = self._retry_pin(endpoint, e)
+                delay = backoff_delay(attempt, settings.agent_retry_backoff)
+                logger.warning(f"Agent request to {endpoint.url} failed ({e!r}), retrying in {delay:.2f}s")
+            except BaseException:
+                endpoint.breaker.release()
+                raise
+            finally:
+                endpoint.in_flight -= 1
+            attempt += 1
+            await asyncio.sleep(delay)
 
     async def send_message(
         self,
         message: str,
         user_info: dict,
         context_id: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
     ) -> tuple[str, Optional[str]]:
         """
         Отправляет сообщение агенту с информацией о пользователе.
@@ -61,12 +267,11 @@ class AgentClient:
             message: Сообщение от пользователя
             user_info: Информация о пользователе (telegram_id, username, first_name, last_name)
             context_id: ID контекста для сохранения истории диалога
+            idempotency_key: Стабильный ключ запроса; повтор с тем же ключом агент не выполняет заново
 
         Returns:
             Tuple[ответ от агента, contextId для следующих запросов]
         """
-        client = await self._get_client()
-
         # Формируем сообщение с информацией о пользователе
         user_prefix = self._format_user_info(user_info)
         full_message = f"{user_prefix}\n\n{message}"
@@ -74,20 +279,15 @@ class AgentClient:
         # Создаем запрос по формату A2A протокола
         request = SendMessageRequest(
             id=str(uuid4()),
-            params=MessageSendParams(
-                message=Message(
-                    role="user",
-                    parts=[TextPart(text=full_message)],
-                    message_id=uuid4().hex,
-                    context_id=context_id,  # None при первом запросе, затем сохранённый
-                ),
-            ),
+            params=self._build_params(full_message, context_id, idempotency_key),
         )
 
         logger.info(f"Sending message to agent, context_id={context_id}")
 
         try:
-            response = await client.send_message(request)
+            response = await self._call(
+                context_id, idempotency_key, lambda client: client.send_message(request)
+            )
 
             # Извлекаем текст и contextId из ответа
             # Структура: response.root.result — это Task с history и contextId
@@ -101,6 +301,14 @@ class AgentClient:
                 new_context_id = getattr(result, 'context_id', None)
                 logger.info(f"Response result: context_id={new_context_id}, type={type(result)}")
 
+                # Финальный статус содержит полный ответ; в history лежат промежуточные части
+                status = getattr(result, 'status', None)
+                if status is not None and status.message and status.message.parts:
+                    text = self.parts_to_text(status.message.parts)
+                    if text:
+                        logger.info(f"Found agent message in final status, length={len(text)}")
+                        return text, new_context_id
+
                 # Ищем последнее НЕпустое сообщение от агента
                 if hasattr(result, 'history') and result.history:
                     logger.debug(f"History messages count: {len(result.history)}")
@@ -133,7 +341,8 @@ class AgentClient:
         message: str,
         user_info: dict,
         context_id: Optional[str] = None,
-    ):
+        idempotency_key: Optional[str] = None,
+    ) -> AsyncIterator[AgentStreamEvent]:
         """
         Отправляет сообщение агенту с потоковым ответом.
 
@@ -141,40 +350,153 @@ class AgentClient:
             message: Сообщение от пользователя
             user_info: Информация о пользователе
             context_id: ID контекста для сохранения истории диалога
+            idempotency_key: Стабильный ключ запроса (см. send_message)
 
         Yields:
-            Части ответа от агента
+            AgentStreamEvent: части ответа (delta), события агента (event)
+            и финальный ответ (final)
         """
-        client = await self._get_client()
-
         user_prefix = self._format_user_info(user_info)
         full_message = f"{user_prefix}\n\n{message}"
 
-        request = SendMessageRequest(
+        request = SendStreamingMessageRequest(
             id=str(uuid4()),
-            params=MessageSendParams(
-                message=Message(
-                    role="user",
-                    parts=[TextPart(text=full_message)],
-                    message_id=uuid4().hex,
-                    context_id=context_id,
-                ),
-            ),
+            params=self._build_params(full_message, context_id, idempotency_key),
         )
 
         logger.info(f"Sending streaming message to agent, context_id={context_id}")
 
+        tried: Set[str] = set()
+        pinned: Optional[AgentEndpoint] = None
+        attempt = 0
+        while True:
+            endpoint = self._select_endpoint(context_id, tried, pinned)
+            tried.add(endpoint.url)
+            endpoint.in_flight += 1
+            started = False
+            client: Optional[A2AClient] = None
+            run = StreamRun()
+            retrying = False
+            try:
+                client = await self._get_client(endpoint)
+                async for event in self._read_stream(client, request, run):
+                    if not started:
+                        # Агент начал отвечать — экземпляр жив
+                        started = True
+                        endpoint.breaker.record_success()
+                    yield event
+                return
+            except Exception as e:
+                self._record(endpoint, e)
+                # Часть ответа уже показана пользователю — повторять поздно
+                if started or not self._should_retry(e, attempt, idempotency_key):
+                    logger.error(f"Error in streaming message: {e}", exc_info=True)
+                    raise
+                retrying = True
+                pinned = self._retry_pin(endpoint, e)
+                delay = backoff_delay(attempt, settings.agent_retry_backoff)
+                logger.warning(f"Agent stream from {endpoint.url} failed ({e!r}), retrying in {delay:.2f}s")
+            except BaseException:
+                endpoint.breaker.release()
+                raise
+            finally:
+                endpoint.in_flight -= 1
+                # Повтор с ключом идемпотентности подхватит тот же запуск — его не отменяем
+                if client is not None and run.task_id and not run.finished and not retrying:
+                    self._cancel_in_background(client, run.task_id)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _read_stream(
+        self, client: A2AClient, request: SendStreamingMessageRequest, run: StreamRun
+    ) -> AsyncIterator[AgentStreamEvent]:
+        """Преобразует поток ответов A2A в события AgentStreamEvent; id задачи и её завершение — в run."""
+        artifact_text = ""
+        async for response in client.send_message_streaming(request):
+            result = getattr(response.root, "result", None)
+            if result is None:
+                error = getattr(response.root, "error", None)
+                raise RuntimeError(f"Agent returned error: {error}")
+
+            if isinstance(result, Task):
+                run.task_id = result.id
+                if result.status.state in FINAL_STATES:
+                    run.finished = True
+                continue
+
+            if isinstance(result, (TaskArtifactUpdateEvent, TaskStatusUpdateEvent)):
+                run.task_id = result.task_id
+
+            if isinstance(result, TaskArtifactUpdateEvent):
+                artifact_text += self.parts_to_text(result.artifact.parts)
+                continue
+
+            if isinstance(result, Message):
+                # Агент ответил сообщением без задачи
+                run.finished = True
+                yield AgentStreamEvent("final", self.parts_to_text(result.parts), TaskState.completed)
+                return
+
+            if not isinstance(result, TaskStatusUpdateEvent):
+                continue
+
+            status = result.status
+            text = self._raw_text(status.message.parts) if status.message else ""
+            if result.final or status.state in FINAL_STATES:
+                run.finished = True
+                yield AgentStreamEvent("final", text.strip() or artifact_text, status.state)
+                return
+
+            metadata = (status.message.metadata if status.message else None) or {}
+            kind = "event" if metadata.get("stream") == "event" else "delta"
+            if text:
+                yield AgentStreamEvent(kind, text, status.state)
+
+        # Поток закрылся без финального статуса
+        run.finished = True
+        yield AgentStreamEvent("final", artifact_text, None)
+
+    def _cancel_in_background(self, client: A2AClient, task_id: str) -> None:
+        """Отправляет tasks/cancel, не задерживая того, кто бросил поток (его могли и отменить)."""
+        task = asyncio.create_task(self._cancel_task(client, task_id))
+        self._cancel_tasks.add(task)
+        task.add_done_callback(self._cancel_tasks.discard)
+
+    @staticmethod
+    async def _cancel_task(client: A2AClient, task_id: str) -> None:
         try:
-            async for event in client.send_message_streaming(request):
-                if hasattr(event, 'result') and event.result:
-                    if hasattr(event.result, 'artifacts') and event.result.artifacts:
-                        for artifact in event.result.artifacts:
-                            for part in artifact.parts:
-                                if hasattr(part.root, 'text'):
-                                    yield part.root.text
+            await client.cancel_task(CancelTaskRequest(id=str(uuid4()), params=TaskIdParams(id=task_id)))
+            logger.info(f"Cancelled abandoned agent task {task_id}")
         except Exception as e:
-            logger.error(f"Error in streaming message: {e}", exc_info=True)
-            raise
+            logger.warning(f"Failed to cancel agent task {task_id}: {e}")
+
+    @staticmethod
+    def _build_params(
+        text: str, context_id: Optional[str], idempotency_key: Optional[str]
+    ) -> MessageSendParams:
+        """Параметры запроса; с ключом идемпотентности message_id детерминирован."""
+        if idempotency_key:
+            message_id = uuid5(NAMESPACE_URL, idempotency_key).hex
+            metadata = {IDEMPOTENCY_METADATA_KEY: idempotency_key}
+        else:
+            message_id = uuid4().hex
+            metadata = None
+        return MessageSendParams(
+            message=Message(
+                role="user",
+                parts=[TextPart(text=text)],
+                message_id=message_id,
+                context_id=context_id,  # None при первом запросе, затем сохранённый
+            ),
+            metadata=metadata,
+        )
+
+    @staticmethod
+    def _raw_text(parts) -> str:
+        """Текст частей без обрезки пробелов — важно для склейки потоковых дельт."""
+        return "".join(
+            part.root.text for part in parts or [] if getattr(part.root, "text", None)
+        )
 
     def _format_user_info(self, user_info: dict) -> str:
         """Форматирует информацию о пользователе для передачи агенту."""
@@ -195,10 +517,14 @@ class AgentClient:
 
     async def close(self):
         """Закрывает HTTP клиент."""
+        if self._cancel_tasks:
+            # Отмены брошенных запусков успевают уйти до закрытия пула
+            await asyncio.gather(*self._cancel_tasks, return_exceptions=True)
         if self._http_client:
             await self._http_client.aclose()
             self._http_client = None
-            self._client = None
+        for endpoint in self._endpoints:
+            endpoint.client = None
 
     def parts_to_text(self, parts: list[TextPart]) -> str:
         """Преобразует список частей в текст."""
@@ -0,0 +1,144 @@
+"""Неблокирующая обработка сообщений: очередь на чат, параллельность между чатами."""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from src.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class ChatDispatcher:
+    """
+    Раздаёт сообщения по очередям чатов.
+
+    - Сообщения одного чата обрабатываются строго по очереди.
+    - Разные чаты обрабатываются параллельно, но не больше max_concurrent одновременно.
+    - В очереди чата не больше max_queue_per_chat сообщений: submit вернёт False,
+      и вызывающий может попросить пользователя подождать.
+    - Пока у чата есть работа, раз в keepalive_interval вызывается keepalive,
+      переданный в submit (например, статус "печатает").
+    """
+
+    def __init__(
+        self,
+        max_queue_per_chat: int = 5,
+        max_concurrent: int = 32,
+        keepalive_interval: float = 4.0,
+    ):
+        self.max_queue_per_chat = max_queue_per_chat
+        self.max_concurrent = max_concurrent
+        self.keepalive_interval = keepalive_interval
+        self._queues: Dict[int, Deque[Job]] = {}
+        self._keepalives: Dict[int, Job] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: Optional[asyncio.Event] = None
+        self.stats: Dict[str, float] = {"accepted": 0, "rejected": 0, "failed": 0, "max_wait_seconds": 0.0}
+
+    @classmethod
+    def from_settings(cls) -> "ChatDispatcher":
+        return cls(
+            max_queue_per_chat=settings.chat_queue_size,
+            max_concurrent=settings.max_concurrent_chats,
+            keepalive_interval=settings.typing_interval,
+        )
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Примитивы asyncio привязаны к event loop
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._queues.clear()
+            self._keepalives.clear()
+            self._workers.clear()
+
+    def queued(self, chat_id: int) -> int:
+        return len(self._queues.get(chat_id, ()))
+
+    def submit(self, chat_id: int, job: Job, keepalive: Optional[Job] = None) -> bool:
+        """Ставит обработку сообщения в очередь чата. False — очередь чата переполнена."""
+        self._bind_loop()
+        queue = self._queues.setdefault(chat_id, deque())
+        if len(queue) >= self.max_queue_per_chat:
+            self.stats["rejected"] += 1
+            return False
+        enqueued_at = time.monotonic()
+
+        async def timed_job() -> None:
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], time.monotonic() - enqueued_at)
+            await job()
+
+        queue.append(timed_job)
+        if keepalive is not None:
+            self._keepalives[chat_id] = keepalive
+        self.stats["accepted"] += 1
+        self._idle.clear()
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id))
+        return True
+
+    async def _worker(self, chat_id: int) -> None:
+        # Первый keepalive — сразу, до начала обработки; дальше — фоном по интервалу
+        await self._ping(chat_id)
+        keepalive_task = asyncio.create_task(self._keepalive(chat_id))
+        try:
+            queue = self._queues[chat_id]
+            while queue:
+                job = queue.popleft()
+                async with self._semaphore:
+                    try:
+                        await job()
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        logger.error(f"Failed to process message in chat {chat_id}: {e}", exc_info=True)
+        finally:
+            keepalive_task.cancel()
+            self._queues.pop(chat_id, None)
+            self._keepalives.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+            if not self._workers:
+                self._idle.set()
+
+    async def _ping(self, chat_id: int) -> None:
+        keepalive = self._keepalives.get(chat_id)
+        if keepalive is None:
+            return
+        try:
+            await keepalive()
+        except Exception as e:
+            logger.debug(f"Keepalive failed for chat {chat_id}: {e}")
+
+    async def _keepalive(self, chat_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            await self._ping(chat_id)
+
+    async def join(self) -> None:
+        """Ждёт, пока все очереди будут обработаны."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """Дожидается обработки очередей (не дольше timeout), затем отменяет оставшееся."""
+        try:
+            await asyncio.wait_for(self.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Chat dispatcher drain timed out, cancelling {len(self._workers)} chats")
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+# Глобальный диспетчер сообщений
+chat_dispatcher = ChatDispatcher.from_settings()
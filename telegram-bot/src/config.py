@@ -1,5 +1,5 @@
 import logging
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -16,7 +16,45 @@ class Settings(BaseSettings):
     admin_chat_id: Optional[int] = None
 
     # A2A Agent configuration
-    a2a_agent_url: Optional[str] = None  # URL агента (например: http://localhost:10000)
+    a2a_agent_url: Optional[str] = None  # URL агента или несколько через запятую (например: http://localhost:10000)
+    agent_streaming: bool = True  # Показывать ответ по мере генерации (правками сообщения)
+    stream_edit_interval: float = 1.5  # Минимальный интервал между правками сообщения, сек
+    show_tool_status: bool = True  # Показывать в строке статуса, какой инструмент вызывает агент
+    progress_interval: float = 10.0  # Как часто обновлять время работы в строке статуса, сек (0 — не показывать)
+
+    # Подключение к агенту
+    agent_timeout: float = 60.0  # Таймаут запроса к агенту, сек
+    agent_connect_timeout: float = 5.0  # Таймаут соединения с агентом, сек
+    agent_max_connections: int = 50  # Размер пула соединений к агентам
+    agent_max_keepalive: int = 20  # Сколько соединений держать открытыми между запросами
+    agent_max_retries: int = 2  # Повторов запроса при временных сбоях
+    agent_retry_backoff: float = 0.5  # Базовая пауза между повторами, сек (растёт экспоненциально, с джиттером)
+    agent_breaker_threshold: int = 5  # Сбоев подряд, после которых экземпляр агента считается недоступным
+    agent_breaker_reset: float = 30.0  # Через сколько секунд пробовать недоступный экземпляр снова
+    agent_card_ttl: float = 300.0  # Как часто перечитывать agent card, сек (0 — не перечитывать)
+
+    # Режим получения обновлений: polling или webhook
+    bot_mode: Literal["polling", "webhook"] = "polling"
+    webhook_url: Optional[str] = None  # Публичный адрес бота, например https://bot.example.com
+    webhook_path: str = "/webhook"
+    webhook_secret: Optional[str] = None  # Проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_workers: int = 16  # Сколько обновлений обрабатывать одновременно
+    webhook_queue_size: int = 1000  # Сколько обновлений держать в очереди, дальше — 503
+    shutdown_timeout: float = 30.0  # Сколько ждать обработки очереди при остановке, сек
+
+    # Обработка входящих сообщений
+    chat_queue_size: int = 5  # Сколько сообщений чата может ждать обработки
+    max_concurrent_chats: int = 32  # Сколько чатов обрабатываются одновременно
+    typing_interval: float = 4.0  # Как часто обновлять статус "печатает", сек
+
+    # Лимиты исходящих запросов к Telegram
+    telegram_global_rate: float = 25.0  # запросов в секунду на весь бот
+    telegram_chat_rate: float = 1.0  # запросов в секунду в личный чат
+    telegram_group_rate: float = 20 / 60  # запросов в секунду в группу
+    telegram_chat_burst: int = 3  # сколько запросов в чат можно отправить подряд
+    telegram_max_retries: int = 3  # повторов после RetryAfter
 
     model_config = SettingsConfigDict(
         env_file='.env',
@@ -24,7 +62,7 @@ class Settings(BaseSettings):
         case_sensitive=False
     )
 
-    @field_validator("admin_chat_id", mode="before")
+    @field_validator("admin_chat_id", "webhook_url", "webhook_secret", mode="before")
     @classmethod
     def empty_str_to_none(cls, v):
         # При отсутствии переменной pydantic может передать пустую строку из .env
@@ -32,5 +70,10 @@ class Settings(BaseSettings):
             return None
         return v
 
+    @property
+    def agent_urls(self) -> List[str]:
+        """Список экземпляров агента из A2A_AGENT_URL."""
+        return [url.strip() for url in (self.a2a_agent_url or "").split(",") if url.strip()]
+
 
 settings = Settings()
\ No newline at end of file
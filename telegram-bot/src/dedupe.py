@@ -0,0 +1,58 @@
+"""Дедупликация сообщений пользователя на пути бот → агент."""
+import logging
+from typing import Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Текст для сравнения повторов: без регистра и лишних пробелов."""
+    return " ".join((text or "").casefold().split())
+
+
+def idempotency_key(chat_id: int, message_id: int) -> str:
+    """
+    Ключ идемпотентности запроса к агенту.
+
+    Строится из сообщения Telegram, поэтому повторная доставка того же обновления
+    и повторная отправка запроса клиентом дают тот же ключ.
+    """
+    return f"tg:{chat_id}:{message_id}"
+
+
+class InFlightRequests:
+    """
+    Таблица сообщений, которые сейчас обрабатываются, по (chat_id, нормализованный текст).
+
+    Повтор того же текста в том же чате, пока первый запрос ещё не завершён,
+    присоединяется к нему: новый запуск агента не нужен, ответ придёт на первое сообщение.
+    """
+
+    def __init__(self):
+        # Ключ -> сколько повторов присоединилось к запросу
+        self._entries: Dict[Tuple[int, str], int] = {}
+        self.stats: Dict[str, int] = {"started": 0, "duplicates": 0}
+
+    def begin(self, chat_id: int, text: str) -> Optional[int]:
+        """Регистрирует запрос. None — запрос новый, иначе номер повтора (1, 2, ...)."""
+        key = (chat_id, normalize_text(text))
+        if key in self._entries:
+            self._entries[key] += 1
+            self.stats["duplicates"] += 1
+            return self._entries[key]
+        self._entries[key] = 0
+        self.stats["started"] += 1
+        return None
+
+    def finish(self, chat_id: int, text: str) -> None:
+        attached = self._entries.pop((chat_id, normalize_text(text)), 0)
+        if attached:
+            logger.info(f"Request in chat {chat_id} finished, {attached} duplicate(s) were attached to it")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Глобальная таблица выполняющихся запросов
+inflight_requests = InFlightRequests()
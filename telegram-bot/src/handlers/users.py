@@ -1,12 +1,27 @@
 import logging
+from typing import Optional
+
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.utils.text_decorations import markdown_decoration as md
 
 from src.config import settings
-from src.texts import START_MESSAGE, HELP_MESSAGE, RESET_MESSAGE
+from src.texts import (
+    START_MESSAGE,
+    HELP_MESSAGE,
+    RESET_MESSAGE,
+    BUSY_MESSAGE,
+    DUPLICATE_MESSAGE,
+    AGENT_UNAVAILABLE_MESSAGE,
+)
 from src.a2a_client import agent_client
+from src.chat_dispatcher import chat_dispatcher
+from src.dedupe import idempotency_key, inflight_requests
+from src.resilience import CircuitOpenError
+from src.outbound import PRIORITY_HIGH, PRIORITY_LOW, answer, send_chat_action
+from src.streaming import StreamingReply
 from src.utils import split_long_message
 
 logger = logging.getLogger(__name__)
@@ -17,14 +32,14 @@ router = Router()
 @router.message(Command("start"))
 async def start_handler(message: Message):
     """Обработчик команды /start"""
-    await message.answer(START_MESSAGE)
+    await answer(message, START_MESSAGE)
     logger.info(f"User {message.from_user.id} (chat {message.chat.id}) started the bot")
 
 
 @router.message(Command("help"))
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
-    await message.answer(HELP_MESSAGE)
+    await answer(message, HELP_MESSAGE)
 
 
 @router.message(Command("reset"))
@@ -51,49 +66,152 @@ async def reset_handler(message: Message):
                 message="Выполни команду: разрегистрировать пользователя и очистить все данные",
                 user_info=user_info,
                 context_id=context_id,
+                idempotency_key=idempotency_key(chat_id, message.message_id),
             )
 
-            await message.answer(ai_response, parse_mode="Markdown", disable_web_page_preview=True)
+            await answer(message, ai_response, parse_mode="Markdown", disable_web_page_preview=True)
             logger.info(f"Reset completed for user {user_id}")
         else:
-            await message.answer(RESET_MESSAGE)
+            await answer(message, RESET_MESSAGE)
 
     except Exception as e:
         logger.error(f"Error resetting context for user {user_id}: {e}", exc_info=True)
-        await message.answer(
-            "Произошла ошибка при сбросе контекста. Попробуйте еще раз."
-        )
+        await answer(message, "Произошла ошибка при сбросе контекста. Попробуйте еще раз.")
+
+
+def build_user_info(message: Message) -> dict:
+    """Информация о пользователе для агента."""
+    return {
+        "telegram_id": message.from_user.id,
+        "username": message.from_user.username,
+        "first_name": message.from_user.first_name,
+        "last_name": message.from_user.last_name,
+    }
+
+
+async def send_response(message: Message, text: str) -> int:
+    """Отправляет ответ, разбивая его на части по лимиту Telegram. Возвращает число сообщений."""
+    message_chunks = split_long_message(text)
+
+    if len(message_chunks) > 1:
+        logger.info(f"Splitting response into {len(message_chunks)} messages for chat {message.chat.id}")
+
+    # Короткие ответы идут вперёд длинных многочастных
+    priority = PRIORITY_HIGH if len(message_chunks) == 1 else PRIORITY_LOW
+
+    for chunk in message_chunks:
+        try:
+            safe_chunk = md.quote(chunk)
+            # Пытаемся отправить с Markdown и без превью ссылок
+            await answer(
+                message, safe_chunk, priority, parse_mode="MarkdownV2", disable_web_page_preview=True
+            )
+        except TelegramBadRequest as e:
+            logger.warning(f"Failed to send with Markdown, sending as plain text: {e}")
+            # Если не получилось - отправляем как plain text
+            await answer(message, chunk, priority, disable_web_page_preview=True)
+    return len(message_chunks)
+
+
+async def stream_agent_response(
+    message: Message, user_text: str, user_info: dict, context_id: str, request_key: Optional[str] = None
+) -> None:
+    """Показывает ответ агента по мере генерации, редактируя сообщение."""
+    reply = StreamingReply(
+        message,
+        edit_interval=settings.stream_edit_interval,
+        progress_interval=settings.progress_interval,
+    )
+    await reply.start()
+    events = agent_client.send_message_streaming(
+        message=user_text,
+        user_info=user_info,
+        context_id=context_id,
+        idempotency_key=request_key,
+    )
+    try:
+        final_text = None
+        async for event in events:
+            if event.kind == "delta":
+                await reply.append(event.text)
+            elif event.kind == "event" and settings.show_tool_status:
+                # Строка статуса: какой инструмент вызывает агент
+                await reply.set_status(event.text)
+            elif event.kind == "final":
+                final_text = event.text
+                break
+        await reply.finish(final_text)
+    except CircuitOpenError:
+        logger.warning(f"Agent is unavailable, chat {context_id}")
+        await reply.finish(AGENT_UNAVAILABLE_MESSAGE)
+    except Exception as e:
+        logger.error(f"Error streaming response for chat {context_id}: {e}", exc_info=True)
+        await reply.finish("Произошла ошибка при обработке вашего сообщения. Попробуйте еще раз.")
+    finally:
+        # Задачу могли отменить (таймаут диспетчера) — без этого сообщение правилось бы и дальше
+        reply.close()
+        # Брошенный до конца поток сразу отменяет запуск на агенте, не дожидаясь сборщика мусора
+        await events.aclose()
 
 
 @router.message(F.text)
 async def process_user_message_handler(message: Message):
-    """Обработчик сообщений пользователя - отправляет в A2A агент"""
-    user_text = message.text
-    user_id = message.from_user.id
+    """Обработчик сообщений пользователя - ставит сообщение в очередь чата и сразу возвращается"""
     chat_id = message.chat.id
 
-    logger.info(f"Received message from user {user_id} in chat {chat_id}: {user_text[:50]}...")
+    logger.info(f"Received message from user {message.from_user.id} in chat {chat_id}: {message.text[:50]}...")
 
-    await message.bot.send_chat_action(chat_id=chat_id, action="typing")
+    # Тот же текст, пока прошлый запрос ещё обрабатывается, — ответ придёт на первое сообщение
+    duplicate = inflight_requests.begin(chat_id, message.text)
+    if duplicate is not None:
+        logger.info(f"Duplicate message in chat {chat_id} attached to running request (#{duplicate})")
+        if duplicate == 1:
+            await answer(message, DUPLICATE_MESSAGE)
+        return
+
+    async def typing():
+        await send_chat_action(message.bot, chat_id)
+
+    async def job():
+        try:
+            await handle_user_message(message)
+        finally:
+            inflight_requests.finish(chat_id, message.text)
+
+    # Сообщения одного чата обрабатываются по очереди, разные чаты — параллельно
+    if not chat_dispatcher.submit(chat_id, job, keepalive=typing):
+        inflight_requests.finish(chat_id, message.text)
+        logger.warning(f"Chat {chat_id} queue is full, rejecting message")
+        await answer(message, BUSY_MESSAGE)
+
+
+async def handle_user_message(message: Message):
+    """Обрабатывает сообщение пользователя - отправляет в A2A агент"""
+    user_text = message.text
+    user_id = message.from_user.id
+    chat_id = message.chat.id
 
     try:
         # Используем chat_id как context_id - одна сессия на чат
         context_id = str(chat_id)
 
         # Формируем информацию о пользователе для агента
-        user_info = {
-            "telegram_id": user_id,
-            "username": message.from_user.username,
-            "first_name": message.from_user.first_name,
-            "last_name": message.from_user.last_name,
-        }
+        user_info = build_user_info(message)
+        # Стабильный ключ: повторная доставка того же сообщения не запустит агента заново
+        request_key = idempotency_key(chat_id, message.message_id)
 
         # Отправляем сообщение агенту через A2A
+        if settings.a2a_agent_url and settings.agent_streaming:
+            await stream_agent_response(message, user_text, user_info, context_id, request_key)
+            logger.info(f"Streamed AI response to user {user_id}")
+            return
+
         if settings.a2a_agent_url:
             ai_response, _ = await agent_client.send_message(
                 message=user_text,
                 user_info=user_info,
                 context_id=context_id,
+                idempotency_key=request_key,
             )
         else:
             # Fallback если A2A не настроен
@@ -106,27 +224,13 @@ async def process_user_message_handler(message: Message):
             )
 
         # Разбиваем длинные сообщения на части для соблюдения лимита Telegram
-        message_chunks = split_long_message(ai_response)
-
-        if len(message_chunks) > 1:
-            logger.info(f"Splitting response into {len(message_chunks)} messages for user {user_id}")
-
-        for chunk in message_chunks:
-            try:
-                safe_chunk = md.quote(chunk)
-                # Пытаемся отправить с Markdown и без превью ссылок
-                await message.answer(
-                    safe_chunk, parse_mode="MarkdownV2", disable_web_page_preview=True
-                )
-            except Exception as e:
-                logger.warning(f"Failed to send with Markdown, sending as plain text: {e}")
-                # Если не получилось - отправляем как plain text
-                await message.answer(chunk, disable_web_page_preview=True)
+        sent_count = await send_response(message, ai_response)
 
-        logger.info(f"Sent AI response to user {user_id} ({len(message_chunks)} message(s))")
+        logger.info(f"Sent AI response to user {user_id} ({sent_count} message(s))")
 
+    except CircuitOpenError:
+        logger.warning(f"Agent is unavailable, message from user {user_id} not processed")
+        await answer(message, AGENT_UNAVAILABLE_MESSAGE)
     except Exception as e:
         logger.error(f"Error processing message for user {user_id}: {e}", exc_info=True)
-        await message.answer(
-            "Произошла ошибка при обработке вашего сообщения. Попробуйте еще раз."
-        )
+        await answer(message, "Произошла ошибка при обработке вашего сообщения. Попробуйте еще раз.")
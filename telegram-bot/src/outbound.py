@@ -0,0 +1,272 @@
+"""Очередь исходящих запросов к Telegram с учётом лимитов частоты."""
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from src.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Чем меньше значение, тем раньше отправляется запрос
+PRIORITY_HIGH = 0  # короткие ответы, правки сообщений
+PRIORITY_LOW = 10  # длинные многочастные ответы
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def paused_for(self, now: float) -> float:
+        """Сколько секунд ещё длится пауза после RetryAfter."""
+        return max(0.0, self.paused_until - now)
+
+    def ready_in(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже доступен)."""
+        self._refill(now)
+        wait = self.paused_for(now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Telegram попросил подождать (RetryAfter)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+@dataclass
+class _Job:
+    priority: int
+    seq: int
+    chat_id: int
+    call: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    attempts: int = field(default=0)
+    # False — запрос не тратит токены чата (статус «печатает…»), но ждёт паузы после RetryAfter
+    chat_limited: bool = field(default=True)
+
+
+class OutboundQueue:
+    """
+    Централизованная отправка запросов к Telegram API.
+
+    - Лимиты: общий (global_rate в секунду) и на чат (chat_rate, для групп group_rate)
+      с запасом chat_burst.
+    - Запросы одного чата выполняются строго по порядку и по одному.
+    - Статусы чата (send_chat_action) не тратят токены чата, чтобы не отнимать
+      их у правок потокового ответа; общий лимит и паузы RetryAfter на них действуют.
+    - Между чатами первым идёт запрос с меньшим priority: короткие ответы
+      обгоняют длинные многочастные.
+    - На TelegramRetryAfter чат ставится на паузу, запрос повторяется (до max_retries раз).
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        group_rate: float = 20 / 60,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._in_flight: Set[int] = set()
+        self._seq = itertools.count()
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {"sent": 0, "retry_after": 0, "failed": 0}
+
+    @classmethod
+    def from_settings(cls) -> "OutboundQueue":
+        return cls(
+            global_rate=settings.telegram_global_rate,
+            chat_rate=settings.telegram_chat_rate,
+            chat_burst=settings.telegram_chat_burst,
+            group_rate=settings.telegram_group_rate,
+            max_retries=settings.telegram_max_retries,
+        )
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный chat_id — группа или канал, у них лимит жёстче
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            # Обработчик привязан к текущему event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def send(
+        self,
+        chat_id: int,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_HIGH,
+        chat_limited: bool = True,
+    ) -> Any:
+        """Ставит запрос в очередь и ждёт его результата."""
+        self._ensure_worker()
+        job = _Job(
+            priority, next(self._seq), chat_id, call, asyncio.get_running_loop().create_future(),
+            chat_limited=chat_limited,
+        )
+        self._queues.setdefault(chat_id, deque()).append(job)
+        self._wakeup.set()
+        return await job.future
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values()) + len(self._in_flight)
+
+    def _next_job(self, now: float) -> tuple[Optional[_Job], Optional[float]]:
+        """Выбирает готовый к отправке запрос или время до ближайшей готовности."""
+        global_wait = self._global.ready_in(now)
+        best: Optional[_Job] = None
+        delay: Optional[float] = None
+        for chat_id in list(self._queues):
+            queue = self._queues[chat_id]
+            while queue and queue[0].future.done():
+                # Вызывающий перестал ждать
+                queue.popleft()
+            if not queue:
+                del self._queues[chat_id]
+                continue
+            if chat_id in self._in_flight:
+                continue
+            head = queue[0]
+            bucket = self._bucket(chat_id)
+            chat_wait = bucket.ready_in(now) if head.chat_limited else bucket.paused_for(now)
+            wait = max(global_wait, chat_wait)
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            if best is None or (head.priority, head.seq) < (best.priority, best.seq):
+                best = head
+        # Вёдра простаивающих чатов больше не нужны
+        for chat_id in [c for c in self._buckets if c not in self._queues and c not in self._in_flight]:
+            if self._buckets[chat_id].is_idle(now):
+                del self._buckets[chat_id]
+        return best, delay
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            job, delay = self._next_job(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._queues[job.chat_id].popleft()
+            self._global.consume(now)
+            if job.chat_limited:
+                self._bucket(job.chat_id).consume(now)
+            self._in_flight.add(job.chat_id)
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: _Job) -> None:
+        try:
+            job.attempts += 1
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            self.stats["retry_after"] += 1
+            logger.warning(f"Telegram flood limit for chat {job.chat_id}, retry after {e.retry_after}s")
+            self._bucket(job.chat_id).pause(e.retry_after)
+            if job.attempts <= self.max_retries and not job.future.done():
+                self._queues.setdefault(job.chat_id, deque()).appendleft(job)
+            elif not job.future.done():
+                self.stats["failed"] += 1
+                job.future.set_exception(e)
+        except Exception as e:
+            self.stats["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.stats["sent"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight.discard(job.chat_id)
+            self._semaphore.release()
+            self._wakeup.set()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout) и останавливает обработчик."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+
+
+# Глобальная очередь исходящих сообщений
+outbound = OutboundQueue.from_settings()
+
+
+async def send_request(chat_id: int, method: Callable[..., Awaitable[Any]], *args, priority: int = PRIORITY_HIGH, **kwargs) -> Any:
+    """Вызывает метод Bot API (answer, edit_text, delete, ...) через общую очередь исходящих."""
+    return await outbound.send(chat_id, partial(method, *args, **kwargs), priority)
+
+
+async def send_chat_action(bot: Any, chat_id: int, action: str = "typing") -> Any:
+    """Статус чата через общую очередь, но без расхода токенов чата (см. OutboundQueue)."""
+    return await outbound.send(chat_id, partial(bot.send_chat_action, chat_id, action), PRIORITY_LOW, chat_limited=False)
+
+
+async def answer(message: Message, text: str, priority: int = PRIORITY_HIGH, **kwargs) -> Message:
+    """message.answer через общую очередь исходящих."""
+    return await send_request(message.chat.id, message.answer, text, priority=priority, **kwargs)
@@ -0,0 +1,106 @@
+"""Устойчивость запросов к агенту: circuit breaker, классификация ошибок, повторы с джиттером."""
+import random
+import time
+from typing import Optional
+
+import httpx
+from a2a.client.errors import A2AClientHTTPError, A2AClientTimeoutError
+
+
+# HTTP статусы, при которых агент (или балансировщик перед ним) временно недоступен
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+# Ошибки, после которых запрос точно не дошёл до агента
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(Exception):
+    """Все экземпляры агента недоступны: запросы временно не отправляются."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Временный сбой транспорта: имеет смысл повторить запрос позже или на другой реплике."""
+    if isinstance(error, (A2AClientTimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, A2AClientHTTPError) and error.status_code in RETRYABLE_STATUSES
+
+
+def was_not_sent(error: BaseException) -> bool:
+    """Запрос не дошёл до агента (не удалось соединиться) — повтор безопасен всегда."""
+    current: Optional[BaseException] = error
+    while current is not None:
+        if isinstance(current, _NOT_SENT_ERRORS):
+            return True
+        current = current.__cause__
+    return False
+
+
+def is_read_timeout(error: BaseException) -> bool:
+    """Запрос дошёл до агента, но ответ не уложился в таймаут: агент медленный, а не недоступный."""
+    if was_not_sent(error):
+        return False
+    return isinstance(error, (A2AClientTimeoutError, httpx.ReadTimeout, httpx.WriteTimeout))
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 10.0) -> float:
+    """Пауза перед повтором номер attempt (с 0): экспонента с полным джиттером."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для одного экземпляра агента.
+
+    После failure_threshold сбоев подряд размыкается: запросы на экземпляр не идут
+    reset_timeout секунд. Затем пропускает один пробный запрос (half-open):
+    успех замыкает цепь, сбой снова размыкает её.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; в half-open — только один пробный одновременно."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def available(self) -> bool:
+        """Как allow, но без захвата пробного запроса — для выбора экземпляра."""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._probing)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """Запрос завершился без вердикта (например, отменён) — пробу можно повторить."""
+        self._probing = False
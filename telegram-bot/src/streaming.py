@@ -0,0 +1,211 @@
+"""Потоковый вывод ответа агента в Telegram через редактирование сообщений."""
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from aiogram.utils.text_decorations import markdown_decoration as md
+
+from src.outbound import PRIORITY_HIGH, PRIORITY_LOW, send_request
+from src.utils import TELEGRAM_MAX_MESSAGE_LENGTH, split_long_message
+
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TEXT = "⏳ Думаю..."
+
+
+def find_split_point(text: str, max_length: int) -> int:
+    """Позиция разреза текста не длиннее max_length: по абзацу, строке или пробелу."""
+    if len(text) <= max_length:
+        return len(text)
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, 0, max_length)
+        if position > max_length // 2:
+            return position + len(separator)
+    return max_length
+
+
+class StreamingReply:
+    """
+    Ответ, который дописывается по мере прихода частей от агента.
+
+    Сначала отправляется заглушка, затем она редактируется не чаще одного раза
+    в edit_interval секунд. Когда текст перестаёт помещаться в одно сообщение,
+    заполненная часть фиксируется и продолжение идёт новым сообщением.
+    Финальный текст агента заменяет накопленные части (с Markdown, если получится).
+
+    Пока ответ не готов, последней строкой текущего сообщения показывается статус:
+    что делает агент (set_status) и сколько прошло времени — строка обновляется
+    раз в progress_interval секунд, чтобы долгий запуск не выглядел зависшим.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        edit_interval: float = 1.5,
+        max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+        progress_interval: float = 10.0,
+    ):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.progress_interval = progress_interval
+        self.text = ""
+        self.status: Optional[str] = None
+        self._started = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # Отправленные сообщения и показанный в них текст
+        self._sent: List[Message] = []
+        self._shown: List[str] = []
+        # Смещение в self.text, с которого начинается текущее (последнее) сообщение
+        self._offset = 0
+        self._last_edit = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._priority = PRIORITY_HIGH
+
+    async def start(self) -> None:
+        """Отправляет заглушку, которая будет заменена ответом."""
+        sent = await self._call(self.message.answer, PLACEHOLDER_TEXT, disable_web_page_preview=True)
+        self._sent.append(sent)
+        self._shown.append(PLACEHOLDER_TEXT)
+        self._started = time.monotonic()
+        if self.progress_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def append(self, delta: str) -> None:
+        """Добавляет часть ответа; сообщение обновится с учётом лимита частоты правок."""
+        self.text += delta
+        async with self._lock:
+            await self._rollover()
+        await self._schedule_flush()
+
+    async def set_status(self, status: Optional[str]) -> None:
+        """Показывает, чем сейчас занят агент (например, какой инструмент вызывает)."""
+        self.status = status.strip() if status else None
+        await self._schedule_flush()
+
+    async def _schedule_flush(self) -> None:
+        delay = self._last_edit + self.edit_interval - time.monotonic()
+        if delay <= 0:
+            await self._flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+
+    async def finish(self, text: Optional[str] = None) -> None:
+        """Показывает окончательный ответ: text от агента или накопленные части."""
+        self.close()
+        final_text = text if text else self.text
+        if not final_text.strip():
+            final_text = "Агент не вернул ответ"
+        chunks = split_long_message(final_text, self.max_length)
+        self._priority = PRIORITY_HIGH if len(chunks) == 1 else PRIORITY_LOW
+        async with self._lock:
+            for index, chunk in enumerate(chunks):
+                if index < len(self._sent):
+                    await self._edit(index, chunk, markdown=True)
+                else:
+                    self._sent.append(await self._send(chunk))
+                    self._shown.append(chunk)
+            # Финальный текст короче потоковых частей — лишние сообщения убираем
+            for extra in self._sent[len(chunks):]:
+                try:
+                    await self._call(extra.delete)
+                except Exception as e:
+                    logger.warning(f"Failed to delete extra streamed message: {e}")
+            del self._sent[len(chunks):]
+            del self._shown[len(chunks):]
+
+    def close(self) -> None:
+        """Останавливает фоновые правки (отложенный flush и строку прогресса); безопасно вызывать повторно."""
+        for task in (self._flush_task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+
+    async def _delayed_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._flush()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._schedule_flush()
+
+    def status_line(self) -> str:
+        parts = []
+        if self.status:
+            parts.append(self.status)
+        elapsed = time.monotonic() - self._started
+        if self.progress_interval > 0 and elapsed >= self.progress_interval:
+            parts.append(f"{int(elapsed)} с")
+        return "⏳ " + " · ".join(parts) if parts else ""
+
+    def _render(self) -> str:
+        """Текст текущего сообщения: накопленная часть ответа и строка статуса."""
+        body = self.text[self._offset:]
+        if not body.strip():
+            body = PLACEHOLDER_TEXT
+        line = self.status_line()
+        if line and len(body) + len(line) + 2 <= self.max_length:
+            return f"{body}\n\n{line}"
+        return body
+
+    async def _flush(self) -> None:
+        async with self._lock:
+            if self._sent:
+                await self._edit(len(self._sent) - 1, self._render())
+            self._last_edit = time.monotonic()
+
+    async def _rollover(self) -> None:
+        """Фиксирует заполненное сообщение и начинает новое, если текст не помещается."""
+        while len(self.text) - self._offset > self.max_length:
+            current = self.text[self._offset:]
+            cut = find_split_point(current, self.max_length)
+            await self._edit(len(self._sent) - 1, current[:cut])
+            self._offset += cut
+            rest = self.text[self._offset:self._offset + self.max_length] or PLACEHOLDER_TEXT
+            self._sent.append(await self._call(self.message.answer, rest, disable_web_page_preview=True))
+            self._shown.append(rest)
+            self._last_edit = time.monotonic()
+
+    async def _call(self, method, *args, **kwargs):
+        """Запрос к Telegram через общую очередь исходящих."""
+        return await send_request(self.message.chat.id, method, *args, priority=self._priority, **kwargs)
+
+    async def _send(self, text: str) -> Message:
+        try:
+            return await self._call(
+                self.message.answer, md.quote(text), parse_mode="MarkdownV2", disable_web_page_preview=True
+            )
+        except TelegramBadRequest as e:
+            logger.warning(f"Failed to send with Markdown, sending as plain text: {e}")
+            return await self._call(self.message.answer, text, disable_web_page_preview=True)
+
+    async def _edit(self, index: int, text: str, markdown: bool = False) -> None:
+        if self._shown[index] == text and not markdown:
+            return
+        sent = self._sent[index]
+        try:
+            if markdown:
+                try:
+                    await self._call(
+                        sent.edit_text, md.quote(text), parse_mode="MarkdownV2", disable_web_page_preview=True
+                    )
+                except TelegramBadRequest as e:
+                    if "not modified" in str(e):
+                        raise
+                    logger.warning(f"Failed to edit with Markdown, using plain text: {e}")
+                    await self._call(sent.edit_text, text, disable_web_page_preview=True)
+            else:
+                await self._call(sent.edit_text, text, disable_web_page_preview=True)
+            self._shown[index] = text
+        except TelegramRetryAfter as e:
+            # Очередь исходящих уже исчерпала повторы; следующая правка покажет актуальный текст
+            logger.warning(f"Edit rate limited, retry after {e.retry_after}s")
+            self._last_edit = time.monotonic() + e.retry_after
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                logger.warning(f"Failed to edit streamed message: {e}")
@@ -42,4 +42,13 @@ HELP_MESSAGE = (
 RESET_MESSAGE = (
     "⚠️ Функция сброса контекста еще не реализована.\n\n"
     "В будущем эта команда позволит начать новый диалог без сохранения истории предыдущих сообщений."
-)
\ No newline at end of file
+)
+
+BUSY_MESSAGE = (
+    "⏳ Я ещё обрабатываю ваши предыдущие сообщения. "
+    "Дождитесь ответа и отправьте новое сообщение."
+)
+
+DUPLICATE_MESSAGE = "⏳ Уже работаю над этим сообщением — ответ придёт на первое из них."
+
+AGENT_UNAVAILABLE_MESSAGE = "⚠️ Агент временно недоступен. Попробуйте ещё раз через минуту."
@@ -0,0 +1,144 @@
+"""Webhook режим: приём обновлений через aiohttp и обработка пулом воркеров."""
+import asyncio
+import logging
+import secrets
+import signal
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from src.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateWorkerPool:
+    """
+    Ограниченный пул воркеров, обрабатывающих обновления Telegram параллельно.
+
+    Обновления складываются в очередь размером queue_size; если она заполнена,
+    webhook отвечает 503 и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = 16, queue_size: int = 1000):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self.accepting = False
+        self.stats = {"received": 0, "processed": 0, "failed": 0, "rejected": 0}
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self.accepting = True
+        logger.info(f"Started {self.workers} update workers")
+
+    def submit(self, update: Update) -> bool:
+        """Ставит обновление в очередь; False — если пул не принимает или очередь полна."""
+        if not self.accepting:
+            return False
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["received"] += 1
+        return True
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Worker {index} failed to process update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = 30.0) -> None:
+        """Перестаёт принимать обновления и дожидается обработки очереди (не дольше timeout)."""
+        self.accepting = False
+        pending = self._queue.qsize()
+        if pending:
+            logger.info(f"Draining {pending} queued updates...")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Drain timed out, {self._queue.qsize()} updates dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def create_webhook_app(pool: UpdateWorkerPool, path: str, secret: Optional[str] = None) -> web.Application:
+    """aiohttp приложение: POST path принимает обновления, GET /health — проверка живости."""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": pool.bot})
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+        if not pool.submit(update):
+            # Telegram повторит доставку, пока мы перегружены или останавливаемся
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"accepting": pool.accepting, "queued": pool._queue.qsize(), **pool.stats})
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/health", health)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Регистрирует webhook и обслуживает его до остановки процесса."""
+    if not settings.webhook_url:
+        raise ValueError("WEBHOOK_URL is required for BOT_MODE=webhook")
+
+    pool = UpdateWorkerPool(
+        dp, bot, workers=settings.webhook_workers, queue_size=settings.webhook_queue_size
+    )
+    app = create_webhook_app(pool, settings.webhook_path, settings.webhook_secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.webhook_host, settings.webhook_port)
+
+    pool.start()
+    await site.start()
+    await bot.set_webhook(
+        url=settings.webhook_url.rstrip("/") + settings.webhook_path,
+        secret_token=settings.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook server listening on {settings.webhook_host}:{settings.webhook_port}{settings.webhook_path}")
+
+    # SIGTERM/SIGINT запускают плавную остановку вместо мгновенного завершения
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        await stop.wait()
+        logger.info("Shutdown signal received, stopping webhook server...")
+    finally:
+        # Новые обновления получат 503 и вернутся от Telegram на другую реплику или после рестарта
+        await pool.drain(settings.shutdown_timeout)
+        await runner.cleanup()
@@ -10,7 +10,11 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
+from a2a.types import Task, TaskState, TaskStatus, TaskStatusUpdateEvent  # noqa: E402
+from a2a.utils import new_agent_text_message  # noqa: E402
+
 from src.a2a_client import AgentClient  # noqa: E402
+from src.config import settings  # noqa: E402
 
 
 class FakeTextPart:
@@ -33,18 +37,30 @@ class FakeResult:
         self.artifacts = []
 
 
+class FakeStatus:
+    def __init__(self, text: str):
+        self.message = FakeMessage("agent", text)
+
+
 class FakeResponse:
-    def __init__(self, text: Optional[str]):
+    def __init__(self, text: Optional[str], final: Optional[str] = None):
         self.root = self
         self.result = FakeResult(text)
+        if final is not None:
+            self.result.status = FakeStatus(final)
 
 
 class FakeClient:
-    def __init__(self, text: Optional[str]):
-        self.send_message = AsyncMock(return_value=FakeResponse(text))
+    def __init__(self, text: Optional[str], final: Optional[str] = None):
+        self.send_message = AsyncMock(return_value=FakeResponse(text, final))
 
 
 class A2AClientTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(settings, "a2a_agent_url", "http://agent")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_send_message_reads_history(self):
         client = AgentClient()
 
@@ -57,6 +73,17 @@ class A2AClientTests(unittest.TestCase):
         self.assertEqual(text, "hello")
         self.assertEqual(ctx, "ctx-123")
 
+    def test_send_message_prefers_final_status_over_stream_parts(self):
+        client = AgentClient()
+
+        async def run():
+            fake = FakeClient("последняя часть", final="полный ответ")
+            with patch.object(client, "_get_client", AsyncMock(return_value=fake)):
+                return await client.send_message("msg", {"first_name": "Ivan"})
+
+        text, _ = asyncio.run(run())
+        self.assertEqual(text, "полный ответ")
+
     def test_send_message_empty_history_returns_fallback(self):
         client = AgentClient()
 
@@ -69,6 +96,98 @@ class A2AClientTests(unittest.TestCase):
         self.assertEqual(text, "Агент не вернул ответ")
         self.assertEqual(ctx, "ctx-123")
 
+    def test_idempotency_key_gives_stable_message_id(self):
+        client = AgentClient()
+        fake = FakeClient("hello")
+
+        async def run():
+            with patch.object(client, "_get_client", AsyncMock(return_value=fake)):
+                for key in ("tg:1:10", "tg:1:10", None):
+                    await client.send_message("msg", {}, "1", idempotency_key=key)
+
+        asyncio.run(run())
+        params = [call.args[0].params for call in fake.send_message.call_args_list]
+        # Повтор с тем же ключом — тот же message_id, без ключа — случайный
+        self.assertEqual(params[0].message.message_id, params[1].message.message_id)
+        self.assertNotEqual(params[0].message.message_id, params[2].message.message_id)
+        self.assertEqual(params[0].metadata, {"idempotency_key": "tg:1:10"})
+        self.assertIsNone(params[2].metadata)
+
+
+class Response:
+    def __init__(self, result):
+        self.root = self
+        self.result = result
+
+
+class FakeStreamingClient:
+    """Агент создаёт задачу, отдаёт одну дельту и дальше молчит, пока его не отменят."""
+
+    def __init__(self):
+        self.cancelled = []
+
+    async def send_message_streaming(self, request):
+        status = TaskStatus(state=TaskState.working)
+        yield Response(Task(id="task-1", context_id="1", status=status))
+        yield Response(TaskStatusUpdateEvent(
+            task_id="task-1",
+            context_id="1",
+            final=False,
+            status=TaskStatus(state=TaskState.working, message=new_agent_text_message("часть")),
+        ))
+        await asyncio.sleep(60)
+
+    async def cancel_task(self, request):
+        self.cancelled.append(request.params.id)
+
+
+class StreamCancelTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(settings, "a2a_agent_url", "http://agent")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_abandoned_stream_cancels_agent_task(self):
+        client = AgentClient()
+        fake = FakeStreamingClient()
+
+        async def consume():
+            async for event in client.send_message_streaming("msg", {}, "1"):
+                self.assertEqual(event.text, "часть")
+
+        async def run():
+            with patch.object(client, "_get_client", AsyncMock(return_value=fake)):
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(consume(), timeout=0.1)
+                await client.close()
+
+        asyncio.run(run())
+        self.assertEqual(fake.cancelled, ["task-1"])
+
+    def test_finished_stream_is_not_cancelled(self):
+        client = AgentClient()
+        fake = FakeStreamingClient()
+
+        async def finished_stream(request):
+            yield Response(TaskStatusUpdateEvent(
+                task_id="task-1",
+                context_id="1",
+                final=True,
+                status=TaskStatus(state=TaskState.completed, message=new_agent_text_message("ответ")),
+            ))
+
+        fake.send_message_streaming = finished_stream
+
+        async def run():
+            with patch.object(client, "_get_client", AsyncMock(return_value=fake)):
+                events = [e async for e in client.send_message_streaming("msg", {}, "1")]
+                await client.close()
+            return events
+
+        events = asyncio.run(run())
+        self.assertEqual([(e.kind, e.text) for e in events], [("final", "ответ")])
+        self.assertEqual(fake.cancelled, [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from src.chat_dispatcher import ChatDispatcher  # noqa: E402
+
+
+class ChatDispatcherTests(unittest.TestCase):
+    def test_same_chat_is_ordered_and_chats_run_in_parallel(self):
+        dispatcher = ChatDispatcher(max_queue_per_chat=10)
+        events = []
+
+        def job(chat, name, delay):
+            async def run():
+                events.append(f"start {name}")
+                await asyncio.sleep(delay)
+                events.append(f"end {name}")
+
+            return run
+
+        async def run():
+            dispatcher.submit(1, job(1, "a1", 0.03))
+            dispatcher.submit(1, job(1, "a2", 0))
+            dispatcher.submit(2, job(2, "b1", 0))
+            await dispatcher.join()
+
+        asyncio.run(run())
+        # a2 ждёт a1, а b1 не ждёт никого
+        self.assertLess(events.index("end a1"), events.index("start a2"))
+        self.assertLess(events.index("end b1"), events.index("end a1"))
+
+    def test_global_concurrency_limit(self):
+        dispatcher = ChatDispatcher(max_concurrent=2)
+        state = {"active": 0, "peak": 0}
+
+        async def job():
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+
+        async def run():
+            for chat_id in range(5):
+                dispatcher.submit(chat_id, job)
+            await dispatcher.join()
+
+        asyncio.run(run())
+        self.assertEqual(state["peak"], 2)
+
+    def test_failed_job_does_not_stop_chat_queue(self):
+        dispatcher = ChatDispatcher()
+        done = []
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append("ok")
+
+        async def run():
+            dispatcher.submit(1, broken)
+            dispatcher.submit(1, ok)
+            await dispatcher.join()
+
+        asyncio.run(run())
+        self.assertEqual(done, ["ok"])
+        self.assertEqual(dispatcher.stats["failed"], 1)
+
+    def test_keepalive_runs_while_chat_has_work(self):
+        dispatcher = ChatDispatcher(keepalive_interval=0.01)
+        pings = []
+
+        async def keepalive():
+            pings.append("typing")
+
+        async def run():
+            dispatcher.submit(1, lambda: asyncio.sleep(0.05), keepalive=keepalive)
+            await dispatcher.join()
+            count = len(pings)
+            await asyncio.sleep(0.03)
+            return count
+
+        count = asyncio.run(run())
+        self.assertGreaterEqual(count, 3)
+        # После завершения работы keepalive остановлен
+        self.assertEqual(len(pings), count)
+
+    def test_close_cancels_work_after_timeout(self):
+        dispatcher = ChatDispatcher()
+        cancelled = []
+
+        async def stuck():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            dispatcher.submit(1, stuck)
+            await asyncio.sleep(0)
+            await dispatcher.close(timeout=0.01)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,13 @@ if str(SRC) not in sys.path:
 
 from src.handlers.users import process_user_message_handler  # noqa: E402
 from src.handlers import users  # noqa: E402
+from src.a2a_client import AgentStreamEvent  # noqa: E402
+from src.streaming import PLACEHOLDER_TEXT  # noqa: E402
+from src.chat_dispatcher import ChatDispatcher  # noqa: E402
+from src.texts import BUSY_MESSAGE, DUPLICATE_MESSAGE  # noqa: E402
+from a2a.types import TaskState  # noqa: E402
+from src import outbound as outbound_module  # noqa: E402
+from src.outbound import OutboundQueue  # noqa: E402
 
 
 class DummyUser:
@@ -34,19 +41,42 @@ class DummyBot:
         self.actions.append((chat_id, action))
 
 
+class DummySent:
+    def __init__(self, text):
+        self.text = text
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+    async def delete(self):
+        pass
+
+
 class DummyMessage:
-    def __init__(self, text="hi", uid=1, cid=2):
+    def __init__(self, text="hi", uid=1, cid=2, mid=1):
         self.text = text
+        self.message_id = mid
         self.from_user = DummyUser(uid)
         self.chat = DummyChat(cid)
         self.bot = DummyBot()
         self.answers = []
+        self.sent = []
 
     async def answer(self, text, **kwargs):
         self.answers.append((text, kwargs))
+        sent = DummySent(text)
+        self.sent.append(sent)
+        return sent
 
 
 class HandlersTests(unittest.TestCase):
+    def setUp(self):
+        # Без лимитов Telegram, чтобы тесты не ждали
+        fast = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        patcher = patch.object(outbound_module, "outbound", fast)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_process_user_message_handler_fallback_without_a2a(self):
         msg = DummyMessage(text="привет", uid=42, cid=99)
 
@@ -54,6 +84,7 @@ class HandlersTests(unittest.TestCase):
             with patch.object(users.settings, "a2a_agent_url", None), \
                  patch.object(users.agent_client, "send_message", AsyncMock(side_effect=AssertionError("should not call agent"))):
                 await process_user_message_handler(msg)
+                await users.chat_dispatcher.join()
 
         asyncio.run(run())
 
@@ -65,6 +96,123 @@ class HandlersTests(unittest.TestCase):
         # Проверяем, что typing действие отправлялось
         self.assertIn((msg.chat.id, "typing"), msg.bot.actions)
 
+    def test_process_user_message_handler_streams_agent_response(self):
+        msg = DummyMessage(text="статус пайплайна", uid=42, cid=99)
+
+        async def fake_stream(message, user_info, context_id, idempotency_key=None):
+            self.assertEqual(context_id, "99")
+            self.assertEqual(idempotency_key, "tg:99:1")
+            yield AgentStreamEvent("event", "Использую инструмент: get_pipeline_status\n")
+            yield AgentStreamEvent("delta", "Пайплайн ")
+            yield AgentStreamEvent("delta", "успешен")
+            yield AgentStreamEvent("final", "Пайплайн успешен", TaskState.completed)
+
+        async def run():
+            with patch.object(users.settings, "a2a_agent_url", "http://agent"), \
+                 patch.object(users.settings, "agent_streaming", True), \
+                 patch.object(users.settings, "stream_edit_interval", 0), \
+                 patch.object(users.agent_client, "send_message_streaming", fake_stream):
+                await process_user_message_handler(msg)
+                await users.chat_dispatcher.join()
+
+        asyncio.run(run())
+
+        # Один плейсхолдер, который затем редактируется до полного ответа
+        self.assertEqual(len(msg.answers), 1)
+        self.assertEqual(msg.answers[0][0], PLACEHOLDER_TEXT)
+        self.assertEqual(msg.sent[0].text, "Пайплайн успешен")
+
+    def test_cancelled_stream_stops_progress_updates(self):
+        msg = DummyMessage(text="долгий запрос", uid=42, cid=99)
+
+        async def endless_stream(message, user_info, context_id, idempotency_key=None):
+            yield AgentStreamEvent("delta", "Думаю")
+            await asyncio.Event().wait()
+
+        async def run():
+            with patch.object(users.settings, "progress_interval", 0.01), \
+                 patch.object(users.settings, "stream_edit_interval", 0), \
+                 patch.object(users.agent_client, "send_message_streaming", endless_stream):
+                task = asyncio.create_task(users.stream_agent_response(msg, "долгий запрос", {}, "99"))
+                await asyncio.sleep(0.05)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await asyncio.sleep(0.02)
+                return [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()]
+
+        leftover = asyncio.run(run())
+        # После отмены задачи строка прогресса больше не обновляется
+        self.assertEqual([t.get_coro().__qualname__ for t in leftover if "StreamingReply" in t.get_coro().__qualname__], [])
+
+    def test_handler_returns_before_agent_answers_and_rejects_overflow(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def slow_send_message(message, user_info, context_id, idempotency_key=None):
+            calls.append(message)
+            await release.wait()
+            return f"ответ на {message}", context_id
+
+        messages = [DummyMessage(text=f"m{i}", uid=1, cid=5) for i in range(4)]
+
+        async def run():
+            dispatcher = ChatDispatcher(max_queue_per_chat=2)
+            with patch.object(users, "chat_dispatcher", dispatcher), \
+                 patch.object(users.settings, "a2a_agent_url", "http://agent"), \
+                 patch.object(users.settings, "agent_streaming", False), \
+                 patch.object(users.agent_client, "send_message", slow_send_message):
+                for msg in messages:
+                    # Обработчик не ждёт ответа агента
+                    await asyncio.wait_for(process_user_message_handler(msg), timeout=1)
+                await asyncio.sleep(0)
+                self.assertEqual(calls, ["m0"])
+                release.set()
+                await dispatcher.join()
+
+        asyncio.run(run())
+
+        # m0 выполняется, m1 и m2 ждут в очереди, m3 — сверх лимита
+        self.assertEqual(calls, ["m0", "m1", "m2"])
+        self.assertEqual(messages[3].answers[0][0], BUSY_MESSAGE)
+        self.assertEqual(messages[2].answers[-1][0], "ответ на m2")
+
+    def test_duplicate_text_attaches_to_running_request(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def slow_send_message(message, user_info, context_id, idempotency_key=None):
+            calls.append((message, idempotency_key))
+            await release.wait()
+            return "ответ", context_id
+
+        messages = [
+            DummyMessage(text="Статус  пайплайна", cid=7, mid=1),
+            DummyMessage(text="статус пайплайна", cid=7, mid=2),
+            DummyMessage(text="статус пайплайна ", cid=7, mid=3),
+        ]
+
+        async def run():
+            with patch.object(users.settings, "a2a_agent_url", "http://agent"), \
+                 patch.object(users.settings, "agent_streaming", False), \
+                 patch.object(users.agent_client, "send_message", slow_send_message):
+                for msg in messages:
+                    await process_user_message_handler(msg)
+                await asyncio.sleep(0)
+                release.set()
+                await users.chat_dispatcher.join()
+                # После ответа тот же текст — уже новый запрос
+                await process_user_message_handler(DummyMessage(text="статус пайплайна", cid=7, mid=4))
+                await users.chat_dispatcher.join()
+
+        asyncio.run(run())
+
+        self.assertEqual(calls, [("Статус  пайплайна", "tg:7:1"), ("статус пайплайна", "tg:7:4")])
+        self.assertEqual(messages[0].answers[-1][0], "ответ")
+        # Пользователь узнаёт о присоединении один раз, дальше повторы молча ждут
+        self.assertEqual([a[0] for a in messages[1].answers], [DUPLICATE_MESSAGE])
+        self.assertEqual(messages[2].answers, [])
+        self.assertEqual(len(users.inflight_requests), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
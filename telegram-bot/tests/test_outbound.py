@@ -0,0 +1,163 @@
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from src.outbound import PRIORITY_HIGH, PRIORITY_LOW, OutboundQueue, TokenBucket  # noqa: E402
+
+
+def retry_after(seconds):
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Flood control exceeded", seconds)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        bucket.consume(now)
+        bucket.consume(now)
+        self.assertAlmostEqual(bucket.ready_in(now), 0.5)
+        self.assertEqual(bucket.ready_in(now + 0.5), 0)
+
+
+class OutboundQueueTests(unittest.TestCase):
+    def test_messages_in_one_chat_keep_order(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        sent = []
+
+        async def send(text, delay):
+            await asyncio.sleep(delay)
+            sent.append(text)
+            return text
+
+        async def run():
+            # Первый запрос медленнее второго, но второй всё равно уходит после него
+            results = await asyncio.gather(
+                queue.send(1, lambda: send("first", 0.02)),
+                queue.send(1, lambda: send("second", 0)),
+            )
+            await queue.close()
+            return results
+
+        self.assertEqual(asyncio.run(run()), ["first", "second"])
+        self.assertEqual(sent, ["first", "second"])
+
+    def test_short_replies_go_before_long_dumps(self):
+        # Общий лимит — 1 запрос за раз, чтобы очередь выстроилась
+        queue = OutboundQueue(global_rate=50, chat_rate=1000, chat_burst=1000)
+        queue._global.tokens = 0
+        sent = []
+
+        async def send(text):
+            sent.append(text)
+
+        async def run():
+            tasks = [
+                asyncio.create_task(queue.send(1, lambda i=i: send(f"long-{i}"), PRIORITY_LOW))
+                for i in range(3)
+            ]
+            tasks.append(asyncio.create_task(queue.send(2, lambda: send("short"), PRIORITY_HIGH)))
+            await asyncio.gather(*tasks)
+            await queue.close()
+
+        asyncio.run(run())
+        self.assertEqual(sent[0], "short")
+        self.assertEqual(sent[1:], ["long-0", "long-1", "long-2"])
+
+    def test_chat_rate_limit_spaces_requests(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=20, chat_burst=1)
+        stamps = []
+
+        async def send():
+            stamps.append(time.monotonic())
+
+        async def run():
+            await asyncio.gather(*(queue.send(1, send) for _ in range(3)))
+            await queue.close()
+
+        asyncio.run(run())
+        self.assertGreaterEqual(stamps[-1] - stamps[0], 0.09)
+
+    def test_chat_actions_do_not_use_chat_tokens(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=5, chat_burst=1)
+        sent = []
+
+        async def send(name):
+            sent.append((name, time.monotonic()))
+
+        async def run():
+            started = time.monotonic()
+            await queue.send(1, lambda: send("edit-1"))
+            await queue.send(1, lambda: send("typing"), PRIORITY_LOW, chat_limited=False)
+            # Токен чата ушёл на первую правку; статус его не тратит, а следующая правка ждёт
+            await queue.send(1, lambda: send("edit-2"))
+            await queue.close()
+            return started
+
+        started = asyncio.run(run())
+        self.assertEqual([name for name, _ in sent], ["edit-1", "typing", "edit-2"])
+        self.assertLess(sent[1][1] - started, 0.1)
+        self.assertGreaterEqual(sent[2][1] - started, 0.18)
+
+    def test_retry_after_pauses_chat_and_retries(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        attempts = []
+
+        async def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise retry_after(0.05)
+            return "ok"
+
+        async def run():
+            result = await queue.send(1, flaky)
+            await queue.close()
+            return result
+
+        self.assertEqual(asyncio.run(run()), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.04)
+        self.assertEqual(queue.stats["retry_after"], 1)
+
+    def test_retry_after_gives_up_after_max_retries(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=1)
+
+        async def always_flood():
+            raise retry_after(0)
+
+        async def run():
+            with self.assertRaises(TelegramRetryAfter):
+                await queue.send(1, always_flood)
+            await queue.close()
+
+        asyncio.run(run())
+        self.assertEqual(queue.stats["failed"], 1)
+
+    def test_errors_are_returned_to_caller(self):
+        queue = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+
+        async def broken():
+            raise ValueError("boom")
+
+        async def run():
+            with self.assertRaises(ValueError):
+                await queue.send(1, broken)
+            # Очередь продолжает работать после ошибки
+            result = await queue.send(1, lambda: asyncio.sleep(0, result="ok"))
+            await queue.close()
+            return result
+
+        self.assertEqual(asyncio.run(run()), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
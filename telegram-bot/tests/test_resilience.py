@@ -0,0 +1,185 @@
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from a2a.client.errors import A2AClientHTTPError, A2AClientTimeoutError  # noqa: E402
+from a2a.utils import new_agent_text_message  # noqa: E402
+
+from src.a2a_client import AgentClient  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.resilience import (  # noqa: E402
+    CircuitBreaker,
+    CircuitOpenError,
+    is_read_timeout,
+    is_transient,
+    was_not_sent,
+)
+
+
+def network_error(cls=httpx.ConnectError) -> A2AClientHTTPError:
+    """Ошибка сети так, как её заворачивает a2a клиент."""
+    try:
+        try:
+            raise cls("boom")
+        except httpx.TransportError as e:
+            raise A2AClientHTTPError(503, f"Network communication error: {e}") from e
+    except A2AClientHTTPError as error:
+        return error
+
+
+class FakeA2A:
+    def __init__(self, url, error=None, failures=None):
+        self.url = url
+        self.error = error
+        # Сколько первых вызовов завершаются ошибкой (None — все, пока задан error)
+        self.failures = failures
+        self.calls = 0
+
+    async def send_message(self, request):
+        self.calls += 1
+        if self.error is not None and (self.failures is None or self.calls <= self.failures):
+            raise self.error
+        return f"response from {self.url}"
+
+    async def send_message_streaming(self, request):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        message = new_agent_text_message(f"streamed from {self.url}")
+        yield SimpleNamespace(root=SimpleNamespace(result=message))
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_after_threshold_and_probes_once_in_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        # Пробный запрос уже идёт — остальные ждут его результата
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_error_classification(self):
+        self.assertTrue(was_not_sent(network_error()))
+        self.assertFalse(was_not_sent(network_error(httpx.ReadError)))
+        self.assertTrue(is_transient(network_error(httpx.ReadError)))
+        self.assertTrue(is_transient(A2AClientTimeoutError("timeout")))
+        self.assertFalse(is_transient(A2AClientHTTPError(400, "bad request")))
+        self.assertTrue(is_read_timeout(A2AClientTimeoutError("timeout")))
+        self.assertFalse(is_read_timeout(network_error(httpx.ConnectTimeout)))
+
+
+class ResilientAgentClientTests(unittest.TestCase):
+    def setUp(self):
+        for name, value in (
+            ("a2a_agent_url", "http://a1, http://a2"),
+            ("agent_retry_backoff", 0),
+            ("agent_max_retries", 2),
+            ("agent_breaker_threshold", 2),
+            ("agent_breaker_reset", 60),
+        ):
+            patcher = patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = AgentClient()
+        self.fakes = {}
+
+    def call(self, context_id="chat", idempotency_key=None):
+        async def get_client(endpoint):
+            return self.fakes.setdefault(endpoint.url, FakeA2A(endpoint.url))
+
+        async def run():
+            with patch.object(self.client, "_get_client", get_client):
+                return await self.client._call(
+                    context_id, idempotency_key, lambda client: client.send_message(None)
+                )
+
+        return asyncio.run(run())
+
+    def test_context_sticks_to_one_replica(self):
+        first = self.call("chat-1")
+        self.assertEqual({self.call("chat-1") for _ in range(5)}, {first})
+
+    def test_connect_error_fails_over_to_other_replica(self):
+        home = self.call("chat-1").split()[-1]
+        self.fakes[home].error = network_error()
+        other = self.call("chat-1")
+        self.assertNotIn(home, other)
+
+    def test_read_error_is_retried_only_with_idempotency_key(self):
+        home = self.call("chat-1").split()[-1]
+        self.fakes[home] = FakeA2A(home, error=network_error(httpx.ReadError), failures=1)
+        # Запрос дошёл до агента — повтор только на тот же экземпляр, где живёт ключ идемпотентности
+        self.assertIn(home, self.call("chat-1", idempotency_key="tg:1:1"))
+        self.assertEqual(self.fakes[home].calls, 2)
+        self.assertEqual(sum(f.calls for url, f in self.fakes.items() if url != home), 0)
+        self.fakes[home] = FakeA2A(home, error=network_error(httpx.ReadError), failures=1)
+        with self.assertRaises(A2AClientHTTPError):
+            self.call("chat-1")
+
+    def test_read_timeout_stays_on_replica_and_keeps_circuit_closed(self):
+        home = self.call("chat-1").split()[-1]
+        self.fakes[home].error = A2AClientTimeoutError("timeout")
+        for _ in range(3):
+            with self.assertRaises(A2AClientTimeoutError):
+                self.call("chat-1", idempotency_key="tg:1:1")
+        self.assertEqual(sum(f.calls for url, f in self.fakes.items() if url != home), 0)
+        endpoint = next(e for e in self.client._get_endpoints() if e.url == home)
+        self.assertEqual(endpoint.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stream_fails_over_before_first_event(self):
+        home = self.call("chat-1").split()[-1]
+        self.fakes[home].error = network_error()
+        other = ({"http://a1", "http://a2"} - {home}).pop()
+        self.fakes[other] = FakeA2A(other)
+
+        async def get_client(endpoint):
+            return self.fakes[endpoint.url]
+
+        async def run():
+            with patch.object(self.client, "_get_client", get_client):
+                return [e async for e in self.client.send_message_streaming("msg", {}, "chat-1")]
+
+        events = asyncio.run(run())
+        self.assertEqual([(e.kind, e.text) for e in events], [("final", f"streamed from {other}")])
+
+    def test_all_replicas_down_opens_circuit(self):
+        for url in ("http://a1", "http://a2"):
+            self.fakes[url] = FakeA2A(url, error=network_error())
+        with self.assertRaises(A2AClientHTTPError):
+            self.call("chat-1")
+        # Второй экземпляр размыкается во время повторов
+        with self.assertRaises(CircuitOpenError):
+            self.call("chat-1")
+        calls = sum(fake.calls for fake in self.fakes.values())
+        # Оба экземпляра разомкнуты — запрос не отправляется вовсе
+        with self.assertRaises(CircuitOpenError):
+            self.call("chat-1")
+        self.assertEqual(sum(fake.calls for fake in self.fakes.values()), calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from src.streaming import PLACEHOLDER_TEXT, StreamingReply, find_split_point  # noqa: E402
+from src import outbound as outbound_module  # noqa: E402
+from src.outbound import OutboundQueue  # noqa: E402
+
+
+class SentMessage:
+    def __init__(self, text):
+        self.text = text
+        self.edits = []
+        self.deleted = False
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+        self.text = text
+
+    async def delete(self):
+        self.deleted = True
+
+
+class Chat:
+    id = 1
+
+
+class IncomingMessage:
+    def __init__(self):
+        self.chat = Chat()
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        sent = SentMessage(text)
+        self.sent.append(sent)
+        return sent
+
+
+class StreamingReplyTests(unittest.TestCase):
+    def setUp(self):
+        # Без лимитов Telegram, чтобы тесты не ждали
+        fast = OutboundQueue(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        patcher = patch.object(outbound_module, "outbound", fast)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deltas_edit_placeholder_and_final_text_replaces_it(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=0)
+
+        async def run():
+            await reply.start()
+            await reply.append("Привет")
+            await reply.append(", мир")
+            await reply.finish("Привет, мир!")
+
+        asyncio.run(run())
+        self.assertEqual(len(incoming.sent), 1)
+        placeholder = incoming.sent[0]
+        self.assertEqual(placeholder.edits[:2], ["Привет", "Привет, мир"])
+        self.assertEqual(placeholder.text, "Привет, мир\\!")
+
+    def test_edits_are_throttled(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=60)
+
+        async def run():
+            await reply.start()
+            for word in ["a", "b", "c", "d"]:
+                await reply.append(word)
+
+        asyncio.run(run())
+        # Первая правка сразу, остальные ждут интервала
+        self.assertEqual(incoming.sent[0].edits, ["a"])
+
+    def test_long_stream_rolls_over_to_new_message(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=0, max_length=20)
+
+        async def run():
+            await reply.start()
+            for _ in range(5):
+                await reply.append("слово ещё ")
+            await reply.finish()
+
+        asyncio.run(run())
+        self.assertGreaterEqual(len(incoming.sent), 3)
+        self.assertTrue(all(len(m.text) <= 20 for m in incoming.sent if not m.deleted))
+        self.assertNotIn(PLACEHOLDER_TEXT, [m.text for m in incoming.sent])
+
+    def test_shorter_final_text_deletes_extra_messages(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=0, max_length=10)
+
+        async def run():
+            await reply.start()
+            await reply.append("черновик длиннее лимита")
+            await reply.finish("коротко")
+
+        asyncio.run(run())
+        self.assertEqual(incoming.sent[0].text, "коротко")
+        self.assertTrue(all(m.deleted for m in incoming.sent[1:]))
+
+    def test_status_line_shows_tool_and_is_removed_by_final_text(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=0)
+
+        async def run():
+            await reply.start()
+            await reply.set_status("Использую инструмент: get_pipeline_status\n")
+            shown_with_status = incoming.sent[0].text
+            await reply.append("Пайплайн зелёный")
+            shown_with_text = incoming.sent[0].text
+            await reply.finish("Пайплайн зелёный")
+            return shown_with_status, shown_with_text
+
+        with_status, with_text = asyncio.run(run())
+        self.assertEqual(with_status, f"{PLACEHOLDER_TEXT}\n\n⏳ Использую инструмент: get_pipeline_status")
+        self.assertEqual(with_text, "Пайплайн зелёный\n\n⏳ Использую инструмент: get_pipeline_status")
+        self.assertEqual(incoming.sent[0].text, "Пайплайн зелёный")
+
+    def test_heartbeat_updates_elapsed_time(self):
+        incoming = IncomingMessage()
+        reply = StreamingReply(incoming, edit_interval=0, progress_interval=0.02)
+
+        async def run():
+            await reply.start()
+            await asyncio.sleep(0.07)
+            shown = incoming.sent[0].text
+            await reply.finish("готово")
+            return shown
+
+        shown = asyncio.run(run())
+        self.assertTrue(shown.startswith(f"{PLACEHOLDER_TEXT}\n\n⏳ "))
+        self.assertTrue(shown.endswith(" с"))
+        self.assertEqual(incoming.sent[0].text, "готово")
+
+    def test_find_split_point_prefers_line_breaks(self):
+        text = "первая строка\nвторая строка"
+        self.assertEqual(find_split_point(text, 20), len("первая строка\n"))
+        self.assertEqual(find_split_point("x" * 30, 10), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
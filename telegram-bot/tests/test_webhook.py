@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+from aiohttp.test_utils import TestClient, TestServer
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from src.webhook import SECRET_HEADER, UpdateWorkerPool, create_webhook_app  # noqa: E402
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "text": f"message {update_id}",
+        },
+    }
+
+
+class FakeDispatcher:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.processed = []
+        self.active = 0
+        self.peak = 0
+
+    async def feed_update(self, bot, update):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        self.processed.append(update.update_id)
+
+
+class WebhookTests(unittest.TestCase):
+    def run_with_client(self, pool, scenario, secret=None):
+        async def run():
+            pool.start()
+            app = create_webhook_app(pool, "/webhook", secret)
+            async with TestClient(TestServer(app)) as client:
+                return await scenario(client)
+
+        return asyncio.run(run())
+
+    def test_updates_are_processed_concurrently_by_bounded_pool(self):
+        dp = FakeDispatcher(delay=0.02)
+        pool = UpdateWorkerPool(dp, bot=None, workers=3)
+
+        async def scenario(client):
+            statuses = [
+                (await client.post("/webhook", json=make_update(i))).status for i in range(6)
+            ]
+            await pool.drain(timeout=1)
+            return statuses
+
+        statuses = self.run_with_client(pool, scenario)
+        self.assertEqual(statuses, [200] * 6)
+        self.assertEqual(sorted(dp.processed), list(range(6)))
+        self.assertEqual(dp.peak, 3)
+
+    def test_full_queue_and_draining_pool_return_503(self):
+        dp = FakeDispatcher(delay=0.05)
+        pool = UpdateWorkerPool(dp, bot=None, workers=1, queue_size=1)
+
+        async def scenario(client):
+            statuses = [
+                (await client.post("/webhook", json=make_update(i))).status for i in range(4)
+            ]
+            await pool.drain(timeout=1)
+            after_drain = (await client.post("/webhook", json=make_update(99))).status
+            return statuses, after_drain
+
+        statuses, after_drain = self.run_with_client(pool, scenario)
+        self.assertIn(503, statuses)
+        self.assertEqual(after_drain, 503)
+        # Всё, что было принято, обработано до остановки
+        self.assertEqual(len(dp.processed), statuses.count(200))
+        self.assertEqual(pool.stats["rejected"], statuses.count(503))
+
+    def test_secret_token_is_checked(self):
+        dp = FakeDispatcher()
+        pool = UpdateWorkerPool(dp, bot=None, workers=1)
+
+        async def scenario(client):
+            wrong = await client.post("/webhook", json=make_update(1), headers={SECRET_HEADER: "wrong"})
+            right = await client.post("/webhook", json=make_update(2), headers={SECRET_HEADER: "s3cret"})
+            bad = await client.post("/webhook", data=b"not json", headers={SECRET_HEADER: "s3cret"})
+            await pool.drain(timeout=1)
+            return wrong.status, right.status, bad.status
+
+        self.assertEqual(self.run_with_client(pool, scenario, secret="s3cret"), (401, 200, 400))
+        self.assertEqual(dp.processed, [2])
+
+
+if __name__ == "__main__":
+    unittest.main()